@@ -10,18 +10,23 @@ _   _ _____ _____    _____ _____ __  __ _    _ _            _______ ____  _____
 """
 import abc
 import argparse
+import bisect
+import collections
 import contextlib
+import functools
 import fcntl
 import grpc
 import json
 import logging
 import os
 import re
+import signal
 import socket
 import sys
 import struct
 import subprocess
 import threading
+import time
 
 from concurrent import futures
 from logging.handlers import RotatingFileHandler
@@ -34,6 +39,8 @@ import nic_simulator_grpc_mgmt_service_pb2_grpc
 
 
 THREAD_CONCURRENCY_PER_SERVER = 2
+# max concurrent gRPC calls from the mgmt server to the NiC servers
+MGMT_FANOUT_CONCURRENCY = 16
 
 # name templates
 ACTIVE_ACTIVE_BRIDGE_TEMPLATE = r"baa-%s-%d"
@@ -73,11 +80,15 @@ def get_ip_address(ifname):
     return addr
 
 
-def run_command(cmd, check=True):
+def run_command(cmd, check=True, input=None):
     """Run a command."""
     logging.debug("COMMAND: %s", cmd)
+    if input is not None:
+        logging.debug("COMMAND STDIN:\n%s\n", input)
+        input = input.encode()
     result = subprocess.run(
         cmd,
+        input=input,
         stdout=subprocess.PIPE,
         stderr=subprocess.PIPE,
         shell=True,
@@ -101,6 +112,7 @@ class OVSCommand(object):
     OVS_OFCTL_DEL_GROUPS_CMD = "ovs-ofctl -O OpenFlow13 del-groups {bridge_name}"
     OVS_OFCTL_ADD_GROUP_CMD = "ovs-ofctl -O OpenFlow13 add-group {bridge_name} {group}"
     OVS_OFCTL_MOD_GROUP_CMD = "ovs-ofctl -O OpenFlow13 mod-group {bridge_name} {group}"
+    OVS_OFCTL_BUNDLE_CMD = "ovs-ofctl -O OpenFlow14 --bundle add-flows {bridge_name} -"
 
     @staticmethod
     def ovs_vsctl_list_br():
@@ -134,6 +146,76 @@ class OVSCommand(object):
     def ovs_ofctl_mod_groups(bridge_name, group):
         return run_command(OVSCommand.OVS_OFCTL_MOD_GROUP_CMD.format(bridge_name=bridge_name, group=group))
 
+    @staticmethod
+    def ovs_ofctl_bundle(bridge_name, mods):
+        """Apply flow and group mods, one per line, in a single atomic bundle."""
+        return run_command(OVSCommand.OVS_OFCTL_BUNDLE_CMD.format(bridge_name=bridge_name),
+                           input="\n".join(mods) + "\n")
+
+
+class LatencyHistogram(object):
+    """Latency histogram with power-of-2 millisecond buckets."""
+
+    BUCKETS_MS = [1 << _ for _ in range(15)]
+
+    def __init__(self, name):
+        self.name = name
+        self.lock = threading.Lock()
+        self.buckets = [0] * (len(self.BUCKETS_MS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, latency_ms):
+        with self.lock:
+            self.buckets[bisect.bisect_left(self.BUCKETS_MS, latency_ms)] += 1
+            self.count += 1
+            self.total += latency_ms
+            self.max = max(self.max, latency_ms)
+
+    def to_dict(self):
+        with self.lock:
+            buckets = collections.OrderedDict()
+            for upper, count in zip(self.BUCKETS_MS + ["inf"], self.buckets):
+                if count:
+                    buckets["<=%s" % upper] = count
+            return {
+                "count": self.count,
+                "avg_ms": round(self.total / self.count, 3) if self.count else 0,
+                "max_ms": round(self.max, 3),
+                "buckets_ms": buckets
+            }
+
+
+RPC_LATENCIES = collections.OrderedDict()
+RPC_LATENCIES_LOCK = threading.Lock()
+
+
+def record_latency(name):
+    """Decorator to record the latency of a gRPC handler into histogram `name`."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.monotonic()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                latency_ms = (time.monotonic() - start) * 1000
+                with RPC_LATENCIES_LOCK:
+                    histogram = RPC_LATENCIES.setdefault(name, LatencyHistogram(name))
+                histogram.record(latency_ms)
+                logging.debug("%s: latency %.3fms", name, latency_ms)
+        return wrapper
+    return decorator
+
+
+def log_rpc_latencies(*args):
+    """Log the latency histograms of all the gRPC handlers."""
+    with RPC_LATENCIES_LOCK:
+        histograms = list(RPC_LATENCIES.values())
+    logging.info("RPC latencies:\n%s", json.dumps(
+        {_.name: _.to_dict() for _ in histograms}, indent=4))
+
 
 class StrObj(abc.ABC):
     """Abstract class defines objects that could be represented as a string."""
@@ -183,7 +265,7 @@ class OVSGroup(StrObj):
 class OVSFlow(StrObj):
     """Object to represent an OVS flow."""
 
-    __slots__ = ("in_port", "output_ports", "group", "priority", "_str_prefix")
+    __slots__ = ("in_port", "packet_filter", "output_ports", "group", "priority", "drop", "_str_prefix")
 
     def __init__(self, in_port, packet_filter=None, output_ports=[], group=None, priority=None):
         self.in_port = in_port
@@ -387,9 +469,14 @@ class OVSBridge(object):
         "upstream_upper_tor_loopback3_flow",
         "upstream_lower_tor_loopback3_flow",
         "upstream_arp_flow",
-        "upstream_icmpv6_flow"
+        "upstream_icmpv6_flow",
+        "pending_flows",
+        "pending_groups"
     )
 
+    # fall back to one ovs-ofctl call per mod if the installed OVS fails bundles
+    use_bundle = True
+
     def __init__(self, bridge_name, loopback_ips):
         self.bridge_name = bridge_name
         self.loopback2_ip = loopback_ips[0]
@@ -405,6 +492,8 @@ class OVSBridge(object):
         self.upstream_ecmp_group = None
         self.flows = []
         self.groups = []
+        self.pending_flows = None
+        self.pending_groups = None
         self._init_ports()
         self._init_flows()
         self.states_getter = {
@@ -560,15 +649,55 @@ class OVSBridge(object):
         self.flows.append(flow)
         return flow
 
+    def _mod_flow(self, flow):
+        if self.pending_flows is None:
+            OVSCommand.ovs_ofctl_mod_flow(self.bridge_name, flow)
+        elif flow not in self.pending_flows:
+            self.pending_flows.append(flow)
+
+    def _mod_group(self, group):
+        if self.pending_groups is None:
+            OVSCommand.ovs_ofctl_mod_groups(self.bridge_name, group)
+        elif group not in self.pending_groups:
+            self.pending_groups.append(group)
+
+    @contextlib.contextmanager
+    def _batch_mods(self):
+        """Collect the flow/group mods and apply the final states in one bundle on exit."""
+        self.pending_flows, self.pending_groups = [], []
+        try:
+            yield
+        finally:
+            flows, groups = self.pending_flows, self.pending_groups
+            self.pending_flows, self.pending_groups = None, None
+            self._apply_mods(flows, groups)
+
+    def _apply_mods(self, flows, groups):
+        if not flows and not groups:
+            return
+        if OVSBridge.use_bundle:
+            mods = ["group modify %s" % _ for _ in groups] + ["modify %s" % _ for _ in flows]
+            try:
+                OVSCommand.ovs_ofctl_bundle(self.bridge_name, mods)
+                return
+            except subprocess.CalledProcessError as e:
+                logging.warning("Failed to apply bundle to bridge %s, fall back to single mods: %s",
+                                self.bridge_name, e.stderr.decode())
+                OVSBridge.use_bundle = False
+        for group in groups:
+            OVSCommand.ovs_ofctl_mod_groups(self.bridge_name, group)
+        for flow in flows:
+            OVSCommand.ovs_ofctl_mod_flow(self.bridge_name, flow)
+
     def set_forwarding_state(self, portids, states):
         """Set forwarding state."""
         with self.lock:
-            for portid, state in zip(portids, states):
-                logging.info("Set bridge %s port %s forwarding state: %s",
-                             self.bridge_name, portid, ForwardingState.STATE_LABELS[state])
-                self.states_setter[portid](state)
-            OVSCommand.ovs_ofctl_mod_groups(
-                self.bridge_name, self.upstream_ecmp_group)
+            with self._batch_mods():
+                for portid, state in zip(portids, states):
+                    logging.info("Set bridge %s port %s forwarding state: %s",
+                                 self.bridge_name, portid, ForwardingState.STATE_LABELS[state])
+                    self.states_setter[portid](state)
+                self._mod_group(self.upstream_ecmp_group)
             return self.query_forwarding_state(portids)
 
     def query_forwarding_state(self, portids):
@@ -583,7 +712,7 @@ class OVSBridge(object):
         """Set drop on a link."""
         logging.info("Set drop on bridge %s: portids=%s, directions=%s, recover=%s"
                      % (self.bridge_name, portids, directions, recover))
-        with self.lock:
+        with self.lock, self._batch_mods():
             result = []
             for portid, direction in zip(portids, directions):
                 downstream_flow = self.downstream_flows[portid]
@@ -594,98 +723,82 @@ class OVSBridge(object):
                     # recover downstream
                     if downstream_flow.drop:
                         downstream_flow.set_drop(recover=recover)
-                        OVSCommand.ovs_ofctl_mod_flow(
-                            self.bridge_name, downstream_flow)
+                        self._mod_flow(downstream_flow)
 
                     # recover upstream
                     # recover upstream traffic from server NiC
                     if self.upstream_nic_flow.get_drop(portid):
                         self.upstream_nic_flow.set_drop(
                             portid=portid, recover=recover)
-                        OVSCommand.ovs_ofctl_mod_flow(
-                            self.bridge_name, self.upstream_nic_flow)
+                        self._mod_flow(self.upstream_nic_flow)
                     # recover upstream loopback2 traffic from ptf
                     if self.upstream_loopback2_flow.get_drop(portid):
                         self.upstream_loopback2_flow.set_drop(
                             portid=portid, recover=recover)
-                        OVSCommand.ovs_ofctl_mod_flow(
-                            self.bridge_name, self.upstream_loopback2_flow)
+                        self._mod_flow(self.upstream_loopback2_flow)
                     # recover upstream upper ToR loopback3 traffic from ptf
                     if self.upstream_upper_tor_loopback3_flow.get_drop(portid):
                         self.upstream_upper_tor_loopback3_flow.set_drop(
                             portid=portid, recover=recover)
-                        OVSCommand.ovs_ofctl_mod_flow(
-                            self.bridge_name, self.upstream_upper_tor_loopback3_flow)
+                        self._mod_flow(self.upstream_upper_tor_loopback3_flow)
                     # recover upstream lower ToR loopback3 traffic from ptf
                     if self.upstream_lower_tor_loopback3_flow.get_drop(portid):
                         self.upstream_lower_tor_loopback3_flow.set_drop(
                             portid=portid, recover=recover)
-                        OVSCommand.ovs_ofctl_mod_flow(
-                            self.bridge_name, self.upstream_lower_tor_loopback3_flow)
+                        self._mod_flow(self.upstream_lower_tor_loopback3_flow)
                     # recover upstream arp traffic from ptf
                     if self.upstream_arp_flow.get_drop(portid):
                         self.upstream_arp_flow.set_drop(
                             portid=portid, recover=recover)
-                        OVSCommand.ovs_ofctl_mod_flow(
-                            self.bridge_name, self.upstream_arp_flow)
+                        self._mod_flow(self.upstream_arp_flow)
                     # recover upstream icmpv6 traffic from ptf
                     if self.upstream_icmpv6_flow.get_drop(portid):
                         self.upstream_icmpv6_flow.set_drop(
                             portid=portid, recover=recover)
-                        OVSCommand.ovs_ofctl_mod_flow(
-                            self.bridge_name, self.upstream_icmpv6_flow)
+                        self._mod_flow(self.upstream_icmpv6_flow)
 
                     forwarding_state = forwarding_state_getter()
                     if forwarding_state == ForwardingState.STANDBY:
                         forwarding_state_setter(ForwardingState.ACTIVE)
-                        OVSCommand.ovs_ofctl_mod_groups(
-                            self.bridge_name, self.upstream_ecmp_group)
+                        self._mod_group(self.upstream_ecmp_group)
                 else:
                     if direction == 0:
                         # downstream
                         if not downstream_flow.drop:
                             downstream_flow.set_drop()
-                            OVSCommand.ovs_ofctl_mod_flow(
-                                self.bridge_name, downstream_flow)
+                            self._mod_flow(downstream_flow)
                     elif direction == 1:
                         # upstream
                         # drop upstream traffic from server NiC
                         if not self.upstream_nic_flow.get_drop(portid):
                             self.upstream_nic_flow.set_drop(portid)
-                            OVSCommand.ovs_ofctl_mod_flow(
-                                self.bridge_name, self.upstream_nic_flow)
+                            self._mod_flow(self.upstream_nic_flow)
                         # drop upstream loopback2 traffic from ptf
                         if not self.upstream_loopback2_flow.get_drop(portid):
                             self.upstream_loopback2_flow.set_drop(portid)
-                            OVSCommand.ovs_ofctl_mod_flow(
-                                self.bridge_name, self.upstream_loopback2_flow)
+                            self._mod_flow(self.upstream_loopback2_flow)
                         # drop upstream upper ToR loopback3 traffic from ptf
                         if not self.upstream_upper_tor_loopback3_flow.get_drop(portid):
                             self.upstream_upper_tor_loopback3_flow.set_drop(portid)
-                            OVSCommand.ovs_ofctl_mod_flow(
-                                self.bridge_name, self.upstream_upper_tor_loopback3_flow)
+                            self._mod_flow(self.upstream_upper_tor_loopback3_flow)
                         # drop upstream lower ToR loopback3 traffic from ptf
                         if not self.upstream_lower_tor_loopback3_flow.get_drop(portid):
                             self.upstream_lower_tor_loopback3_flow.set_drop(portid)
-                            OVSCommand.ovs_ofctl_mod_flow(
-                                self.bridge_name, self.upstream_lower_tor_loopback3_flow)
+                            self._mod_flow(self.upstream_lower_tor_loopback3_flow)
                         # drop upstream arp traffic from ptf
                         if not self.upstream_arp_flow.get_drop(portid):
                             self.upstream_arp_flow.set_drop(portid)
-                            OVSCommand.ovs_ofctl_mod_flow(
-                                self.bridge_name, self.upstream_arp_flow)
+                            self._mod_flow(self.upstream_arp_flow)
                         # drop upstream icmpv6 traffic from ptf
                         if not self.upstream_icmpv6_flow.get_drop(portid):
                             self.upstream_icmpv6_flow.set_drop(portid)
-                            OVSCommand.ovs_ofctl_mod_flow(
-                                self.bridge_name, self.upstream_icmpv6_flow)
+                            self._mod_flow(self.upstream_icmpv6_flow)
 
                         forwarding_state = forwarding_state_getter()
                         # use set forwarding state to standby to simulator link drop
                         if forwarding_state == ForwardingState.ACTIVE:
                             forwarding_state_setter(ForwardingState.STANDBY)
-                            OVSCommand.ovs_ofctl_mod_groups(
-                                self.bridge_name, self.upstream_ecmp_group)
+                            self._mod_group(self.upstream_ecmp_group)
                     else:
                         raise ValueError("Invalid direction %s, please use 0 for downstream and 1 for upstream"
                                          % (direction))
@@ -743,6 +856,7 @@ class NiCServer(nic_simulator_grpc_service_pb2_grpc.DualToRActiveServicer):
         self.thread = None
         self.started = False
 
+    @record_latency("nic.QueryAdminForwardingPortState")
     def QueryAdminForwardingPortState(self, request, context):
         logging.debug("QueryAdminForwardingPortState: request to server %s from client %s\n",
                       self.nic_addr, context.peer())
@@ -755,6 +869,7 @@ class NiCServer(nic_simulator_grpc_service_pb2_grpc.DualToRActiveServicer):
                       context.peer(), self.nic_addr, response)
         return response
 
+    @record_latency("nic.SetAdminForwardingPortState")
     def SetAdminForwardingPortState(self, request, context):
         logging.debug("SetAdminForwardingPortState: request to server %s from client %s\n",
                       self.nic_addr, context.peer())
@@ -779,6 +894,7 @@ class NiCServer(nic_simulator_grpc_service_pb2_grpc.DualToRActiveServicer):
         # TODO: add QueryServerVersion implementation
         return nic_simulator_grpc_service_pb2.ServerVersionReply()
 
+    @record_latency("nic.SetDrop")
     def SetDrop(self, request, context):
         logging.debug("SetDrop: request to server %s from client %s\n",
                       self.nic_addr, context.peer())
@@ -832,42 +948,59 @@ class MgmtServer(nic_simulator_grpc_mgmt_service_pb2_grpc.DualTorMgmtServiceServ
         self.binding_port = binding_port
         self.nic_servers = nic_servers
         self.client_stubs = {}
+        self.client_stubs_lock = threading.Lock()
+        self.executor = futures.ThreadPoolExecutor(max_workers=MGMT_FANOUT_CONCURRENCY)
         self.server = None
 
     def _get_client_stub(self, nic_address):
-        if nic_address in self.client_stubs:
-            client_stub = self.client_stubs[nic_address]
-        else:
-            client_stub = nic_simulator_grpc_service_pb2_grpc.DualToRActiveStub(
-                grpc.insecure_channel(
-                    "%s:%s" % (nic_address, self.binding_port),
-                    options=GRPC_CLIENT_OPTIONS
+        with self.client_stubs_lock:
+            if nic_address in self.client_stubs:
+                client_stub = self.client_stubs[nic_address]
+            else:
+                client_stub = nic_simulator_grpc_service_pb2_grpc.DualToRActiveStub(
+                    grpc.insecure_channel(
+                        "%s:%s" % (nic_address, self.binding_port),
+                        options=GRPC_CLIENT_OPTIONS
+                    )
                 )
-            )
-            self.client_stubs[nic_address] = client_stub
+                self.client_stubs[nic_address] = client_stub
         return client_stub
 
+    def _fan_out(self, rpc_name, nic_addresses, requests, timeout):
+        """
+        Call `rpc_name` on the NiC servers concurrently.
+
+        Returns the replies in the order of `nic_addresses`, or raises the
+        error of the first failed NiC after all the calls are done.
+        """
+        calls = []
+        for nic_address, request in zip(nic_addresses, requests):
+            rpc = getattr(self._get_client_stub(nic_address), rpc_name)
+            calls.append((nic_address, self.executor.submit(rpc, request, timeout=timeout)))
+        replies = []
+        for nic_address, call in calls:
+            try:
+                replies.append(call.result())
+            except Exception as e:
+                raise RuntimeError("Error in %s to %s: %s" % (rpc_name, nic_address, repr(e))) from e
+        return replies
+
+    @record_latency("mgmt.QueryAdminForwardingPortState")
     def QueryAdminForwardingPortState(self, request, context):
         nic_addresses = request.nic_addresses
         logging.debug(
             "QueryAdminForwardingPortState[mgmt]: request query admin port state for %s\n", nic_addresses)
-        query_responses = []
-        for nic_address in nic_addresses:
-            client_stub = self._get_client_stub(nic_address)
-            try:
-                state = client_stub.QueryAdminForwardingPortState(
-                    nic_simulator_grpc_service_pb2.AdminRequest(
-                        portid=[0, 1],
-                        state=[True, True]
-                    ),
-                    timeout=GRPC_TIMEOUT
-                )
-                query_responses.append(state)
-            except Exception as e:
-                context.set_code(grpc.StatusCode.ABORTED)
-                context.set_details(
-                    "Error in QueryAdminForwardingPortState to %s: %s" % (nic_address, repr(e)))
-                return nic_simulator_grpc_mgmt_service_pb2.ListOfAdminReply()
+        query_request = nic_simulator_grpc_service_pb2.AdminRequest(
+            portid=[0, 1],
+            state=[True, True]
+        )
+        try:
+            query_responses = self._fan_out("QueryAdminForwardingPortState", nic_addresses,
+                                            [query_request] * len(nic_addresses), GRPC_TIMEOUT)
+        except Exception as e:
+            context.set_code(grpc.StatusCode.ABORTED)
+            context.set_details(str(e))
+            return nic_simulator_grpc_mgmt_service_pb2.ListOfAdminReply()
         response = nic_simulator_grpc_mgmt_service_pb2.ListOfAdminReply(
             nic_addresses=nic_addresses,
             admin_replies=query_responses
@@ -876,25 +1009,19 @@ class MgmtServer(nic_simulator_grpc_mgmt_service_pb2_grpc.DualTorMgmtServiceServ
             "QueryAdminForwardingPortState[mgmt]: response of query: %s", response)
         return response
 
+    @record_latency("mgmt.SetAdminForwardingPortState")
     def SetAdminForwardingPortState(self, request, context):
         nic_addresses = request.nic_addresses
         admin_requests = request.admin_requests
         logging.debug(
             "SetAdminForwardingPortState[mgmt]: request set admin port state: %s\n", request)
-        set_responses = []
-        for nic_address, admin_request in zip(nic_addresses, admin_requests):
-            client_stub = self._get_client_stub(nic_address)
-            try:
-                state = client_stub.SetAdminForwardingPortState(
-                    admin_request,
-                    timeout=GRPC_TIMEOUT
-                )
-                set_responses.append(state)
-            except Exception as e:
-                context.set_code(grpc.StatusCode.ABORTED)
-                context.set_details(
-                    "Error in SetAdminForwardingPortState to %s: %s" % (nic_address, repr(e)))
-                return nic_simulator_grpc_mgmt_service_pb2.ListOfAdminRequest()
+        try:
+            set_responses = self._fan_out("SetAdminForwardingPortState", nic_addresses,
+                                          admin_requests, GRPC_TIMEOUT)
+        except Exception as e:
+            context.set_code(grpc.StatusCode.ABORTED)
+            context.set_details(str(e))
+            return nic_simulator_grpc_mgmt_service_pb2.ListOfAdminRequest()
         response = nic_simulator_grpc_mgmt_service_pb2.ListOfAdminReply(
             nic_addresses=nic_addresses,
             admin_replies=set_responses
@@ -906,24 +1033,17 @@ class MgmtServer(nic_simulator_grpc_mgmt_service_pb2_grpc.DualTorMgmtServiceServ
     def QueryOperationPortState(self, request, context):
         return nic_simulator_grpc_mgmt_service_pb2.ListOfOperationReply()
 
+    @record_latency("mgmt.SetDrop")
     def SetDrop(self, request, context):
         nic_addresses = request.nic_addresses
         drop_requests = request.drop_requests
         logging.debug("SetDrop[mgmt]: request set drop: %s\n", request)
-        set_drop_responses = []
-        for nic_address, drop_request in zip(nic_addresses, drop_requests):
-            client_stub = self._get_client_stub(nic_address)
-            try:
-                set_drop_response = client_stub.SetDrop(
-                    drop_request,
-                    timeout=10
-                )
-                set_drop_responses.append(set_drop_response)
-            except Exception as e:
-                context.set_code(grpc.StatusCode.ABORTED)
-                context.set_details("Error in SetDrop to %s: %s" %
-                                    (nic_address, repr(e)))
-                return nic_simulator_grpc_mgmt_service_pb2.ListOfDropReply()
+        try:
+            set_drop_responses = self._fan_out("SetDrop", nic_addresses, drop_requests, 10)
+        except Exception as e:
+            context.set_code(grpc.StatusCode.ABORTED)
+            context.set_details(str(e))
+            return nic_simulator_grpc_mgmt_service_pb2.ListOfDropReply()
         response = nic_simulator_grpc_mgmt_service_pb2.ListOfDropReply(
             nic_addresses=nic_addresses,
             drop_replies=set_drop_responses
@@ -1131,11 +1251,14 @@ def main():
     if len(loopback_ips) != 3:
         raise ValueError("Invalid loopback ips: {loopback_ips}".format(loopback_ips=loopback_ips))
     nic_simulator = NiCSimulator(args.vm_set, "mgmt", args.port, loopback_ips)
+    # dump the RPC latency histograms to log with `kill -USR1 <pid>`
+    signal.signal(signal.SIGUSR1, log_rpc_latencies)
     nic_simulator.start_nic_servers()
     try:
         nic_simulator.start_mgmt_server()
     except KeyboardInterrupt:
         nic_simulator.stop_nic_servers()
+        log_rpc_latencies()
 
 
 if __name__ == "__main__":
@@ -1,14 +1,21 @@
 #!/usr/bin/env python
 
+import functools
 import math
 import os
 import yaml
 import re
 import requests
 import ipaddress
+import itertools
 import json
 import sys
 import socket
+import threading
+import time
+
+from collections import OrderedDict, namedtuple
+from multiprocessing.pool import ThreadPool
 
 from ansible.module_utils.basic import AnsibleModule
 
@@ -39,6 +46,14 @@ Options:
     - option-name: path
       description: to figure out the path of topo_{}.yml
       required: False
+
+    - option-name: concurrency
+      description: maximum number of exabgp processes routes are announced to in parallel
+      required: False
+
+    - option-name: chunk_size
+      description: maximum number of routes sent to exabgp in one HTTP request
+      required: False
 '''
 
 EXAMPLES = '''
@@ -65,6 +80,10 @@ LEAF_ASN_START = 64600
 TOR_ASN_START = 65500
 IPV4_BASE_PORT = 5000
 IPV6_BASE_PORT = 6000
+# Max number of exabgp processes routes are announced to in parallel
+ANNOUNCE_CONCURRENCY = 16
+# Max number of routes sent to exabgp in one HTTP request
+ROUTES_CHUNK_SIZE = 5000
 
 # Describe default number of COLOs
 COLO_NUMBER = 30
@@ -136,30 +155,105 @@ def read_topo(topo_name, path):
         return {}
 
 
-def change_routes(action, ptf_ip, port, routes):
-    messages = []
-    for prefix, nexthop, aspath in routes:
-        if aspath:
-            messages.append(
-                "{} route {} next-hop {} as-path [ {} ]".format(action, prefix, nexthop, aspath))
-        else:
-            messages.append(
-                "{} route {} next-hop {}".format(action, prefix, nexthop))
+# Routes to be changed through the exabgp process listening on port.
+# routes is either a list of routes or a callable generating them, so that routes are generated lazily
+# in the worker announcing them.
+RouteJob = namedtuple("RouteJob", ["vm", "port", "routes"])
+
+# HTTP sessions are kept per worker thread, so that connections are kept alive across requests
+_http_sessions = threading.local()
+
+
+def get_http_session():
+    session = getattr(_http_sessions, "session", None)
+    if session is None:
+        session = requests.Session()
+        _http_sessions.session = session
+    return session
+
+
+def change_routes(action, ptf_ip, port, routes, chunk_size=ROUTES_CHUNK_SIZE):
+    """
+    Stream routes to the exabgp HTTP API in chunks of at most chunk_size routes.
+    Returns number of changed routes.
+    """
     wait_for_http(ptf_ip, port, timeout=60)
     url = "http://%s:%d" % (ptf_ip, port)
-    data = {"commands": ";".join(messages)}
-    r = requests.post(url, data=data, timeout=90, proxies={"http": None, "https": None})
-    if r.status_code != 200:
-        raise Exception(
-            "Change routes failed: url={}, data={}, r.status_code={}, r.reason={}, r.headers={}, r.text={}".format(
-                url,
-                json.dumps(data),
-                r.status_code,
-                r.reason,
-                r.headers,
-                r.text
+    session = get_http_session()
+    count = 0
+    routes = iter(routes)
+    while True:
+        messages = []
+        for prefix, nexthop, aspath in itertools.islice(routes, chunk_size):
+            if aspath:
+                messages.append(
+                    "{} route {} next-hop {} as-path [ {} ]".format(action, prefix, nexthop, aspath))
+            else:
+                messages.append(
+                    "{} route {} next-hop {}".format(action, prefix, nexthop))
+        if not messages:
+            break
+        data = {"commands": ";".join(messages)}
+        r = session.post(url, data=data, timeout=90, proxies={"http": None, "https": None})
+        if r.status_code != 200:
+            raise Exception(
+                "Change routes failed: url={}, data={}, r.status_code={}, r.reason={}, r.headers={}, r.text={}".format(
+                    url,
+                    json.dumps(data),
+                    r.status_code,
+                    r.reason,
+                    r.headers,
+                    r.text
+                )
             )
-        )
+        count += len(messages)
+    return count
+
+
+def run_route_jobs(action, ptf_ip, jobs, concurrency=ANNOUNCE_CONCURRENCY, chunk_size=ROUTES_CHUNK_SIZE):
+    """
+    Run route jobs in parallel, at most concurrency ports at a time.
+    Jobs of the same port are run one after another in their order in jobs, so that e.g. the VIP routes
+    of a VM are announced after its v4 routes.
+    Returns per job statistics, raises exception with errors of all failed jobs.
+    """
+    def run(job):
+        start = time.time()
+        result = {"vm": job.vm, "port": job.port, "routes": 0, "error": None}
+        try:
+            routes = job.routes() if callable(job.routes) else job.routes
+            result["routes"] = change_routes(action, ptf_ip, job.port, routes, chunk_size=chunk_size)
+        except Exception as e:
+            result["error"] = repr(e)
+        elapsed = time.time() - start
+        result["seconds"] = round(elapsed, 3)
+        result["routes_per_sec"] = int(result["routes"] / elapsed) if elapsed > 0 else result["routes"]
+        return result
+
+    def run_port(indexed_jobs):
+        return [(index, run(job)) for index, job in indexed_jobs]
+
+    if not jobs:
+        return []
+    port_jobs = OrderedDict()
+    for index, job in enumerate(jobs):
+        port_jobs.setdefault(job.port, []).append((index, job))
+
+    pool = ThreadPool(max(1, min(concurrency, len(port_jobs))))
+    try:
+        port_results = pool.map(run_port, list(port_jobs.values()))
+    finally:
+        pool.close()
+        pool.join()
+
+    results = [None] * len(jobs)
+    for index, result in itertools.chain.from_iterable(port_results):
+        results[index] = result
+
+    errors = [result for result in results if result["error"]]
+    if errors:
+        raise Exception("Change routes failed for {} of {} jobs: {}".format(len(errors), len(jobs), errors))
+    return results
 
 
 # AS path from Leaf router for T0 topology
@@ -196,7 +290,7 @@ def get_uplink_router_as_path(uplink_router_type, spine_asn):
 # Generate prefixs of route
 def generate_prefix(subnet_size, ip_base, offset):
     ip = get_new_ip(ip_base, offset)
-    prefixlen = (ip_base.max_prefixlen - int(math.log(subnet_size, 2)))
+    prefixlen = ip_base.max_prefixlen - (subnet_size.bit_length() - 1)
     prefix = "{}/{}".format(ip, prefixlen)
 
     return prefix
@@ -278,130 +372,131 @@ def generate_m0_routes(nexthop, colo_number, m0_number, m0_subnet_number, m0_asn
     return []
 
 
-def generate_routes(family, podset_number, tor_number, tor_subnet_number,
-                    spine_asn, leaf_asn_start, tor_asn_start, nexthop,
-                    nexthop_v6, tor_subnet_size, max_tor_subnet_number, topo,
-                    router_type="leaf", tor_index=None, set_num=None,
-                    no_default_route=False, core_ra_asn=CORE_RA_ASN):
-    routes = []
+def get_route_podsets(podset_number, router_type, topo, set_num=None):
+    """
+    Get podsets of which routes are advertised by router of router_type, in ascending order.
+    """
+    podsets = range(0, podset_number)
+    if router_type == "core":
+        # Advertise podset 3+ to T2 DUT
+        # First 3 pods are advertised from T1 - so remove 3 from the total pods being advertised by T3
+        # For T2, we have 3 sets - 1 set advertises first 1/3 podsets,
+        # second set advertises second 1/3 podsets, and all VM's advertises the last 1/3 podsets
+        first_third_podset_number = (podset_number - 3 + 2) // 3
+        second_third_podset_number = ((podset_number - 3) * 2 + 2) // 3
+        podsets = [podset for podset in range(3, podset_number)
+                   if set_num is None or not
+                   ((podset <= first_third_podset_number and set_num != 0) or
+                    (first_third_podset_number < podset < second_third_podset_number and set_num != 1))]
+    elif router_type == "spine" or router_type == "mgmtleaf":
+        # Skip podset 0 for T2
+        podsets = range(1, podset_number)
+    elif router_type == "leaf":
+        last_podset = None
+        if topo == 't2':
+            # Send routes for podset 0-2 (first 3 pods) to the T2 DUT
+            # For T2, we have 3 sets - 1 set advertises podset 1,
+            # second set advertises podset 2, and all VM's advertises podset3
+            last_podset = 2
+        elif topo == 't0-mclag':
+            last_podset = 1
+        if last_podset is not None:
+            podsets = [podset for podset in range(0, min(podset_number, last_podset + 1))
+                       if set_num is None or podset > 1 or podset == set_num]
+    elif router_type == "tor":
+        # Skip non podset 0 for T0
+        podsets = range(0, min(podset_number, 1))
+    return podsets
+
+
+def iter_routes(family, podset_number, tor_number, tor_subnet_number,
+                spine_asn, leaf_asn_start, tor_asn_start, nexthop,
+                nexthop_v6, tor_subnet_size, max_tor_subnet_number, topo,
+                router_type="leaf", tor_index=None, set_num=None,
+                no_default_route=False, core_ra_asn=CORE_RA_ASN):
+    """
+    Generate routes as (prefix, nexthop, aspath) tuples.
+
+    Podsets, tors and subnets which are not advertised by router_type are filtered out once per block
+    instead of on every subnet, and prefixes are calculated with integer arithmetic from the subnet index.
+    v4 and v6 prefixes are generated from the same index.
+    """
+    with_v4 = family in ["v4", "both"]
+    with_v6 = family in ["v6", "both"]
+
     if not no_default_route and router_type != "tor":
         default_route_as_path = get_uplink_router_as_path(
             router_type, spine_asn)
 
         if topo != "t2" or (topo == "t2" and router_type == "core"):
-            if family in ["v4", "both"]:
-                routes.append(("0.0.0.0/0", nexthop, default_route_as_path))
-            if family in ["v6", "both"]:
-                routes.append(("::/0", nexthop_v6, default_route_as_path))
+            if with_v4:
+                yield ("0.0.0.0/0", nexthop, default_route_as_path)
+            if with_v6:
+                yield ("::/0", nexthop_v6, default_route_as_path)
 
     # NOTE: Using large enough values (e.g., podset_number = 200,
     # us to overflow the 192.168.0.0/16 private address space here.
     # This should be fine for internal use, but may pose an issue if used otherwise
-    for podset in range(0, podset_number):
-        for tor in range(0, tor_number):
-            for subnet in range(0, tor_subnet_number):
-                if router_type == "core":
-                    # Advertise podset 3+ to T2 DUT
-                    if podset < 3:
-                        continue
-
-                    # First 3 pods are advertised from T1 - so remove 3 from the total pods being advertised by T3
-                    first_third_podset_number = int(
-                        math.ceil((podset_number - 3) / 3.0))
-                    second_third_podset_number = int(
-                        math.ceil(((podset_number - 3) * 2) / 3.0))
-
-                    if set_num is not None:
-                        # For T2, we have 3 sets - 1 set advertises first 1/3 podsets,
-                        # second set advertises second 1/3 podsets, and all VM's advertises the last 1/3 podsets
-                        if podset <= first_third_podset_number and set_num != 0:
-                            continue
-                        elif podset > first_third_podset_number and \
-                                podset < second_third_podset_number and set_num != 1:
-                            continue
-                if router_type == "spine" or router_type == "mgmtleaf":
-                    # Skip podset 0 for T2
-                    if podset == 0:
-                        continue
-                elif router_type == "leaf":
-                    if topo == 't2':
-                        # Send routes for podset 0-2 (first 3 pods) to the T2 DUT
-                        if podset > 2:
-                            continue
-
-                        if set_num is not None:
-                            # For T2, we have 3 sets - 1 set advertises podset 1,
-                            # second set advertises podset 2, and all VM's advertises podset3
-                            if podset == 0 and set_num != 0:
-                                continue
-                            elif podset == 1 and set_num != 1:
-                                continue
-                    elif topo == 't0-mclag':
-                        if podset > 1:
-                            continue
-                        if set_num is not None:
-                            if podset == 0 and set_num != 0:
-                                continue
-                            elif podset == 1 and set_num != 1:
-                                continue
-                    else:
-                        # Skip tor 0 podset 0 for T1
-                        if podset == 0 and tor == 0:
-                            continue
-                elif router_type == "tor":
-                    # Skip non podset 0 for T0
-                    if podset != 0:
-                        continue
-                    # Skip subnet 0 (vlan ip) for M0
-                    elif topo == "m0" and subnet == 0:
-                        continue
-                    elif tor != tor_index:
-                        continue
-
-                suffix = ((podset * tor_number * max_tor_subnet_number * tor_subnet_size) +
-                          (tor * max_tor_subnet_number * tor_subnet_size) +
-                          (subnet * tor_subnet_size))
-                octet2 = (168 + int(suffix / (256 ** 2)))
-                octet1 = (192 + int(octet2 / 256))
-                octet2 = (octet2 % 256)
-                octet3 = (int(suffix / 256) % 256)
-                octet4 = (suffix % 256)
-                prefixlen_v4 = (32 - int(math.log(tor_subnet_size, 2)))
-
-                prefix = "{}.{}.{}.{}/{}".format(octet1,
-                                                 octet2, octet3, octet4, prefixlen_v4)
-                prefix_v6 = "20%02X:%02X%02X:0:%02X::/64" % (
-                    octet1, octet2, octet3, octet4)
-
-                leaf_asn = leaf_asn_start + podset
-                tor_asn = tor_asn_start + tor
-
-                aspath = None
-                if router_type == "core":
-                    aspath = "{} {}".format(leaf_asn, core_ra_asn)
-                elif router_type == "spine" or router_type == "mgmtleaf":
-                    aspath = "{} {}".format(leaf_asn, tor_asn)
-                elif router_type == "leaf":
-                    if topo == "t2":
-                        aspath = "{}".format(tor_asn)
-                    elif topo == "t0-mclag":
-                        aspath = "{}".format(tor_asn)
-                    else:
-                        if podset == 0:
-                            aspath = "{}".format(tor_asn)
-                        else:
-                            aspath = "{} {} {}".format(
-                                spine_asn, leaf_asn, tor_asn)
-
-                if family in ["v4", "both"]:
-                    routes.append((prefix, nexthop, aspath))
-                if family in ["v6", "both"]:
-                    routes.append((prefix_v6, nexthop_v6, aspath))
+    prefixlen_v4 = 32 - (tor_subnet_size.bit_length() - 1)
+    tor_block_size = max_tor_subnet_number * tor_subnet_size
+    podset_block_size = tor_number * tor_block_size
+
+    subnets = range(0, tor_subnet_number)
+    if router_type == "tor" and topo == "m0":
+        # Skip subnet 0 (vlan ip) for M0
+        subnets = range(1, tor_subnet_number)
+
+    for podset in get_route_podsets(podset_number, router_type, topo, set_num):
+        leaf_asn = leaf_asn_start + podset
+        tors = range(0, tor_number)
+        if router_type == "tor":
+            tors = [tor_index] if tor_index in tors else []
+        elif router_type == "leaf" and topo not in ["t2", "t0-mclag"] and podset == 0:
+            # Skip tor 0 podset 0 for T1
+            tors = range(1, tor_number)
+
+        for tor in tors:
+            tor_asn = tor_asn_start + tor
+
+            aspath = None
+            if router_type == "core":
+                aspath = "{} {}".format(leaf_asn, core_ra_asn)
+            elif router_type == "spine" or router_type == "mgmtleaf":
+                aspath = "{} {}".format(leaf_asn, tor_asn)
+            elif router_type == "leaf":
+                if topo == "t2" or topo == "t0-mclag" or podset == 0:
+                    aspath = "{}".format(tor_asn)
+                else:
+                    aspath = "{} {} {}".format(spine_asn, leaf_asn, tor_asn)
+
+            tor_base = podset * podset_block_size + tor * tor_block_size
+            for subnet in subnets:
+                suffix = tor_base + subnet * tor_subnet_size
+                octet2 = 168 + (suffix >> 16)
+                octet1 = 192 + (octet2 >> 8)
+                octet2 &= 0xff
+                octet3 = (suffix >> 8) & 0xff
+                octet4 = suffix & 0xff
+
+                if with_v4:
+                    yield ("%d.%d.%d.%d/%d" % (octet1, octet2, octet3, octet4, prefixlen_v4), nexthop, aspath)
+                if with_v6:
+                    yield ("20%02X:%02X%02X:0:%02X::/64" % (octet1, octet2, octet3, octet4), nexthop_v6, aspath)
 
-    return routes
+
+def generate_routes(family, podset_number, tor_number, tor_subnet_number,
+                    spine_asn, leaf_asn_start, tor_asn_start, nexthop,
+                    nexthop_v6, tor_subnet_size, max_tor_subnet_number, topo,
+                    router_type="leaf", tor_index=None, set_num=None,
+                    no_default_route=False, core_ra_asn=CORE_RA_ASN):
+    return list(iter_routes(family, podset_number, tor_number, tor_subnet_number,
+                            spine_asn, leaf_asn_start, tor_asn_start, nexthop,
+                            nexthop_v6, tor_subnet_size, max_tor_subnet_number, topo,
+                            router_type=router_type, tor_index=tor_index, set_num=set_num,
+                            no_default_route=no_default_route, core_ra_asn=core_ra_asn))
 
 
-def fib_t0(topo, ptf_ip, no_default_route=False, action="announce"):
+def fib_t0(topo, no_default_route=False):
     common_config = topo['configuration_properties'].get('common', {})
     podset_number = common_config.get("podset_number", PODSET_NUMBER)
     tor_number = common_config.get("tor_number", TOR_NUMBER)
@@ -416,26 +511,29 @@ def fib_t0(topo, ptf_ip, no_default_route=False, action="announce"):
     leaf_asn_start = common_config.get("leaf_asn_start", LEAF_ASN_START)
     tor_asn_start = common_config.get("tor_asn_start", TOR_ASN_START)
 
+    jobs = []
     vms = topo['topology']['VMs']
-    for vm in vms.values():
+    for vm_name, vm in vms.items():
         vm_offset = vm['vm_offset']
         port = IPV4_BASE_PORT + vm_offset
         port6 = IPV6_BASE_PORT + vm_offset
 
-        routes_v4 = generate_routes("v4", podset_number, tor_number, tor_subnet_number,
-                                    spine_asn, leaf_asn_start, tor_asn_start,
-                                    nhipv4, nhipv4, tor_subnet_size, max_tor_subnet_number, "t0",
-                                    no_default_route=no_default_route)
-        routes_v6 = generate_routes("v6", podset_number, tor_number, tor_subnet_number,
-                                    spine_asn, leaf_asn_start, tor_asn_start,
-                                    nhipv6, nhipv6, tor_subnet_size, max_tor_subnet_number, "t0",
-                                    no_default_route=no_default_route)
+        routes_v4 = functools.partial(iter_routes, "v4", podset_number, tor_number, tor_subnet_number,
+                                      spine_asn, leaf_asn_start, tor_asn_start,
+                                      nhipv4, nhipv4, tor_subnet_size, max_tor_subnet_number, "t0",
+                                      no_default_route=no_default_route)
+        routes_v6 = functools.partial(iter_routes, "v6", podset_number, tor_number, tor_subnet_number,
+                                      spine_asn, leaf_asn_start, tor_asn_start,
+                                      nhipv6, nhipv6, tor_subnet_size, max_tor_subnet_number, "t0",
+                                      no_default_route=no_default_route)
+
+        jobs.append(RouteJob(vm_name, port, routes_v4))
+        jobs.append(RouteJob(vm_name, port6, routes_v6))
 
-        change_routes(action, ptf_ip, port, routes_v4)
-        change_routes(action, ptf_ip, port6, routes_v6)
+    return jobs
 
 
-def fib_t1_lag(topo, ptf_ip, no_default_route=False, action="announce"):
+def fib_t1_lag(topo, no_default_route=False):
     common_config = topo['configuration_properties'].get('common', {})
     podset_number = common_config.get("podset_number", PODSET_NUMBER)
     tor_number = common_config.get("tor_number", TOR_NUMBER)
@@ -449,6 +547,7 @@ def fib_t1_lag(topo, ptf_ip, no_default_route=False, action="announce"):
     leaf_asn_start = common_config.get("leaf_asn_start", LEAF_ASN_START)
     tor_asn_start = common_config.get("tor_asn_start", TOR_ASN_START)
 
+    jobs = []
     vms = topo['topology']['VMs']
     vms_config = topo['configuration']
 
@@ -465,24 +564,26 @@ def fib_t1_lag(topo, ptf_ip, no_default_route=False, action="announce"):
         tornum = v.get('tornum', None)
         tor_index = tornum - 1 if tornum is not None else None
         if router_type:
-            routes_v4 = generate_routes("v4", podset_number, tor_number, tor_subnet_number,
-                                        None, leaf_asn_start, tor_asn_start,
-                                        nhipv4, nhipv6, tor_subnet_size, max_tor_subnet_number, "t1",
-                                        router_type=router_type, tor_index=tor_index,
-                                        no_default_route=no_default_route)
-            routes_v6 = generate_routes("v6", podset_number, tor_number, tor_subnet_number,
-                                        None, leaf_asn_start, tor_asn_start,
-                                        nhipv4, nhipv6, tor_subnet_size, max_tor_subnet_number, "t1",
-                                        router_type=router_type, tor_index=tor_index,
-                                        no_default_route=no_default_route)
-            change_routes(action, ptf_ip, port, routes_v4)
-            change_routes(action, ptf_ip, port6, routes_v6)
+            routes_v4 = functools.partial(iter_routes, "v4", podset_number, tor_number, tor_subnet_number,
+                                          None, leaf_asn_start, tor_asn_start,
+                                          nhipv4, nhipv6, tor_subnet_size, max_tor_subnet_number, "t1",
+                                          router_type=router_type, tor_index=tor_index,
+                                          no_default_route=no_default_route)
+            routes_v6 = functools.partial(iter_routes, "v6", podset_number, tor_number, tor_subnet_number,
+                                          None, leaf_asn_start, tor_asn_start,
+                                          nhipv4, nhipv6, tor_subnet_size, max_tor_subnet_number, "t1",
+                                          router_type=router_type, tor_index=tor_index,
+                                          no_default_route=no_default_route)
+            jobs.append(RouteJob(k, port, routes_v4))
+            jobs.append(RouteJob(k, port6, routes_v6))
 
         if 'vips' in v:
             routes_vips = []
             for prefix in v["vips"]["ipv4"]["prefixes"]:
                 routes_vips.append((prefix, nhipv4, v["vips"]["ipv4"]["asn"]))
-            change_routes(action, ptf_ip, port, routes_vips)
+            jobs.append(RouteJob(k, port, routes_vips))
+
+    return jobs
 
 
 def get_new_ip(curr_ip, skip_count):
@@ -562,7 +663,7 @@ We would have the following distribution:
 """
 
 
-def fib_m0(topo, ptf_ip, action="announce"):
+def fib_m0(topo):
     common_config = topo['configuration_properties'].get('common', {})
     colo_number = common_config.get("colo_number", COLO_NUMBER)
     m0_number = common_config.get("m0_number", M0_NUMBER)
@@ -592,6 +693,7 @@ def fib_m0(topo, ptf_ip, action="announce"):
     ip_base = get_ip_base_by_vlan_config(vlan_configs)
     ip_base_v6 = ipaddress.IPv6Address(UNICODE_TYPE("20c0:a800::0"))
 
+    jobs = []
     m1_routes_v4 = None
     m1_routes_v6 = None
     mx_index = -1
@@ -627,8 +729,10 @@ def fib_m0(topo, ptf_ip, action="announce"):
                 m1_routes_v4 = routes_v4
                 m1_routes_v6 = routes_v6
 
-        change_routes(action, ptf_ip, port, routes_v4)
-        change_routes(action, ptf_ip, port6, routes_v6)
+        jobs.append(RouteJob(k, port, routes_v4))
+        jobs.append(RouteJob(k, port6, routes_v6))
+
+    return jobs
 
 
 def generate_m0_subnet_routes(m0_subnet_number, m0_subnet_size, ip_base, nexthop, base_offset=0, m0_asn=None):
@@ -734,7 +838,7 @@ Routes announced by M0 can be broken down to 5 sets:
 """
 
 
-def fib_mx(topo, ptf_ip, action="announce"):
+def fib_mx(topo):
     common_config = topo['configuration_properties'].get('common', {})
     colo_number = common_config.get("colo_number", COLO_NUMBER)
     m0_number = common_config.get("m0_number", M0_NUMBER)
@@ -764,6 +868,7 @@ def fib_mx(topo, ptf_ip, action="announce"):
     ip_base = get_ip_base_by_vlan_config(vlan_configs)
     ip_base_v6 = ipaddress.IPv6Address(UNICODE_TYPE("20c0:a800::0"))
 
+    jobs = []
     m0_routes_v4 = None
     m0_routes_v6 = None
     for k, v in vms_config.items():
@@ -788,8 +893,10 @@ def fib_mx(topo, ptf_ip, action="announce"):
             m0_routes_v4 = routes_v4
             m0_routes_v6 = routes_v6
 
-        change_routes(action, ptf_ip, port, routes_v4)
-        change_routes(action, ptf_ip, port6, routes_v6)
+        jobs.append(RouteJob(k, port, routes_v4))
+        jobs.append(RouteJob(k, port6, routes_v6))
+
+    return jobs
 
 
 """
@@ -825,7 +932,7 @@ We would have the following distribution:
 """
 
 
-def fib_t2_lag(topo, ptf_ip, action="announce"):
+def fib_t2_lag(topo):
     vms = topo['topology']['VMs']
     # T1 VMs per linecard(asic) - key is the dut index, and value is a list of T1 VMs
     t1_vms = {}
@@ -844,11 +951,10 @@ def fib_t2_lag(topo, ptf_ip, action="announce"):
             if dut_index not in t3_vms:
                 t3_vms[dut_index] = list()
             t3_vms[dut_index].append(key)
-    generate_t2_routes(t1_vms, topo, ptf_ip, action="announce")
-    generate_t2_routes(t3_vms, topo, ptf_ip, action="announce")
+    return generate_t2_routes(t1_vms, topo) + generate_t2_routes(t3_vms, topo)
 
 
-def generate_t2_routes(dut_vm_dict, topo, ptf_ip, action="announce"):
+def generate_t2_routes(dut_vm_dict, topo):
     common_config = topo['configuration_properties'].get('common', {})
     vms = topo['topology']['VMs']
     vms_config = topo['configuration']
@@ -866,6 +972,7 @@ def generate_t2_routes(dut_vm_dict, topo, ptf_ip, action="announce"):
     tor_asn_start = common_config.get("tor_asn_start", TOR_ASN_START)
     core_ra_asn = common_config.get("core_ra_asn", CORE_RA_ASN)
 
+    jobs = []
     # generate routes for t1 vms
     for a_dut_index in dut_vm_dict:
         # sort the list of VMs
@@ -894,28 +1001,30 @@ def generate_t2_routes(dut_vm_dict, topo, ptf_ip, action="announce"):
             tor_index = None
 
             if router_type:
-                routes_v4 = generate_routes("v4", podset_number, tor_number, tor_subnet_number,
-                                            common_config['dut_asn'], leaf_asn_start, tor_asn_start,
-                                            nhipv4, nhipv6, tor_subnet_size, max_tor_subnet_number, "t2",
-                                            router_type=router_type, tor_index=tor_index, set_num=set_num,
-                                            core_ra_asn=core_ra_asn)
-                routes_v6 = generate_routes("v6", podset_number, tor_number, tor_subnet_number,
-                                            common_config['dut_asn'], leaf_asn_start, tor_asn_start,
-                                            nhipv4, nhipv6, tor_subnet_size, max_tor_subnet_number, "t2",
-                                            router_type=router_type, tor_index=tor_index, set_num=set_num,
-                                            core_ra_asn=core_ra_asn)
-                change_routes(action, ptf_ip, port, routes_v4)
-                change_routes(action, ptf_ip, port6, routes_v6)
+                routes_v4 = functools.partial(iter_routes, "v4", podset_number, tor_number, tor_subnet_number,
+                                              common_config['dut_asn'], leaf_asn_start, tor_asn_start,
+                                              nhipv4, nhipv6, tor_subnet_size, max_tor_subnet_number, "t2",
+                                              router_type=router_type, tor_index=tor_index, set_num=set_num,
+                                              core_ra_asn=core_ra_asn)
+                routes_v6 = functools.partial(iter_routes, "v6", podset_number, tor_number, tor_subnet_number,
+                                              common_config['dut_asn'], leaf_asn_start, tor_asn_start,
+                                              nhipv4, nhipv6, tor_subnet_size, max_tor_subnet_number, "t2",
+                                              router_type=router_type, tor_index=tor_index, set_num=set_num,
+                                              core_ra_asn=core_ra_asn)
+                jobs.append(RouteJob(a_vm, port, routes_v4))
+                jobs.append(RouteJob(a_vm, port6, routes_v6))
 
                 if 'vips' in vms_config[a_vm]:
                     routes_vips = []
                     for prefix in vms_config[a_vm]["vips"]["ipv4"]["prefixes"]:
                         routes_vips.append(
                             (prefix, nhipv4, vms_config[a_vm]["vips"]["ipv4"]["asn"]))
-                    change_routes(action, ptf_ip, port, routes_vips)
+                    jobs.append(RouteJob(a_vm, port, routes_vips))
 
+    return jobs
 
-def fib_t0_mclag(topo, ptf_ip, action="announce"):
+
+def fib_t0_mclag(topo):
     common_config = topo['configuration_properties'].get('common', {})
     podset_number = common_config.get("podset_number", PODSET_NUMBER)
     tor_number = common_config.get("tor_number", TOR_NUMBER)
@@ -929,6 +1038,7 @@ def fib_t0_mclag(topo, ptf_ip, action="announce"):
     spine_asn = common_config.get("spine_asn", SPINE_ASN)
     leaf_asn_start = common_config.get("leaf_asn_start", LEAF_ASN_START)
     tor_asn_start = common_config.get("tor_asn_start", TOR_ASN_START)
+    jobs = []
     vms = topo['topology']['VMs']
     all_vms = sorted(vms.keys())
 
@@ -943,20 +1053,22 @@ def fib_t0_mclag(topo, ptf_ip, action="announce"):
         port = IPV4_BASE_PORT + vm_offset
         port6 = IPV6_BASE_PORT + vm_offset
 
-        routes_v4 = generate_routes("v4", podset_number, tor_number, tor_subnet_number,
-                                    spine_asn, leaf_asn_start, tor_asn_start,
-                                    nhipv4, nhipv4, tor_subnet_size, max_tor_subnet_number,
-                                    "t0-mclag", set_num=set_num)
-        routes_v6 = generate_routes("v6", podset_number, tor_number, tor_subnet_number,
-                                    spine_asn, leaf_asn_start, tor_asn_start,
-                                    nhipv6, nhipv6, tor_subnet_size, max_tor_subnet_number,
-                                    "t0-mclag", set_num=set_num)
+        routes_v4 = functools.partial(iter_routes, "v4", podset_number, tor_number, tor_subnet_number,
+                                      spine_asn, leaf_asn_start, tor_asn_start,
+                                      nhipv4, nhipv4, tor_subnet_size, max_tor_subnet_number,
+                                      "t0-mclag", set_num=set_num)
+        routes_v6 = functools.partial(iter_routes, "v6", podset_number, tor_number, tor_subnet_number,
+                                      spine_asn, leaf_asn_start, tor_asn_start,
+                                      nhipv6, nhipv6, tor_subnet_size, max_tor_subnet_number,
+                                      "t0-mclag", set_num=set_num)
+
+        jobs.append(RouteJob(vm, port, routes_v4))
+        jobs.append(RouteJob(vm, port6, routes_v6))
 
-        change_routes(action, ptf_ip, port, routes_v4)
-        change_routes(action, ptf_ip, port6, routes_v6)
+    return jobs
 
 
-def fib_appliance(topo, ptf_ip, action="announce"):
+def fib_appliance(topo):
     common_config = topo['configuration_properties'].get('common', {})
     nhipv4 = common_config.get("nhipv4", NHIPV4)
     nhipv6 = common_config.get("nhipv6", NHIPV6)
@@ -965,6 +1077,7 @@ def fib_appliance(topo, ptf_ip, action="announce"):
     routes_v6 = []
     routes_v4.append(("0.0.0.0/0", nhipv4, None))
     routes_v6.append(("::/0", nhipv6, None))
+    jobs = []
     vms = topo['topology']['VMs']
     all_vms = sorted(vms.keys())
 
@@ -973,8 +1086,10 @@ def fib_appliance(topo, ptf_ip, action="announce"):
         port = IPV4_BASE_PORT + vm_offset
         port6 = IPV6_BASE_PORT + vm_offset
 
-        change_routes(action, ptf_ip, port, routes_v4)
-        change_routes(action, ptf_ip, port6, routes_v6)
+        jobs.append(RouteJob(vm, port, routes_v4))
+        jobs.append(RouteJob(vm, port6, routes_v6))
+
+    return jobs
 
 
 def main():
@@ -984,7 +1099,9 @@ def main():
             ptf_ip=dict(required=True, type='str'),
             action=dict(required=False, type='str',
                         default='announce', choices=["announce", "withdraw"]),
-            path=dict(required=False, type='str', default='')
+            path=dict(required=False, type='str', default=''),
+            concurrency=dict(required=False, type='int', default=ANNOUNCE_CONCURRENCY),
+            chunk_size=dict(required=False, type='int', default=ROUTES_CHUNK_SIZE)
         ),
         supports_check_mode=False)
 
@@ -992,6 +1109,8 @@ def main():
     ptf_ip = module.params['ptf_ip']
     action = module.params['action']
     path = module.params['path']
+    concurrency = module.params['concurrency']
+    chunk_size = module.params['chunk_size']
 
     topo = read_topo(topo_name, path)
     if not topo:
@@ -1003,33 +1122,27 @@ def main():
 
     try:
         if topo_type == "t0":
-            fib_t0(topo, ptf_ip, no_default_route=is_storage_backend, action=action)
-            module.exit_json(changed=True)
+            jobs = fib_t0(topo, no_default_route=is_storage_backend)
         elif topo_type == "t1":
-            fib_t1_lag(
-                topo, ptf_ip, no_default_route=is_storage_backend, action=action)
-            module.exit_json(changed=True)
+            jobs = fib_t1_lag(topo, no_default_route=is_storage_backend)
         elif topo_type == "t2":
-            fib_t2_lag(topo, ptf_ip, action=action)
-            module.exit_json(changed=True)
+            jobs = fib_t2_lag(topo)
         elif topo_type == "t0-mclag":
-            fib_t0_mclag(topo, ptf_ip, action=action)
-            module.exit_json(changed=True)
+            jobs = fib_t0_mclag(topo)
         elif topo_type == "m0":
-            fib_m0(topo, ptf_ip, action=action)
-            module.exit_json(changed=True)
+            jobs = fib_m0(topo)
         elif topo_type == "mx":
-            fib_mx(topo, ptf_ip, action=action)
-            module.exit_json(changed=True)
+            jobs = fib_mx(topo)
         elif topo_type == "appliance":
-            fib_appliance(topo, ptf_ip, action=action)
-            module.exit_json(change=True)
+            jobs = fib_appliance(topo)
         else:
             module.exit_json(
                 msg='Unsupported topology "{}" - skipping announcing routes'.format(topo_name))
+        stats = run_route_jobs(action, ptf_ip, jobs, concurrency=concurrency, chunk_size=chunk_size)
     except Exception as e:
         module.fail_json(msg='Announcing routes failed, topo_name={}, topo_type={}, exception={}'
                          .format(topo_name, topo_type, repr(e)))
+    module.exit_json(changed=True, stats=stats)
 
 
 if __name__ == '__main__':
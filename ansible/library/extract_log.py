@@ -7,6 +7,8 @@ import traceback
 import logging.handlers
 import logging
 import hashlib
+import json
+import shutil
 import sys
 import re
 import gzip
@@ -42,6 +44,13 @@ Options:
       required: True
       Default: None
 
+    - option-name: state_file
+      description: a marker state file written by 'loganalyzer.py --action init --state_file'. If it contains
+        the inode and byte offset recorded for 'start_string', the extraction seeks straight to that offset
+        and opens rotated files only when the log file was rotated since. Falls back to the full scan otherwise.
+      required: False
+      Default: None
+
 '''
 
 EXAMPLES = '''
@@ -58,6 +67,14 @@ EXAMPLES = '''
     dest: '/tmp/'
     flat: yes
 
+- name: Extract syslog entries since the loganalyzer start marker, using the recorded marker position
+  extract_log:
+    directory: '/var/log'
+    file_prefix: 'syslog'
+    start_string: 'start-LogAnalyzer-test_bgp.2023-08-09-10:00:00'
+    target_filename: '/tmp/syslog'
+    state_file: '/tmp/loganalyzer.state'
+
 - name: Extract all sairedis.rec entries since the last reboot
   extract_log:
     directory: '/var/log/swss'
@@ -267,7 +284,79 @@ def combine_logs_and_save(directory, filenames, start_string, target_string, tar
                 path, line_processed, line_copied))
 
 
-def extract_log(directory, prefixname, target_string, target_filename):
+def load_marker_position(state_file, target_string, path):
+    """Returns (inode, offset) recorded for @target_string in @path by loganalyzer,
+    None if there is no such record"""
+
+    try:
+        with open(state_file) as fp:
+            state = json.load(fp)
+        inode, offset = state[target_string]['files'][path]
+    except (IOError, OSError, ValueError, KeyError, TypeError):
+        return None
+    return inode, offset
+
+
+def open_log(path):
+    if 'gz' in path:
+        return gzip.open(path, mode='rb')
+    return open(path, 'rb')
+
+
+def extract_log_from_offset(directory, prefixname, target_string, target_filename, inode, offset):
+    """Extracts lines starting from the first line with @target_string found after @offset
+    in the file with @inode. Only the log file itself is opened unless it was rotated since
+    the offset was recorded. Returns False if the marker can't be located this way"""
+
+    filenames = [prefixname]
+    start_file_stat = os.stat(os.path.join(directory, prefixname))
+    if start_file_stat.st_ino != inode:
+        # The log was rotated after the marker position was recorded, look for the file
+        # which still has the recorded inode (rotated files are renamed, not copied)
+        filenames = list_files(directory, prefixname)
+        for idx, filename in enumerate(filenames):
+            start_file_stat = os.stat(os.path.join(directory, filename))
+            if start_file_stat.st_ino == inode:
+                filenames = filenames[:idx + 1]
+                break
+        else:
+            logger.debug("extract_log no file with inode {} found".format(inode))
+            return False
+
+    if start_file_stat.st_size < offset:
+        logger.debug("extract_log file {} is smaller than offset {}".format(filenames[-1], offset))
+        return False
+
+    marker = target_string.encode('utf-8')
+    filenames.reverse()
+    with open(target_filename, 'wb') as fp:
+        with open_log(os.path.join(directory, filenames[0])) as file:
+            file.seek(offset)
+            # readline() instead of iterating the file, py2 file objects don't allow read() after iteration
+            while True:
+                line = file.readline()
+                if not line:
+                    logger.debug("extract_log {} not found after offset {}".format(target_string, offset))
+                    return False
+                if marker in line and b'extract_log' not in line:
+                    fp.write(line)
+                    break
+            shutil.copyfileobj(file, fp)
+
+        for filename in filenames[1:]:
+            with open_log(os.path.join(directory, filename)) as file:
+                shutil.copyfileobj(file, fp)
+
+    logger.debug("extract_log from offset {} of file with inode {}, files {}".format(offset, inode, filenames))
+    return True
+
+
+def extract_log(directory, prefixname, target_string, target_filename, state_file=None):
+    if state_file:
+        position = load_marker_position(state_file, target_string, os.path.join(directory, prefixname))
+        if position and extract_log_from_offset(directory, prefixname, target_string, target_filename, *position):
+            return
+
     logger.debug("extract_log for start string {}".format(
         target_string.replace("start-", "")))
     filenames = list_files(directory, prefixname)
@@ -293,6 +382,7 @@ def main():
             file_prefix=dict(required=True, type='str'),
             start_string=dict(required=True, type='str'),
             target_filename=dict(required=True, type='str'),
+            state_file=dict(required=False, type='str', default=None),
         ),
         supports_check_mode=False)
 
@@ -304,7 +394,7 @@ def main():
 
     try:
         extract_log(p['directory'], p['file_prefix'],
-                    p['start_string'], p['target_filename'])
+                    p['start_string'], p['target_filename'], p['state_file'])
     except Exception:
         tb = traceback.format_exc()
         module.fail_json(msg=tb)
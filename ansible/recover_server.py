@@ -110,10 +110,13 @@ class TaskStartVMs(Task):
 class TaskAddTopo(Task):
     """Task add-topo."""
 
-    def __init__(self, tbname, passfile, log_save_dir, tbfile=None, vmfile=None, vmtype=None, dry_run=False):
+    def __init__(self, tbname, passfile, log_save_dir, tbfile=None, vmfile=None, vmtype=None, dry_run=False,
+                 reconcile=False):
         Task.__init__(self, tbname + '_add_topo', log_save_dir=log_save_dir, tbfile=tbfile,
                       vmfile=vmfile, vmtype=vmtype, dry_run=dry_run)
         self.args.extend(('add-topo', tbname, passfile))
+        if reconcile:
+            self.args.extend(('-e', 'vm_topology_reconcile=true'))
         self.tbname = tbname
 
 
@@ -170,8 +173,8 @@ class Job(object):
             tbname = kwargs['tbname']
             inventory = kwargs['inventory']
             self.tasks = [
-                TaskAddTopo(tbname, passfile, log_save_dir, tbfile=tbfile,
-                            vmfile=vmfile, vmtype=vmtype, dry_run=self.dry_run),
+                TaskAddTopo(tbname, passfile, log_save_dir, tbfile=tbfile, vmfile=vmfile, vmtype=vmtype,
+                            dry_run=self.dry_run, reconcile=kwargs.get('reconcile', False)),
                 TaskDeployMG(tbname, inventory, passfile, log_save_dir,
                              tbfile=tbfile, vmfile=vmfile, dry_run=self.dry_run)
             ]
@@ -194,7 +197,8 @@ class Job(object):
             raise JobRuntimeError
 
 
-def do_jobs(testbeds, passfile, tbfile=None, vmfile=None, vmtype=None, skip_cleanup=False, dry_run=False):
+def do_jobs(testbeds, passfile, tbfile=None, vmfile=None, vmtype=None, skip_cleanup=False, dry_run=False,
+            reconcile=False):
 
     def _print_summary(jobs):
         server = threading.current_thread().name
@@ -280,7 +284,8 @@ def do_jobs(testbeds, passfile, tbfile=None, vmfile=None, vmtype=None, skip_clea
                 vmfile=vmfile,
                 vmtype=vmtype,
                 log_save_dir=log_save_dir_per_server,
-                dry_run=dry_run
+                dry_run=dry_run,
+                reconcile=reconcile
             ) for tb in tbs
         ]
 
@@ -338,6 +343,9 @@ if __name__ == '__main__':
     parser.add_argument('--skip-cleanup', action='store_true',
                         help='Skip cleanup server')
     parser.add_argument('--dry-run', action='store_true', help='Dry run')
+    parser.add_argument('--reconcile', action='store_true',
+                        help='Only fix the VM front panel bridges and PTF ports not in desired state in add-topo, '
+                             'useful with --skip-cleanup')
     parser.add_argument('--log-level', choices=['debug', 'info', 'warn',
                         'error', 'critical'], default='info', help='logging output level')
     args = parser.parse_args()
@@ -349,10 +357,11 @@ if __name__ == '__main__':
     passfile = args.passfile
     skip_cleanup = args.skip_cleanup
     dry_run = args.dry_run
+    reconcile = args.reconcile
     log_level = args.log_level
 
     handler.setLevel(getattr(logging, log_level.upper()))
 
     testbeds = parse_testbed(tbfile, servers)
     do_jobs(testbeds, passfile, tbfile=tbfile, vmfile=vmfile,
-            vmtype=vmtype, skip_cleanup=skip_cleanup, dry_run=dry_run)
+            vmtype=vmtype, skip_cleanup=skip_cleanup, dry_run=dry_run, reconcile=reconcile)
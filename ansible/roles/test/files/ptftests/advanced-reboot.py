@@ -72,6 +72,8 @@ import ptf.packet as scapy
 import scapy.all as scapyall
 
 import sad_path as sp
+import pcap_stream
+from probe_sender import ProbeSender
 
 from ptf import config
 from ptf.base_tests import BaseTest
@@ -82,10 +84,13 @@ from six.moves import _thread as thread
 from six.moves import queue as Queue
 from multiprocessing.pool import ThreadPool, TimeoutError
 from fcntl import ioctl
-from collections import defaultdict
+from collections import defaultdict, namedtuple
 from device_connection import DeviceConnection
 from host_device import HostDevice
 
+# A TCP src=1234 dst=5000 packet examined by examine_flow, offset and inner_start locate the packet in the pcap file.
+FlowPacket = namedtuple('FlowPacket', ['payload_id', 'time', 'sent', 'offset', 'inner_start'])
+
 
 class StateMachine():
     def __init__(self, init_state='init'):
@@ -172,6 +177,7 @@ class ReloadTest(BaseTest):
         self.check_param('allow_vlan_flooding', False, required=False)
         self.check_param('allow_mac_jumping', False, required=False)
         self.check_param('sniff_time_incr', 300, required=False)
+        self.check_param('send_interval', 0.0035, required=False)
         self.check_param('vnet', False, required=False)
         self.check_param('vnet_pkts', None, required=False)
         self.check_param('target_version', '', required=False)
@@ -238,8 +244,10 @@ class ReloadTest(BaseTest):
         self.time_to_listen = 240.0
         #   Inter-packet interval, to be used in send_in_background method.
         #   Improve this interval to gain more precision of disruptions.
-        self.send_interval = 0.0035
+        self.send_interval = float(self.test_params['send_interval'])
         self.sent_packet_count = 0
+        # Merged pcap of the sniffer, examined by examine_flow method.
+        self.capture_pcap = None
         # Thread pool for background watching operations
         self.pool = ThreadPool(processes=3)
 
@@ -1683,6 +1691,13 @@ class ReloadTest(BaseTest):
             port = p.get_packet_source()
             scapyall.attach_filter(port.socket, filter_expression)
 
+    def get_probe_header(self, packet):
+        """
+        Get the headers of a probe packet generated by generate_from_t1 or generate_from_vlan, which are the bytes
+        before the TCP payload.
+        """
+        return packet[:pcap_stream.parse_ipv4_l4(packet)[5]]
+
     def send_in_background(self, packets_list=None):
         """
         This method sends predefined list of packets with predefined interval.
@@ -1698,39 +1713,45 @@ class ReloadTest(BaseTest):
             # This is essential to get stable results
             self.apply_filter_all_ports(
                 'not (arp and ether src {}) and not tcp'.format(self.test_params['dut_mac']))
+            # Serialize the probes before sending. Only the TCP payload, which is the sequence number of the probe,
+            # is different for each probe. It is appended to the headers of the probe as is, like replacing the
+            # payload of the dissected packet by scapy, the length and checksum fields of the headers are not updated.
+            from_servers = [(port, self.get_probe_header(packet)) for port, packet in self.from_servers]
+            from_t1 = [(port, self.get_probe_header(packet)) for port, packet in self.from_t1]
+            ifaces = dict((port, config["port_map"][(0, port)]) for port, _ in from_servers + from_t1)
+
+            def next_probe(seq):
+                payload = '0' * 60 + str(seq)
+                if (seq % 5) == 0:   # From vlan to T1.
+                    port, header = from_servers[(seq // 5) % len(from_servers)]
+                else:   # From T1 to vlan.
+                    port, header = from_t1[(seq - seq // 5 - 1) % len(from_t1)]
+                self.sent_packet_count = seq + 1
+                return port, header + payload
+
+            def stop():
+                # keep sending packets until device reboots and finalizer enters inactive state
+                return self.reboot_start and self.finalizer_state == "inactive"
+
+            sender = ProbeSender(ifaces, self.send_interval)
             sender_start = datetime.datetime.now()
             self.log("Sender started at %s" % str(sender_start))
 
             self.packets_list = []
-            from_t1_iter = itertools.cycle(self.from_t1)
-            sent_count_vlan_to_t1 = 0
-            sent_count_t1_to_vlan = 0
-
-            while True:
-                time.sleep(self.send_interval)
-                if self.reboot_start and self.finalizer_state == "inactive":
-                    # keep sending packets until device reboots and finalizer enters inactive state
-                    break
-                payload = '0' * 60 + str(self.sent_packet_count)
-                if (self.sent_packet_count % 5) == 0:   # From vlan to T1.
-                    from_port, packet = next(self.watcher_from_server_iter)
-                    packet = scapyall.Ether(packet)
-                    packet.load = payload
-                    sent_count_vlan_to_t1 += 1
-                else:   # From T1 to vlan.
-                    src_port, packet = next(from_t1_iter)
-                    packet = scapyall.Ether(packet)
-                    packet.load = payload
-                    from_port = src_port
-                    sent_count_t1_to_vlan += 1
-                testutils.send_packet(self, from_port, str(packet))
-                self.sent_packet_count = self.sent_packet_count + 1
+            try:
+                sent_count = sender.run(next_probe, stop)
+            finally:
+                sender.close()
+            sent_count_vlan_to_t1 = (sent_count + 4) // 5
+            sent_count_t1_to_vlan = sent_count - sent_count_vlan_to_t1
 
             self.log("Sent count vlan to t1: {}".format(sent_count_vlan_to_t1))
             self.log("Sent count t1 to vlan: {}".format(sent_count_t1_to_vlan))
             self.log("Sender has been running for %s" %
                      str(datetime.datetime.now() - sender_start))
             self.log("Total sent packets by sender: {}".format(self.sent_packet_count))
+            self.log("Sender requested rate: {:.1f} pps, achieved rate: {:.1f} pps, schedule restarted {} times".format(
+                sender.requested_rate, sender.achieved_rate, sender.resyncs))
 
             # Signal sniffer thread to allow early finish.
             # Without this signalling mechanism, the sniffer thread can continue for a hardcoded max time.
@@ -1746,8 +1767,7 @@ class ReloadTest(BaseTest):
     def sniff_in_background(self, wait=None):
         """
         This function listens on all ports, in both directions, for the TCP src=1234 dst=5000 packets, until timeout.
-        Once found, all packets are dumped to local pcap file,
-        and all packets are saved to self.packets as scapy type(pcap format).
+        Once found, all packets are dumped to local pcap file, which is saved to self.capture_pcap.
         """
         if not wait:
             wait = self.time_to_listen + self.test_params['sniff_time_incr']
@@ -1780,8 +1800,7 @@ class ReloadTest(BaseTest):
             self.kill_sniffer = False
             self.start_sniffer(capture_pcap, sniff_filter, wait)
             self.create_single_pcap(capture_pcap)
-            self.packets = scapyall.rdpcap(capture_pcap)
-            self.log("Number of all packets captured: {}".format(len(self.packets)))
+            self.capture_pcap = capture_pcap
         except Exception:
             traceback_msg = traceback.format_exc()
             self.log("Error in tcpdump_sniff: {}".format(traceback_msg))
@@ -1869,83 +1888,91 @@ class ReloadTest(BaseTest):
         # Remove tmp pcapng file
         subprocess.call(['rm', '-f', pcapng_full_capture])
 
-    def check_tcp_payload(self, packet):
+    def parse_flow_packet(self, data, start=0):
         """
         This method is used by examine_flow() method.
-        It returns True if a packet is not corrupted and has a valid TCP sequential TCP Payload
+        It returns the payload ID, Ether src and Ether dst of a TCP src=1234 dst=5000 packet with a valid TCP
+        sequential payload, None for other packets.
         """
+        fields = pcap_stream.parse_ipv4_l4(data, start)
+        if fields is None:
+            return None
+        eth_dst, eth_src, proto, sport, dport, payload_start, payload_end = fields
+        if proto != pcap_stream.IP_PROTO_TCP or sport != 1234 or dport != 5000:
+            return None
         try:
-            int(str(packet[scapyall.TCP].payload)
-                ) in range(self.sent_packet_count)
-            return True
-        except Exception:
-            return False
+            payload_id = int(data[payload_start:payload_end])
+        except ValueError:
+            return None
+        return payload_id, eth_src, eth_dst
 
-    def no_flood(self, packet):
+    def no_flood(self, payload_id, eth_src, eth_dst):
         """
         This method filters packets which are unique (i.e. no floods).
+        It returns None for floods, otherwise whether it is a sent packet.
         """
-        if (not int(str(packet[scapyall.TCP].payload)) in self.unique_id) and \
-                (packet[scapyall.Ether].src == self.dut_mac or packet[scapyall.Ether].src == self.vlan_mac):
+        if payload_id not in self.unique_id and eth_src in self.dut_macs:
             # This is a unique (no flooded) received packet.
             # for dualtor, t1->server rcvd pkt will have src MAC as vlan_mac,
             # and server->t1 rcvd pkt will have src MAC as dut_mac
-            self.unique_id.append(int(str(packet[scapyall.TCP].payload)))
-            return True
-        elif packet[scapyall.Ether].dst == self.dut_mac or packet[scapyall.Ether].dst == self.vlan_mac:
+            self.unique_id.add(payload_id)
+            return eth_dst in self.dut_macs
+        elif eth_dst in self.dut_macs:
             # This is a sent packet.
             # for dualtor, t1->server sent pkt will have dst MAC as dut_mac,
             # and server->t1 sent pkt will have dst MAC as vlan_mac
             return True
         else:
-            return False
+            return None
 
     def examine_flow(self, filename=None):
         """
-        This method examines pcap file (if given), or self.packets scapy file.
+        This method examines pcap file (if given), or the pcap file captured by the sniffer.
+        The pcap is streamed record by record, only the payload ID, timestamp and position in the file of the TCP
+        src=1234 dst=5000 packets are kept.
         The method compares TCP payloads of the packets one by one (assuming all payloads are consecutive integers),
         and the losses if found - are treated as disruptions in Dataplane forwarding.
         All disruptions are saved to self.lost_packets dictionary, in format:
         disrupt_start_id = (missing_packets_count, disrupt_time, disrupt_start_timestamp, disrupt_stop_timestamp)
         """
-        if filename:
-            all_packets = scapyall.rdpcap(filename)
-        elif self.packets:
-            all_packets = self.packets
-        else:
-            self.log("Filename and self.packets are not defined.")
-            self.fails['dut'].add("Filename and self.packets are not defined")
+        filename = filename or self.capture_pcap
+        if not filename:
+            self.log("Filename and self.capture_pcap are not defined.")
+            self.fails['dut'].add("Filename and self.capture_pcap are not defined")
             return None
+        capture = pcap_stream.PcapStream(filename)
+        # for dualtor both MACs are needed, see no_flood()
+        self.dut_macs = (pcap_stream.mac_to_bytes(self.dut_mac), pcap_stream.mac_to_bytes(self.vlan_mac))
         # Filter out packets and remove floods:
-        # This list will contain all unique Payload ID, to filter out received floods.
-        self.unique_id = list()
-        filtered_packets = [pkt for pkt in all_packets if
-                            scapyall.TCP in pkt and
-                            scapyall.ICMP not in pkt and
-                            pkt[scapyall.TCP].sport == 1234 and
-                            pkt[scapyall.TCP].dport == 5000 and
-                            self.check_tcp_payload(pkt) and
-                            self.no_flood(pkt)
-                            ]
-
-        if self.vnet:
-            decap_packets = [scapyall.Ether(str(pkt.payload.payload.payload)[8:]) for pkt in all_packets if
-                             scapyall.UDP in pkt and
-                             pkt[scapyall.UDP].sport == 1234
-                             ]
-            filtered_decap_packets = [pkt for pkt in decap_packets if
-                                      scapyall.TCP in pkt and
-                                      scapyall.ICMP not in pkt and
-                                      pkt[scapyall.TCP].sport == 1234 and
-                                      pkt[scapyall.TCP].dport == 5000 and
-                                      self.check_tcp_payload(pkt) and
-                                      self.no_flood(pkt)
-                                      ]
-            filtered_packets = filtered_packets + filtered_decap_packets
+        # This set will contain all unique Payload ID, to filter out received floods.
+        self.unique_id = set()
+        filtered_packets = []
+        decap_packets = []
+        for offset, timestamp, data in capture:
+            flow = self.parse_flow_packet(data)
+            if flow is not None:
+                sent = self.no_flood(*flow)
+                if sent is not None:
+                    filtered_packets.append(FlowPacket(flow[0], timestamp, sent, offset, 0))
+            elif self.vnet:
+                fields = pcap_stream.parse_ipv4_l4(data)
+                if fields and fields[2] == pcap_stream.IP_PROTO_UDP and fields[3] == 1234:
+                    # The inner Ether frame after the VXLAN header
+                    inner_start = fields[5] + pcap_stream.VXLAN_HEADER_LEN
+                    flow = self.parse_flow_packet(data, inner_start)
+                    if flow is not None:
+                        decap_packets.append((flow, timestamp, offset, inner_start))
+        self.log("Number of all packets captured: {}".format(capture.count))
+
+        # Received floods are filtered out by the packets without encapsulation first
+        for flow, timestamp, offset, inner_start in decap_packets:
+            sent = self.no_flood(*flow)
+            if sent is not None:
+                filtered_packets.append(FlowPacket(flow[0], timestamp, sent, offset, inner_start))
+        del decap_packets
 
         # Re-arrange packets, if delayed, by Payload ID and Timestamp:
-        packets = sorted(filtered_packets, key=lambda packet: (
-            int(str(packet[scapyall.TCP].payload)), packet.time))
+        packets = sorted(filtered_packets, key=lambda packet: (packet.payload_id, packet.time))
         self.lost_packets = dict()
         self.max_disrupt, self.total_disruption = 0, 0
         sent_packets = dict()
@@ -1964,22 +1991,22 @@ class ReloadTest(BaseTest):
             missed_t1_to_vlan = 0
             self.disruption_start, self.disruption_stop = None, None
             for packet in packets:
-                if packet[scapyall.Ether].dst == self.dut_mac or packet[scapyall.Ether].dst == self.vlan_mac:
+                if packet.sent:
                     # This is a sent packet - keep track of it as payload_id:timestamp.
                     # for dualtor both MACs are needed:
                     #   t1->server sent pkt will have dst MAC as dut_mac,
                     #   and server->t1 sent pkt will have dst MAC as vlan_mac
-                    sent_payload = int(str(packet[scapyall.TCP].payload))
+                    sent_payload = packet.payload_id
                     sent_packets[sent_payload] = packet.time
                     sent_counter += 1
                     continue
-                if packet[scapyall.Ether].src == self.dut_mac or packet[scapyall.Ether].src == self.vlan_mac:
+                else:
                     # This is a received packet.
                     # for dualtor both MACs are needed:
                     #   t1->server rcvd pkt will have src MAC as vlan_mac,
                     #   and server->t1 rcvd pkt will have src MAC as dut_mac
                     received_time = packet.time
-                    received_payload = int(str(packet[scapyall.TCP].payload))
+                    received_payload = packet.payload_id
                     if (received_payload % 5) == 0:   # From vlan to T1.
                         received_vlan_to_t1 += 1
                     else:
@@ -2083,7 +2110,7 @@ class ReloadTest(BaseTest):
         if packets:
             filename = ('/tmp/capture_filtered.pcap' if self.logfile_suffix is None
                         else "/tmp/capture_filtered_%s.pcap" % self.logfile_suffix)
-            scapyall.wrpcap(filename, packets)
+            capture.dump(filename, [(packet.offset, packet.inner_start) for packet in packets])
             self.log("Filtered pcap dumped to %s" % filename)
 
     def check_forwarding_stop(self, signal):
@@ -1,7 +1,7 @@
 import re
 import six
 
-from ipaddress import ip_address, ip_network
+from ipaddress import ip_address
 from lpm import LpmDict
 
 # These subnets are excluded from FIB test
@@ -46,28 +46,35 @@ class Fib():
 
     # Initialize FIB with FIB file
     def __init__(self, file_path):
+        # Routes of a full table share a small number of next hop groups. NextHop objects are interned by the next
+        # hop string of the route, so that each group is parsed and stored only once.
+        self._next_hops = {}
+        no_next_hop = self.NextHop()
+
         self._ipv4_lpm_dict = LpmDict()
         for ip in EXCLUDE_IPV4_PREFIXES:
-            self._ipv4_lpm_dict[ip] = self.NextHop()
+            self._ipv4_lpm_dict[ip] = no_next_hop
 
         self._ipv6_lpm_dict = LpmDict(ipv4=False)
         for ip in EXCLUDE_IPV6_PREFIXES:
-            self._ipv6_lpm_dict[ip] = self.NextHop()
-
-        # filter out empty lines and lines starting with '#'
-        pattern = re.compile("^#.*$|^[ \t]*$")
+            self._ipv6_lpm_dict[ip] = no_next_hop
 
         with open(file_path, 'r') as f:
-            for line in f.readlines():
-                if pattern.match(line):
+            for line in f:
+                # filter out empty lines and lines starting with '#'
+                if line.startswith('#'):
+                    continue
+                entry = line.split(None, 1)
+                if not entry:
                     continue
-                entry = line.split(' ', 1)
-                prefix = ip_network(six.text_type(entry[0]))
-                next_hop = self.NextHop(entry[1])
-                if prefix.version == 4:
-                    self._ipv4_lpm_dict[str(prefix)] = next_hop
-                elif prefix.version == 6:
-                    self._ipv6_lpm_dict[str(prefix)] = next_hop
+                next_hop_str = entry[1].strip() if len(entry) > 1 else ''
+                next_hop = self._next_hops.get(next_hop_str)
+                if next_hop is None:
+                    next_hop = self._next_hops[next_hop_str] = self.NextHop(next_hop_str)
+                if ':' in entry[0]:
+                    self._ipv6_lpm_dict[entry[0]] = next_hop
+                else:
+                    self._ipv4_lpm_dict[entry[0]] = next_hop
 
     def __getitem__(self, ip):
         ip = ip_address(six.text_type(ip))
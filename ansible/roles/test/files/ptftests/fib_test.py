@@ -38,6 +38,7 @@ from ptf.testutils import simple_tcpv6_packet
 from ptf.testutils import send_packet
 from ptf.testutils import verify_packet_any_port
 from ptf.testutils import verify_no_packet_any
+from ptf.testutils import dp_poll
 
 from collections import Iterable, defaultdict
 
@@ -79,6 +80,11 @@ class FibTest(BaseTest):
     ACTION_FWD = 'fwd'
     ACTION_DROP = 'drop'
     DEFAULT_SWITCH_TYPE = 'voq'
+    DEFAULT_BALANCING_BATCH_SIZE = 64
+    MAX_BALANCING_BATCH_SIZE = 256
+    DEFAULT_BALANCING_BATCH_INTERVAL = 0.002
+    IPV4_SRC_IP = "30.0.0.1"
+    IPV6_SRC_IP = "2000:0030::1"
 
     _required_params = [
         'fib_info_files',
@@ -115,6 +121,11 @@ class FibTest(BaseTest):
          - dst_vid                vlan tag id of dst pkts. Default: None(untag)
          - ignore_ttl:            mask the ttl field in the expected packet
          - single_fib_for_duts:   have a single fib file for all DUTs in multi-dut case. Default: False
+         - batch_balancing:       send the balancing test pkts of a range in bursts and count them from one capture,
+                                  instead of verifying them one by one. Default: False
+         - balancing_batch_size:  number of pkts in a burst of batch_balancing, at most 256. Default: 64
+         - balancing_batch_interval: interval in seconds between the pkts of a burst of batch_balancing.
+                                  Default: 0.002
         '''
         self.dataplane = ptf.dataplane_instance
         self.asic_type = self.test_params.get('asic_type')
@@ -170,6 +181,11 @@ class FibTest(BaseTest):
         self.ignore_ttl = self.test_params.get('ignore_ttl', False)
         self.single_fib = self.test_params.get(
             'single_fib_for_duts', "multiple-fib")
+        self.batch_balancing = self.test_params.get('batch_balancing', False)
+        self.balancing_batch_size = min(self.test_params.get(
+            'balancing_batch_size', self.DEFAULT_BALANCING_BATCH_SIZE), self.MAX_BALANCING_BATCH_SIZE)
+        self.balancing_batch_interval = self.test_params.get(
+            'balancing_batch_interval', self.DEFAULT_BALANCING_BATCH_INTERVAL)
 
     def check_ip_ranges(self, ipv4=True):
         for dut_index, dut_fib in enumerate(self.fibs):
@@ -180,14 +196,16 @@ class FibTest(BaseTest):
 
             if len(ip_ranges) > 150:
                 # Limit test execution time
-                covered_ip_ranges = ip_ranges[:100] + \
-                    random.sample(ip_ranges[100:], 50)
+                covered_indexes = list(range(100)) + \
+                    random.sample(range(100, len(ip_ranges)), 50)
             else:
-                covered_ip_ranges = ip_ranges[:]
+                covered_indexes = list(range(len(ip_ranges)))
+            # Only the covered ranges are created from the range table
+            covered_ip_ranges = [ip_ranges[index] for index in covered_indexes]
 
-            for ip_range in covered_ip_ranges:
-                if ip_range.get_first_ip() in dut_fib:
-                    self.check_ip_range(ip_range, dut_index, ipv4)
+            for ip_range, dst_ips in zip(covered_ip_ranges, ip_ranges.get_test_ips(covered_indexes)):
+                if dst_ips[0] in dut_fib:
+                    self.check_ip_range(ip_range, dut_index, ipv4, dst_ips)
 
             random.shuffle(covered_ip_ranges)
             self.check_balancing(covered_ip_ranges, dut_index, ipv4)
@@ -218,14 +236,10 @@ class FibTest(BaseTest):
                 break
         return src_port, exp_port_lists, next_hops
 
-    def check_ip_range(self, ip_range, dut_index, ipv4=True):
+    def check_ip_range(self, ip_range, dut_index, ipv4=True, dst_ips=None):
 
-        dst_ips = []
-        dst_ips.append(ip_range.get_first_ip())
-        if ip_range.length() > 1:
-            dst_ips.append(ip_range.get_last_ip())
-        if ip_range.length() > 2:
-            dst_ips.append(ip_range.get_random_ip())
+        if dst_ips is None:
+            dst_ips = ip_range.get_test_ips()
 
         for dst_ip in dst_ips:
             src_port, exp_port_lists, _ = self.get_src_and_exp_ports(dst_ip)
@@ -276,11 +290,16 @@ class FibTest(BaseTest):
                 # Change balancing_test_times according to number of next hop groups
                 logging.info('Checking ip range balancing {}, src_port={}, exp_ports={}, dst_ip={}, dut_index={}'
                              .format(ip_range, src_port, exp_port_lists, dst_ip, dut_index))
-                for i in range(0, self.balancing_test_times*len(list(itertools.chain(*exp_port_lists)))):
-                    (matched_port, _) = self.check_ip_route(
-                        src_port, dst_ip, exp_port_lists, ipv4)
-                    hit_count_map[matched_port] = hit_count_map.get(
-                        matched_port, 0) + 1
+                pkt_count = self.balancing_test_times*len(list(itertools.chain(*exp_port_lists)))
+                if self.batch_balancing:
+                    hit_count_map = self.count_balancing_pkts(
+                        src_port, dst_ip, exp_port_lists, pkt_count, ipv4)
+                else:
+                    for i in range(0, pkt_count):
+                        (matched_port, _) = self.check_ip_route(
+                            src_port, dst_ip, exp_port_lists, ipv4)
+                        hit_count_map[matched_port] = hit_count_map.get(
+                            matched_port, 0) + 1
                 for next_hop in next_hops:
                     # only check balance on a DUT
                     self.check_hit_count_map(
@@ -307,6 +326,164 @@ class FibTest(BaseTest):
 
         return (matched_port, received)
 
+    def check_rcvd_src_mac(self, src_port, ip_src, ip_dst, rcvd_port, actual_src_mac, dst_port_lists):
+        '''
+        @summary: Check the src mac of a pkt received on one of the expected ports is the mac of the DUT.
+        '''
+        exp_src_mac = None
+        if len(self.ptf_test_port_map[str(rcvd_port)]["target_src_mac"]) > 1:
+            # active-active dualtor, the packet could be received from either ToR, so use the received
+            # port to find the corresponding ToR
+            for dut_index, port_list in enumerate(dst_port_lists):
+                if rcvd_port in port_list:
+                    exp_src_mac = self.ptf_test_port_map[str(
+                        rcvd_port)]["target_src_mac"][dut_index]
+        else:
+            exp_src_mac = self.ptf_test_port_map[str(
+                rcvd_port)]["target_src_mac"][0]
+        if exp_src_mac != actual_src_mac:
+            raise Exception(
+                "Pkt sent from {} to {} on port {} was rcvd pkt on {} which is one of the expected ports, "
+                "but the src mac doesn't match, expected {}, got {}".
+                format(ip_src, ip_dst, src_port, rcvd_port, exp_src_mac, actual_src_mac))
+
+    def build_balancing_pkt(self, src_port, dst_ip_addr, ipv4=True):
+        '''
+        @summary: Build the pkt template of a batched balancing test, with the same fields as check_ipv4_route and
+                  check_ipv6_route. TCP ports are set for each flow.
+        '''
+        src_mac = self.dataplane.get_mac(0, src_port)
+        router_mac = self.ptf_test_port_map[str(src_port)]['target_dest_mac']
+        if ipv4:
+            return simple_tcp_packet(
+                pktlen=self.pktlen,
+                eth_dst=router_mac,
+                eth_src=src_mac,
+                ip_src=self.IPV4_SRC_IP,
+                ip_dst=dst_ip_addr,
+                ip_ttl=self.ttl,
+                ip_options=self.ip_options,
+                dl_vlan_enable=self.src_vid is not None,
+                vlan_vid=self.src_vid or 0)
+        return simple_tcpv6_packet(
+            pktlen=self.pktlen,
+            eth_dst=router_mac,
+            eth_src=src_mac,
+            ipv6_dst=dst_ip_addr,
+            ipv6_src=self.IPV6_SRC_IP,
+            ipv6_hlim=self.ttl,
+            dl_vlan_enable=self.src_vid is not None,
+            vlan_vid=self.src_vid or 0)
+
+    def build_balancing_exp_pkt(self, dst_ip_addr, sport, dport, ipv4=True):
+        '''
+        @summary: Build the masked expected pkt of a flow of a batched balancing test, with the same fields and mask
+                  as check_ipv4_route and check_ipv6_route.
+        '''
+        if ipv4:
+            exp_pkt = simple_tcp_packet(
+                self.pktlen,
+                ip_src=self.IPV4_SRC_IP,
+                ip_dst=dst_ip_addr,
+                tcp_sport=sport,
+                tcp_dport=dport,
+                ip_ttl=max(self.ttl-1, 0),
+                ip_options=self.ip_options,
+                dl_vlan_enable=self.dst_vid is not None,
+                vlan_vid=self.dst_vid or 0)
+        else:
+            exp_pkt = simple_tcpv6_packet(
+                pktlen=self.pktlen,
+                ipv6_dst=dst_ip_addr,
+                ipv6_src=self.IPV6_SRC_IP,
+                tcp_sport=sport,
+                tcp_dport=dport,
+                ipv6_hlim=max(self.ttl-1, 0),
+                dl_vlan_enable=self.dst_vid is not None,
+                vlan_vid=self.dst_vid or 0)
+        masked_exp_pkt = Mask(exp_pkt)
+        masked_exp_pkt.set_do_not_care_scapy(scapy.Ether, "dst")
+        masked_exp_pkt.set_do_not_care_scapy(scapy.Ether, "src")
+
+        # mask the chksum also if masking the ttl
+        if self.ignore_ttl:
+            if ipv4:
+                masked_exp_pkt.set_do_not_care_scapy(scapy.IP, "ttl")
+                masked_exp_pkt.set_do_not_care_scapy(scapy.IP, "chksum")
+            else:
+                masked_exp_pkt.set_do_not_care_scapy(scapy.IPv6, "hlim")
+            masked_exp_pkt.set_do_not_care_scapy(scapy.TCP, "chksum")
+        return masked_exp_pkt
+
+    def count_balancing_pkts(self, src_port, dst_ip_addr, dst_port_lists, pkt_count, ipv4=True):
+        '''
+        @summary: Send pkt_count pkts of distinct flows to dst_ip_addr in bursts, and count the pkts received on
+                  each port. Each flow is identified by its TCP sport and dport, which are not changed by the DUT.
+                  Pkts of a burst are sent balancing_batch_interval apart and attributed back to their flows from
+                  one capture of the dataplane, instead of sending and verifying the pkts one by one. Each rcvd pkt
+                  is verified against the masked expected pkt of its flow, like verify_packet_any_port does.
+        @param src_port: index of port to use for sending packet to switch
+        @param dst_ip_addr: destination IP to build packet with.
+        @param dst_port_lists: list of ports on which to expect packet to come back from the switch
+        @param pkt_count: number of pkts to send
+        @return dict of port and the number of pkts received on the port
+        '''
+        ip_layer = scapy.IP if ipv4 else scapy.IPv6
+        dst_ports = set(itertools.chain(*dst_port_lists))
+        template = self.build_balancing_pkt(src_port, dst_ip_addr, ipv4)
+        # Compare the addresses in the format of scapy
+        ip_src = template[ip_layer].src
+        ip_dst = template[ip_layer].dst
+
+        flows = set()
+        while len(flows) < pkt_count:
+            flows.add((random.randint(0, 65535), random.randint(0, 65535)))
+        flows = list(flows)
+
+        hit_count_map = {}
+        for start in range(0, pkt_count, self.balancing_batch_size):
+            pending = {}
+            for sport, dport in flows[start:start + self.balancing_batch_size]:
+                pkt = template.copy()
+                pkt[scapy.TCP].sport = sport
+                pkt[scapy.TCP].dport = dport
+                pending[(sport, dport)] = self.build_balancing_exp_pkt(dst_ip_addr, sport, dport, ipv4)
+                send_packet(self, src_port, pkt)
+                time.sleep(self.balancing_batch_interval)
+            logging.info('Sent {} pkts to {} on port {}'.format(len(pending), dst_ip_addr, src_port))
+
+            while pending:
+                result = dp_poll(self, device_number=0, timeout=ptf.ptfutils.default_timeout)
+                if not isinstance(result, self.dataplane.PollSuccess):
+                    break
+                rcvd_pkt = scapy.Ether(result.packet)
+                if ip_layer not in rcvd_pkt or scapy.TCP not in rcvd_pkt \
+                        or rcvd_pkt[ip_layer].src != ip_src or rcvd_pkt[ip_layer].dst != ip_dst:
+                    continue
+                flow = (rcvd_pkt[scapy.TCP].sport, rcvd_pkt[scapy.TCP].dport)
+                if flow not in pending:
+                    continue
+                masked_exp_pkt = pending.pop(flow)
+                if result.port not in dst_ports:
+                    raise Exception(
+                        "Pkt of flow {} sent to {} on port {} was rcvd on {}, which is not one of the expected ports {}"
+                        .format(flow, dst_ip_addr, src_port, result.port, dst_port_lists))
+                if not masked_exp_pkt.pkt_match(result.packet):
+                    raise Exception(
+                        "Pkt of flow {} sent to {} was rcvd on {}, but it doesn't match the expected pkt:\n{}\n"
+                        "rcvd pkt:\n{}".format(flow, dst_ip_addr, result.port, masked_exp_pkt,
+                                               rcvd_pkt.show2(dump=True)))
+                self.check_rcvd_src_mac(src_port, ip_src, dst_ip_addr, result.port,
+                                        rcvd_pkt.src, dst_port_lists)
+                hit_count_map[result.port] = hit_count_map.get(result.port, 0) + 1
+
+            assert not pending, "{} of {} pkts sent to {} on port {} were not received, missing flows: {}".format(
+                len(pending), len(flows[start:start + self.balancing_batch_size]), dst_ip_addr, src_port,
+                sorted(pending)[:10])
+
+        logging.info("Received {} pkts to {} at {}".format(pkt_count, dst_ip_addr, hit_count_map))
+        return hit_count_map
+
     def check_ipv4_route(self, src_port, dst_ip_addr, dst_port_lists):
         '''
         @summary: Check IPv4 route works.
@@ -316,7 +493,7 @@ class FibTest(BaseTest):
         '''
         sport = random.randint(0, 65535)
         dport = random.randint(0, 65535)
-        ip_src = "30.0.0.1"
+        ip_src = self.IPV4_SRC_IP
         ip_dst = dst_ip_addr
         src_mac = self.dataplane.get_mac(0, src_port)
 
@@ -381,23 +558,8 @@ class FibTest(BaseTest):
                 rcvd_port, len_rcvd_pkt))
             logging.info(
                 'Recieved packet with length of {}'.format(len_rcvd_pkt))
-            exp_src_mac = None
-            if len(self.ptf_test_port_map[str(rcvd_port)]["target_src_mac"]) > 1:
-                # active-active dualtor, the packet could be received from either ToR, so use the received
-                # port to find the corresponding ToR
-                for dut_index, port_list in enumerate(dst_port_lists):
-                    if rcvd_port in port_list:
-                        exp_src_mac = self.ptf_test_port_map[str(
-                            rcvd_port)]["target_src_mac"][dut_index]
-            else:
-                exp_src_mac = self.ptf_test_port_map[str(
-                    rcvd_port)]["target_src_mac"][0]
-            actual_src_mac = scapy.Ether(rcvd_pkt).src
-            if exp_src_mac != actual_src_mac:
-                raise Exception(
-                    "Pkt sent from {} to {} on port {} was rcvd pkt on {} which is one of the expected ports, "
-                    "but the src mac doesn't match, expected {}, got {}".
-                    format(ip_src, ip_dst, src_port, rcvd_port, exp_src_mac, actual_src_mac))
+            self.check_rcvd_src_mac(src_port, ip_src, ip_dst, rcvd_port,
+                                    scapy.Ether(rcvd_pkt).src, dst_port_lists)
             return (rcvd_port, rcvd_pkt)
         elif self.pkt_action == self.ACTION_DROP:
             verify_no_packet_any(self, masked_exp_pkt, dst_ports)
@@ -414,7 +576,7 @@ class FibTest(BaseTest):
         '''
         sport = random.randint(0, 65535)
         dport = random.randint(0, 65535)
-        ip_src = '2000:0030::1'
+        ip_src = self.IPV6_SRC_IP
         ip_dst = dst_ip_addr
         src_mac = self.dataplane.get_mac(0, src_port)
 
@@ -476,23 +638,8 @@ class FibTest(BaseTest):
                 rcvd_port, len_rcvd_pkt))
             logging.info(
                 'Recieved packet with length of {}'.format(len_rcvd_pkt))
-            exp_src_mac = None
-            if len(self.ptf_test_port_map[str(rcvd_port)]["target_src_mac"]) > 1:
-                # active-active dualtor, the packet could be received from either ToR, so use the received
-                # port to find the corresponding ToR
-                for dut_index, port_list in enumerate(dst_port_lists):
-                    if rcvd_port in port_list:
-                        exp_src_mac = self.ptf_test_port_map[str(
-                            rcvd_port)]["target_src_mac"][dut_index]
-            else:
-                exp_src_mac = self.ptf_test_port_map[str(
-                    rcvd_port)]["target_src_mac"][0]
-            actual_src_mac = scapy.Ether(rcvd_pkt).src
-            if exp_src_mac != actual_src_mac:
-                raise Exception(
-                    "Pkt sent from {} to {} on port {} was rcvd pkt on {} which is one of the expected ports, "
-                    "but the src mac doesn't match, expected {}, got {}".
-                    format(ip_src, ip_dst, src_port, rcvd_port, exp_src_mac, actual_src_mac))
+            self.check_rcvd_src_mac(src_port, ip_src, ip_dst, rcvd_port,
+                                    scapy.Ether(rcvd_pkt).src, dst_port_lists)
             return (rcvd_port, rcvd_pkt)
         elif self.pkt_action == self.ACTION_DROP:
             verify_no_packet_any(self, masked_exp_pkt, dst_ports)
@@ -1,7 +1,8 @@
 import random
 import six
 
-from ipaddress import ip_address, ip_network
+from array import array
+from ipaddress import ip_network, IPv4Address, IPv6Address
 from SubnetTree import SubnetTree
 
 '''
@@ -14,10 +15,12 @@ segments from start to end according to the prefixes (networks) it reads.
 
 Initially, the whole IP space contains only one range. After inserting
 prefixes, the IP space is segmented into multiple ranges. The ranges()
-function returns all ranges in the LpmDict with a list of IpIntervals. The
-sub-class IpInterval then could be used to get the first/last/random IP within
-this range. It could also check the length of the range and if an IP is within
-this range.
+function returns all ranges in the LpmDict with an IpRanges, a read-only
+sequence of IpIntervals. The boundaries of the ranges are kept as integer
+arrays, an IpInterval is only created when a range is accessed, so that a full
+route table does not need one object per range. The sub-class IpInterval then
+could be used to get the first/last/random IP within this range. It could also
+check the length of the range and if an IP is within this range.
 
 To achieve the LPM functionality, use the LpmDict as a dictionary and use
 [] operator to get the corresponding value using the key (IP).
@@ -25,6 +28,74 @@ To achieve the LPM functionality, use the LpmDict as a dictionary and use
 Please check the test_lpm.py file to see the details of how this class works.
 '''
 
+# Typecode of unsigned 64 bits integer array, 'Q' is not supported by python2 array
+try:
+    array('Q')
+    U64_TYPECODE = 'Q'
+except ValueError:
+    U64_TYPECODE = 'L'
+
+U64_MASK = (1 << 64) - 1
+
+
+class IpRanges(object):
+    '''
+    Ranges which segment the whole IP space, sorted by the start IP.
+
+    The start IPs are stored in arrays of unsigned 64 bits integers, IPv6
+    addresses are split to high and low words. The end IP of a range is the
+    start IP of next range minus one.
+    '''
+    def __init__(self, starts, ipv4=True):
+        self._ipv4 = ipv4
+        self._address = IPv4Address if ipv4 else IPv6Address
+        self._max_ip = (1 << (32 if ipv4 else 128)) - 1
+        self._lo = array(U64_TYPECODE, [start & U64_MASK for start in starts])
+        self._hi = None if ipv4 else array(U64_TYPECODE, [start >> 64 for start in starts])
+
+    def __len__(self):
+        return len(self._lo)
+
+    def _start(self, index):
+        if self._hi is None:
+            return self._lo[index]
+        return (self._hi[index] << 64) | self._lo[index]
+
+    def _end(self, index):
+        if index == len(self._lo) - 1:
+            return self._max_ip
+        return self._start(index + 1) - 1
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('range index out of range')
+        return LpmDict.IpInterval(self._address(self._start(index)), self._address(self._end(index)))
+
+    def get_test_ips(self, indexes):
+        '''
+        Get the IPs to test for the ranges of the indexes in bulk, without
+        creating the IpIntervals.
+
+        Returns a list of IP lists. Each IP list has the first IP of the range,
+        the last IP if the range length is larger than 1, and a random IP if
+        the range length is larger than 2. Same as IpInterval.get_test_ips().
+        '''
+        test_ips = []
+        for index in indexes:
+            start = self._start(index)
+            end = self._end(index)
+            ips = [start]
+            if end - start > 1:
+                ips.append(end)
+            if end - start > 2:
+                ips.append(start + random.randint(0, end - start))
+            test_ips.append([str(self._address(ip)) for ip in ips])
+        return test_ips
+
 
 class LpmDict():
     class IpInterval:
@@ -50,65 +121,61 @@ class LpmDict():
             diff = self.length()
             return str(self._start + random.randint(0, diff))
 
+        def get_test_ips(self):
+            ips = [self.get_first_ip()]
+            if self.length() > 1:
+                ips.append(self.get_last_ip())
+            if self.length() > 2:
+                ips.append(self.get_random_ip())
+            return ips
+
         def __str__(self):
             return str(self._start) + ' - ' + str(self._end)
 
     def __init__(self, ipv4=True):
         self._ipv4 = ipv4
+        self._max_ip = (1 << (32 if ipv4 else 128)) - 1
         self._prefix_set = set()
         self._subnet_tree = SubnetTree()
+        # Boundaries are integers of the IPs, with the count of prefixes starting or ending at it.
         # 0.0.0.0 is a non-routable meta-address that needs to be skipped
-        self._boundaries = {ip_address(u'0.0.0.0'): 1} if ipv4 else {
-            ip_address(u'::'): 1}
+        self._boundaries = {0: 1}
+
+    def _prefix_boundaries(self, prefix):
+        # The first IP of the prefix, and the first IP after the prefix if it is not the end of the IP space
+        start = int(prefix.network_address)
+        next_start = start + (1 << (prefix.max_prefixlen - prefix.prefixlen))
+        return start, next_start if next_start <= self._max_ip else None
 
     def __setitem__(self, key, value):
         prefix = ip_network(six.text_type(key))
-        # add the current key to self._prefix_set only when it is not the default route and it is not a duplicate key
-        if prefix.prefixlen and key not in self._prefix_set:
-            boundary = prefix[0]
-            self._boundaries[boundary] = self._boundaries.get(boundary, 0) + 1
-            if prefix[-1] != ip_address(u'255.255.255.255') \
-                    and prefix[-1] != ip_address(u'ffff:ffff:ffff:ffff:ffff:ffff:ffff:ffff'):
-                next_boundary = prefix[-1] + 1
-                self._boundaries[next_boundary] = self._boundaries.get(
-                    next_boundary, 0) + 1
-            self._prefix_set.add(key)
-        self._subnet_tree.__setitem__(key, value)
+        # add the current prefix to self._prefix_set only when it is not the default route and it is not a duplicate
+        start, next_start = self._prefix_boundaries(prefix)
+        if prefix.prefixlen and (start, prefix.prefixlen) not in self._prefix_set:
+            for boundary in (start, next_start):
+                if boundary is not None:
+                    self._boundaries[boundary] = self._boundaries.get(boundary, 0) + 1
+            self._prefix_set.add((start, prefix.prefixlen))
+        self._subnet_tree.__setitem__(str(prefix), value)
 
     def __getitem__(self, key):
         return self._subnet_tree[key]
 
     def __delitem__(self, key):
-        if '/0' not in key:
-            prefix = ip_network(six.text_type(key))
-            boundary = prefix[0]
-            next_boundary = prefix[-1] + 1
-            self._boundaries[boundary] = self._boundaries.get(boundary) - 1
-            if not self._boundaries[boundary]:
-                del self._boundaries[boundary]
-            self._boundaries[next_boundary] = self._boundaries.get(
-                next_boundary) - 1
-            if not self._boundaries[next_boundary]:
-                del self._boundaries[next_boundary]
-            self._prefix_set.remove(key)
-        self._subnet_tree.__delitem__(key)
+        prefix = ip_network(six.text_type(key))
+        if prefix.prefixlen:
+            start, next_start = self._prefix_boundaries(prefix)
+            for boundary in (start, next_start):
+                if boundary is None:
+                    continue
+                self._boundaries[boundary] -= 1
+                if not self._boundaries[boundary]:
+                    del self._boundaries[boundary]
+            self._prefix_set.remove((start, prefix.prefixlen))
+        self._subnet_tree.__delitem__(str(prefix))
 
     def ranges(self):
-        sorted_boundaries = sorted(self._boundaries.keys())
-        ranges = []
-        for index, boundary in enumerate(sorted_boundaries):
-            if index != len(sorted_boundaries) - 1:
-                interval = self.IpInterval(
-                    sorted_boundaries[index], sorted_boundaries[index + 1] - 1)
-            else:
-                if self._ipv4:
-                    interval = self.IpInterval(
-                        sorted_boundaries[index], ip_address(u'255.255.255.255'))
-                else:
-                    interval = self.IpInterval(sorted_boundaries[index], ip_address(
-                        u'ffff:ffff:ffff:ffff:ffff:ffff:ffff:ffff'))
-            ranges.append(interval)
-        return ranges
+        return IpRanges(sorted(self._boundaries), self._ipv4)
 
     def contains(self, key):
         return key in self._subnet_tree
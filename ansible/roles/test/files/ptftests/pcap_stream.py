@@ -0,0 +1,134 @@
+"""
+Stream a pcap file record by record, without loading the whole capture into memory.
+
+The records are not dissected into scapy packets. Only the fixed offsets of the Ethernet, IPv4 and TCP/UDP headers
+which are needed are decoded, so that a long capture of the reboot tests can be examined in constant memory.
+"""
+import struct
+
+PCAP_GLOBAL_HEADER_LEN = 24
+PCAP_RECORD_HEADER_LEN = 16
+# Magic number of pcap file: (byte order, timestamp fractions per second)
+PCAP_MAGICS = {
+    b'\xd4\xc3\xb2\xa1': ('<', 1000000.0),
+    b'\xa1\xb2\xc3\xd4': ('>', 1000000.0),
+    b'\x4d\x3c\xb2\xa1': ('<', 1000000000.0),
+    b'\xa1\xb2\x3c\x4d': ('>', 1000000000.0),
+}
+
+ETH_TYPE_IPV4 = 0x0800
+ETH_TYPES_VLAN = (0x8100, 0x88a8, 0x9100)
+IP_PROTO_TCP = 6
+IP_PROTO_UDP = 17
+VXLAN_HEADER_LEN = 8
+
+_ETH_TYPE = struct.Struct('!H')
+# version/ihl, tos/total length/id/flags/fragment/ttl (skipped), protocol
+_IPV4_HEADER = struct.Struct('!B8xB')
+# source port, destination port, sequence/ack (skipped), data offset
+_TCP_HEADER = struct.Struct('!HH8xB')
+_UDP_HEADER = struct.Struct('!HH')
+
+
+def mac_to_bytes(mac):
+    """Convert a MAC address like '4c:76:25:f5:48:80' to the 6 bytes in the Ethernet header."""
+    return struct.pack('6B', *[int(octet, 16) for octet in mac.split(':')])
+
+
+def parse_ipv4_l4(data, start=0):
+    """
+    Decode the headers of an Ethernet frame which carries IPv4 TCP or UDP.
+
+    Args:
+        data: Bytes of the captured frame.
+        start: Offset of the Ethernet header in data.
+
+    Returns:
+        None if the frame is not an IPv4 TCP/UDP frame or it is truncated. Otherwise a tuple of
+        (eth_dst, eth_src, ip_proto, sport, dport, payload_start, payload_end). The payload is data[payload_start:
+        payload_end], which is the rest of the frame. Like the scapy Raw payload with its Padding, the bytes after the
+        IPv4 total length are included: the sender of the reboot tests replaces the payload of the dissected probe
+        packets, the IPv4 total length is still the one of the original payload.
+    """
+    try:
+        offset = start + 12
+        eth_type = _ETH_TYPE.unpack_from(data, offset)[0]
+        while eth_type in ETH_TYPES_VLAN:
+            offset += 4
+            eth_type = _ETH_TYPE.unpack_from(data, offset)[0]
+        if eth_type != ETH_TYPE_IPV4:
+            return None
+        offset += 2
+
+        ver_ihl, proto = _IPV4_HEADER.unpack_from(data, offset)
+        if ver_ihl >> 4 != 4:
+            return None
+        l4_offset = offset + (ver_ihl & 0x0f) * 4
+        if proto == IP_PROTO_TCP:
+            sport, dport, data_offset = _TCP_HEADER.unpack_from(data, l4_offset)
+            payload_start = l4_offset + (data_offset >> 4) * 4
+        elif proto == IP_PROTO_UDP:
+            sport, dport = _UDP_HEADER.unpack_from(data, l4_offset)
+            payload_start = l4_offset + 8
+        else:
+            return None
+    except struct.error:
+        return None
+    return data[start:start + 6], data[start + 6:start + 12], proto, sport, dport, payload_start, len(data)
+
+
+class PcapStream(object):
+    """
+    Reader of a pcap file. Iterating the reader yields (offset, timestamp, data) of each record, where offset is the
+    position of the record in the file, which can be used to copy the record to another pcap file by dump().
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.count = 0
+        with open(path, 'rb') as f:
+            self._global_header = f.read(PCAP_GLOBAL_HEADER_LEN)
+        fmt = PCAP_MAGICS.get(self._global_header[:4])
+        if len(self._global_header) < PCAP_GLOBAL_HEADER_LEN or fmt is None:
+            raise ValueError("{} is not a pcap file".format(path))
+        byte_order, self._ts_per_sec = fmt
+        self._record_header = struct.Struct(byte_order + 'IIII')
+
+    def __iter__(self):
+        unpack = self._record_header.unpack
+        self.count = 0
+        with open(self.path, 'rb') as f:
+            read = f.read
+            f.seek(PCAP_GLOBAL_HEADER_LEN)
+            offset = PCAP_GLOBAL_HEADER_LEN
+            while True:
+                header = read(PCAP_RECORD_HEADER_LEN)
+                if len(header) < PCAP_RECORD_HEADER_LEN:
+                    return
+                ts_sec, ts_frac, caplen, _ = unpack(header)
+                data = read(caplen)
+                if len(data) < caplen:
+                    # The last record may be truncated when the sniffer is killed
+                    return
+                self.count += 1
+                yield offset, ts_sec + ts_frac / self._ts_per_sec, data
+                offset += PCAP_RECORD_HEADER_LEN + caplen
+
+    def dump(self, path, records):
+        """
+        Copy records of this file to a new pcap file.
+
+        Args:
+            path: Path of the new pcap file.
+            records: Iterable of (offset, start). offset is the position of the record yielded by iterating this
+                reader. start is the offset of the frame to write in the record data, for writing an encapsulated
+                frame, 0 to write the whole record.
+        """
+        with open(self.path, 'rb') as f, open(path, 'wb') as out:
+            out.write(self._global_header)
+            for offset, start in records:
+                f.seek(offset)
+                ts_sec, ts_frac, caplen, wirelen = self._record_header.unpack(f.read(PCAP_RECORD_HEADER_LEN))
+                data = f.read(caplen)[start:]
+                out.write(self._record_header.pack(ts_sec, ts_frac, len(data), wirelen - start))
+                out.write(data)
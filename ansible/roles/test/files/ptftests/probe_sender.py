@@ -0,0 +1,104 @@
+"""
+Send probe packets at a fixed rate over raw AF_PACKET sockets.
+
+The probes are serialized to bytes before sending starts, the send loop only concatenates a prebuilt header with the
+payload and writes it to the socket of the port. The send times follow a schedule on the monotonic clock: when the
+sender wakes up late, all the probes which are due are sent in one batch, so that the achieved rate does not drift
+below the requested rate because of the sleep overshoot.
+
+The sender does not depend on PTF, it can be run on any interfaces, like a veth pair:
+
+    sender = ProbeSender({0: 'veth0'}, interval=0.001)
+    sender.run(lambda seq: (0, frame), lambda: sender.sent >= 1000)
+"""
+import errno
+import socket
+import time
+
+# time.monotonic is not available in python2
+_monotonic = getattr(time, 'monotonic', time.time)
+
+# Max number of due probes sent in a batch. If the sender is late for more probes, the schedule is restarted from
+# now instead of bursting, the restart is counted in ProbeSender.resyncs.
+DEFAULT_MAX_BATCH = 64
+
+
+class ProbeSender(object):
+
+    def __init__(self, ifaces, interval, max_batch=DEFAULT_MAX_BATCH):
+        """
+        Args:
+            ifaces: Dict of port index to interface name, the probes are sent to the interfaces by port index.
+            interval: Interval in seconds between two probes.
+            max_batch: Max number of due probes sent in a batch.
+        """
+        self.interval = interval
+        self.max_batch = max_batch
+        self.sent = 0
+        self.elapsed = 0.0
+        self.resyncs = 0
+        self._sockets = {}
+        try:
+            for port, iface in ifaces.items():
+                sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW)
+                sock.bind((iface, 0))
+                self._sockets[port] = sock
+        except Exception:
+            self.close()
+            raise
+
+    @property
+    def requested_rate(self):
+        return 1.0 / self.interval
+
+    @property
+    def achieved_rate(self):
+        return self.sent / self.elapsed if self.elapsed else 0.0
+
+    def _send(self, port, frame):
+        sock = self._sockets[port]
+        while True:
+            try:
+                sock.send(frame)
+                return
+            except socket.error as e:
+                # The socket buffer is full, wait for the interface to drain it
+                if e.errno != errno.ENOBUFS:
+                    raise
+                time.sleep(0.0001)
+
+    def run(self, next_probe, stop):
+        """
+        Send probes until stop() returns True.
+
+        Args:
+            next_probe: Function which takes the sequence number of the probe, and returns (port, frame bytes).
+            stop: Function which returns True when the sender should stop, checked before each batch.
+
+        Returns:
+            int: Number of probes sent.
+        """
+        run_start = start = _monotonic()
+        seq = 0
+        while not stop():
+            now = _monotonic()
+            due = int((now - start) / self.interval) + 1
+            if due - seq > self.max_batch:
+                # Too late to catch up, e.g. the process was not scheduled for a while. Restart the schedule from now.
+                self.resyncs += 1
+                start = now - seq * self.interval
+                due = seq + 1
+            while seq < due:
+                self._send(*next_probe(seq))
+                seq += 1
+                self.sent = seq
+            delay = start + seq * self.interval - _monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        self.elapsed = _monotonic() - run_start
+        return seq
+
+    def close(self):
+        for sock in self._sockets.values():
+            sock.close()
+        self._sockets = {}
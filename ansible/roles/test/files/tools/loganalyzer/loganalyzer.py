@@ -29,12 +29,24 @@ import re
 import os
 import os.path
 import csv
+import json
+import mmap
 import time
 import logging
 import logging.handlers
 import subprocess
 from datetime import datetime
 
+try:
+    import resource
+except ImportError:
+    resource = None
+
+try:
+    import re._parser as sre_parse
+except ImportError:
+    import sre_parse
+
 # ---------------------------------------------------------------------
 # Global variables
 # ---------------------------------------------------------------------
@@ -52,12 +64,113 @@ err_invalid_string_format = -5
 err_invalid_input = -6
 err_end_ignore_marker = -7
 err_start_ignore_marker = -8
+err_invalid_rules_file = -9
 
 # -- Max log message length
 # The default maximum length of a single log message. Any line longer than MAX_LOG_MESSAGE_LENGTH
 # will not be picked up by the analyzer.
 MAX_LOG_MESSAGE_LENGTH = 1000
 
+# -- Streaming analysis
+# Size of the chunks read by the streaming analyzer. Only one chunk (plus the
+# partial line carried over from the previous one) is held in memory at a time.
+STREAM_CHUNK_SIZE = 1024 * 1024
+
+# -- Marker positions
+# Maximum number of start markers kept in the marker state file
+MAX_MARKER_STATE_ENTRIES = 64
+
+# -- Line classes returned by LineClassifier.classify()
+LINE_MATCH = 'match'
+LINE_EXPECT = 'expect'
+
+
+def _uses_group_reference(node):
+    '''
+    @summary: Check if a parsed regular expression refers to a group, by a
+              backreference or a conditional group.
+
+    @param node: sre_parse.SubPattern, or an item of it.
+    '''
+    if isinstance(node, tuple) and node and (node[0] is sre_parse.GROUPREF or
+                                             node[0] is sre_parse.GROUPREF_EXISTS):
+        return True
+    if isinstance(node, (tuple, list, sre_parse.SubPattern)):
+        return any(_uses_group_reference(item) for item in node)
+    return False
+
+
+class LineClassifier:
+    '''
+    @summary: Classify log lines against the match, ignore and expect rule sets.
+
+    All rule sets are compiled into one tagged pattern matched once from the
+    start of the line, and the line class is the name of the group it ends in:
+    a lookahead for any 'expect' or 'match' hit first rejects the vast majority
+    of lines, which hit no rule at all, in one pass. A line which hits is tagged
+    'expect' if the 'expect' set hits anywhere in it, otherwise 'match' if the
+    'ignore' set hits nowhere in it. The 'expect' set is searched a second time
+    on the lines passing the first lookahead, and the 'ignore' set is only tried
+    on lines hitting the 'match' set, which keeps the result identical to
+    line_is_expected()/line_matches().
+
+    Group numbers shift when the rule sets are combined, so rule sets referring
+    to a group, e.g. by a backreference, are searched one by one instead.
+    '''
+
+    def __init__(self, match_messages_regex, ignore_messages_regex, expect_messages_regex):
+        self.match_regex = match_messages_regex
+        self.ignore_regex = ignore_messages_regex
+        self.expect_regex = expect_messages_regex
+
+        # '[\s\S]*?' lets the lookaheads hit anywhere in the line, like search() does
+        hit_patterns = ['(?:%s)' % regex.pattern for regex in (expect_messages_regex, match_messages_regex)
+                        if regex is not None]
+        branches = []
+        if expect_messages_regex is not None:
+            branches.append(r'(?=[\s\S]*?(?:%s))(?P<%s>)' % (expect_messages_regex.pattern, LINE_EXPECT))
+        if match_messages_regex is not None:
+            not_ignored = r'(?![\s\S]*?(?:%s))' % ignore_messages_regex.pattern if ignore_messages_regex else ''
+            branches.append(r'%s(?P<%s>)' % (not_ignored, LINE_MATCH))
+        # A line passing the first lookahead and not hitting the 'expect' set hits the 'match' set
+        tagged_pattern = r'(?=[\s\S]*?(?:%s))(?:%s)' % ('|'.join(hit_patterns), '|'.join(branches))
+        try:
+            if any(_uses_group_reference(sre_parse.parse(regex.pattern))
+                   for regex in (expect_messages_regex, match_messages_regex, ignore_messages_regex)
+                   if regex is not None):
+                self.tagged_regex = False
+            else:
+                self.tagged_regex = re.compile(tagged_pattern) if hit_patterns else None
+        except re.error:
+            # Rule sets which can't be combined, e.g. defining the same group name, are searched one by one
+            self.tagged_regex = False
+
+    def classify(self, line):
+        '''
+        @summary: Classify one log line.
+
+        @param line: log line to classify.
+
+        @return: LINE_EXPECT if the line matches the 'expect' set,
+                 LINE_MATCH if it matches the 'match' set and not the 'ignore' set,
+                 None otherwise.
+        '''
+        if self.tagged_regex is False:
+            return self._classify_by_rule_set(line)
+
+        hit = self.tagged_regex.match(line) if self.tagged_regex is not None else None
+        return hit.lastgroup if hit else None
+
+    def _classify_by_rule_set(self, line):
+        if self.expect_regex is not None and self.expect_regex.search(line):
+            return LINE_EXPECT
+
+        if self.match_regex is not None and self.match_regex.search(line):
+            if self.ignore_regex is None or not self.ignore_regex.search(line):
+                return LINE_MATCH
+
+        return None
+
 
 class AnsibleLogAnalyzer:
     '''
@@ -104,6 +217,7 @@ class AnsibleLogAnalyzer:
         self.run_id = run_id
         self.verbose = verbose
         self.start_marker = start_marker
+        self.stream_stats = {}
     # ---------------------------------------------------------------------
 
     def print_diagnostic_message(self, message):
@@ -246,13 +360,56 @@ class AnsibleLogAnalyzer:
 
         return False
 
-    def place_marker(self, log_file_list, marker, wait_for_marker=False):
+    def record_marker_position(self, state_file, marker, log_file_list):
+        '''
+        @summary: Record inode and size of the log files right before the marker is placed.
+
+        The marker is appended after the recorded offset, so extract_log can seek straight
+        to it instead of scanning all rotated log files.
+        State file format: {marker: {"time": <epoch>, "files": {path: [inode, offset]}}}
+
+        @param state_file:     Path to the marker state file.
+        @param marker:         Marker which is about to be placed.
+        @param log_file_list : List of file paths, to be applied with marker.
+        '''
+        files = {}
+        for log_file in [system_log_file] + list(log_file_list):
+            try:
+                st = os.stat(log_file)
+            except OSError:
+                continue
+            files[log_file] = [st.st_ino, st.st_size]
+
+        state = {}
+        if os.path.exists(state_file):
+            try:
+                with open(state_file, 'r') as fp:
+                    state = json.load(fp)
+            except (IOError, ValueError):
+                self.print_diagnostic_message('Ignore malformed marker state file {}'.format(state_file))
+
+        state[marker] = {'time': time.time(), 'files': files}
+        # Keep only the latest markers
+        for old_marker in sorted(state, key=lambda m: state[m]['time'])[:-MAX_MARKER_STATE_ENTRIES]:
+            del state[old_marker]
+
+        tmp_state_file = state_file + '.tmp'
+        with open(tmp_state_file, 'w') as fp:
+            json.dump(state, fp)
+        os.rename(tmp_state_file, state_file)
+        self.print_diagnostic_message('marker {} positions: {}'.format(marker, files))
+
+    def place_marker(self, log_file_list, marker, wait_for_marker=False, state_file=None):
         '''
         @summary: Place marker into '/dev/log' and each log file specified.
         @param log_file_list : List of file paths, to be applied with marker.
         @param marker:         Marker to be placed into log files.
+        @param state_file:     If specified, record positions of the marker in the log files into this file.
         '''
 
+        if state_file:
+            self.record_marker_position(state_file, marker, log_file_list)
+
         for log_file in log_file_list:
             self.place_marker_to_file(log_file, marker)
 
@@ -534,8 +691,192 @@ class AnsibleLogAnalyzer:
         return matching_lines, expected_lines
     # ---------------------------------------------------------------------
 
+    def find_start_marker_offset(self, log_file_path, start_marker):
+        '''
+        @summary: Find the byte offset right after the last start marker line of the file.
+
+        The file is memory mapped and searched backwards for the marker, so locating
+        the analysis range does not require reading the log line by line.
+        Lines written by extract_log (which carry the marker as an argument) are skipped.
+
+        @param log_file_path: Path to the log file.
+
+        @param start_marker: Start marker string.
+
+        @return: Offset of the first byte after the start marker line, None if marker was not found.
+        '''
+        marker = start_marker.encode('utf-8')
+        with open(log_file_path, 'rb') as log_file:
+            if os.fstat(log_file.fileno()).st_size == 0:
+                return None
+            log_map = mmap.mmap(log_file.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                search_end = len(log_map)
+                while True:
+                    pos = log_map.rfind(marker, 0, search_end)
+                    if pos == -1:
+                        return None
+                    line_start = log_map.rfind(b'\n', 0, pos) + 1
+                    line_end = log_map.find(b'\n', pos)
+                    line_end = len(log_map) if line_end == -1 else line_end + 1
+                    if b'extract_log' not in log_map[line_start:line_end]:
+                        return line_end
+                    search_end = line_start
+            finally:
+                log_map.close()
+    # ---------------------------------------------------------------------
+
+    def iter_log_lines(self, log_file, offset=0, chunk_size=STREAM_CHUNK_SIZE):
+        '''
+        @summary: Read the log file forward in fixed-size chunks and yield its lines.
+
+        @param log_file: Log file object opened in binary mode.
+
+        @param offset: Byte offset to start reading from.
+
+        @param chunk_size: Size of a single read.
+
+        @return: Generator of decoded lines, each including the trailing newline.
+        '''
+        log_file.seek(offset)
+        tail = b''
+        while True:
+            chunk = log_file.read(chunk_size)
+            if not chunk:
+                break
+            block, sep, tail = (tail + chunk).rpartition(b'\n')
+            if not sep:
+                tail = block + tail
+                continue
+            for line in block.decode('utf-8', 'replace').split('\n'):
+                yield line + '\n'
+        if tail:
+            yield tail.decode('utf-8', 'replace')
+    # ---------------------------------------------------------------------
+
+    def analyze_file_stream(self, log_file_path, match_messages_regex, ignore_messages_regex,
+                            expect_messages_regex, maximum_log_length=None, chunk_size=STREAM_CHUNK_SIZE):
+        '''
+        @summary: Streaming counterpart of analyze_file().
+
+        Instead of loading the whole file and walking it backwards, the analyzer
+        seeks to the start marker (see find_start_marker_offset()) and reads the
+        rest of the file forward in chunks of chunk_size bytes. Every line is
+        classified with a single LineClassifier, so memory usage does not depend
+        on the log size.
+
+        @param log_file_path: Path to the log file, '-' for stdin.
+
+        @param match_messages_regex:
+            regex class instance containing messages to match against.
+
+        @param ignore_messages_regex:
+            regex class instance containing messages to ignore match against.
+
+        @param expect_messages_regex:
+            regex class instance containing messages that are expected to appear in logfile.
+
+        @param maximum_log_length - The long log message (length > maximum_log_length) will be dropped by LogAnalyzer.
+
+        @param chunk_size - Size of a single read from the log file.
+
+        @return: Tuple of (matching lines, expected lines, statistics), lines are in the file order.
+        '''
+        self.print_diagnostic_message('analyzing file (streaming): %s' % log_file_path)
+
+        check_marker = self.require_marker_check(log_file_path)
+        stdin_as_input = self.is_filename_stdin(log_file_path)
+        classifier = LineClassifier(match_messages_regex, ignore_messages_regex, expect_messages_regex)
+        if maximum_log_length is None:
+            maximum_log_length = MAX_LOG_MESSAGE_LENGTH
+
+        start_marker = self.create_start_marker()
+        end_marker = self.create_end_marker()
+
+        matching_lines = []
+        expected_lines = []
+        found_end_marker = False
+        in_analysis_range = True
+        ignore_marker_run_ids = []
+        line_count = 0
+        start_time = time.time()
+
+        if stdin_as_input:
+            log_file = sys.stdin
+            lines = log_file
+        else:
+            offset = self.find_start_marker_offset(log_file_path, start_marker)
+            if offset is not None:
+                self.print_diagnostic_message('found start marker: %s' % start_marker)
+            elif check_marker:
+                print('ERROR: start marker was not found')
+                sys.exit(err_no_start_marker)
+            log_file = open(log_file_path, 'rb')
+            lines = self.iter_log_lines(log_file, offset or 0, chunk_size)
+
+        try:
+            for line in lines:
+                line_count += 1
+                if not stdin_as_input:
+                    if end_marker in line:
+                        self.print_diagnostic_message('found end marker: %s' % end_marker)
+                        if found_end_marker:
+                            print('ERROR: duplicate end marker found')
+                            sys.exit(err_duplicate_end_marker)
+                        found_end_marker = True
+                        # Files without markers are analyzed up to the end of the file
+                        in_analysis_range = not check_marker
+                        continue
+                    elif self.start_ignore_marker_prefix in line:
+                        self.print_diagnostic_message('found start ignore marker: %s'
+                                                      % line[line.index(self.start_ignore_marker_prefix):])
+                        if not in_analysis_range:
+                            print('ERROR: duplicate start ignore marker found')
+                            sys.exit(err_start_ignore_marker)
+                        ignore_marker_run_ids.append(line.split(self.start_ignore_marker_prefix)[1])
+                        in_analysis_range = False
+                        continue
+                    elif self.end_ignore_marker_prefix in line:
+                        self.print_diagnostic_message('found end ignore marker: %s'
+                                                      % line[line.index(self.end_ignore_marker_prefix):])
+                        if in_analysis_range or not ignore_marker_run_ids \
+                                or ignore_marker_run_ids.pop() not in line:
+                            print('ERROR: unexpected end ignore marker found')
+                            sys.exit(err_end_ignore_marker)
+                        in_analysis_range = True
+                        continue
+
+                if not in_analysis_range:
+                    continue
+
+                # Skip long logs in files without markers (see analyze_file)
+                if not check_marker and len(line) > maximum_log_length:
+                    continue
+
+                line_class = classifier.classify(line)
+                if line_class == LINE_EXPECT:
+                    expected_lines.append(line)
+                elif line_class == LINE_MATCH:
+                    self.print_diagnostic_message('matching line: %s' % line)
+                    matching_lines.append(line)
+        finally:
+            if not stdin_as_input:
+                log_file.close()
+
+        if not stdin_as_input and check_marker and not found_end_marker:
+            print('ERROR: end marker was not found')
+            sys.exit(err_no_end_marker)
+
+        elapsed = time.time() - start_time
+        stats = {'lines': line_count,
+                 'seconds': round(elapsed, 3),
+                 'lines_per_sec': int(line_count / elapsed) if elapsed > 0 else line_count,
+                 'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss if resource else None}
+        return matching_lines, expected_lines, stats
+    # ---------------------------------------------------------------------
+
     def analyze_file_list(self, log_file_list, match_messages_regex, ignore_messages_regex, expect_messages_regex,
-                          maximum_log_length=None):
+                          maximum_log_length=None, streaming=False):
         '''
         @summary: Analyze input files messages matching input regex expressions.
             See line_matches() for details on matching criteria.
@@ -554,19 +895,30 @@ class AnsibleLogAnalyzer:
         @param maximum_log_length
             The maximum length of the log message. If the length of the log message is greater than this value,
 
+        @param streaming
+            Use the streaming analyzer (analyze_file_stream). Per-file statistics are stored in self.stream_stats.
+
         @return: Returns map <file_name, list_of_matching_strings>
         '''
         res = {}
+        self.stream_stats = {}
 
         for log_file in log_file_list:
             if not len(log_file):
                 continue
-            match_strings, expect_strings = self.analyze_file(log_file, match_messages_regex, ignore_messages_regex,
-                                                              expect_messages_regex,
-                                                              maximum_log_length=maximum_log_length)
-
-            match_strings.reverse()
-            expect_strings.reverse()
+            if streaming:
+                match_strings, expect_strings, stats = self.analyze_file_stream(
+                    log_file, match_messages_regex, ignore_messages_regex, expect_messages_regex,
+                    maximum_log_length=maximum_log_length)
+                self.stream_stats[log_file] = stats
+                print('[LogAnalyzer][stats]: file:%s, lines:%d, seconds:%s, lines/sec:%d, peak_rss_kb:%s' % (
+                    log_file, stats['lines'], stats['seconds'], stats['lines_per_sec'], stats['peak_rss_kb']))
+            else:
+                match_strings, expect_strings = self.analyze_file(log_file, match_messages_regex,
+                                                                  ignore_messages_regex, expect_messages_regex,
+                                                                  maximum_log_length=maximum_log_length)
+                match_strings.reverse()
+                expect_strings.reverse()
             res[log_file] = [match_strings, expect_strings]
 
         return res
@@ -582,6 +934,8 @@ def usage():
     print('                                 to all log files specified in --logs parameter.')
     print('                                 analyze - perform log analysis of files specified in --logs parameter.')
     print('                                 add_end_marker - add end marker to all log files specified in --logs parameter.')           # noqa E501
+    print('                                 analyze_json - analyze already extracted files specified in --logs')
+    print('                                 parameter against --rules_file and print the result as JSON.')
     print('--out_dir path                   Directory path where to place output files, ')
     print('                                 must be present when --action == analyze')
     print('--logs path{,path}               List of full paths to log files to be analyzed.')
@@ -600,11 +954,19 @@ def usage():
     print('                                 All the strings from these files will be expected to present')
     print('                                 in one of specified log files during the analysis. Must be present')
     print('                                 when action == analyze.')
+    print('--rules_file path                JSON file with "match", "ignore" and "expect" lists of regular')
+    print('                                 expressions. Must be present when action == analyze_json.')
+    print('--max_log_length length          Lines longer than this are skipped in files without markers.')
+    print('--state_file path                File where init action records inode and offset of the start marker')
+    print('                                 in the log files. Used by extract_log to skip scanning rotated logs.')
+    print('--streaming                      Analyze log files with the streaming analyzer: seek to the start marker')
+    print('                                 and read forward in chunks instead of loading the whole file.')
+    print('                                 Per-file lines/sec and peak RSS are printed.')
 
 # ---------------------------------------------------------------------
 
 
-def check_action(action, log_files_in, out_dir, match_files_in, ignore_files_in, expect_files_in):
+def check_action(action, log_files_in, out_dir, match_files_in, ignore_files_in, expect_files_in, rules_file=None):
     '''
     @summary: This function validates command line parameter 'action' and
         other related parameters.
@@ -616,6 +978,15 @@ def check_action(action, log_files_in, out_dir, match_files_in, ignore_files_in,
 
     if action in ['init', 'add_end_marker', 'add_start_ignore_mark', 'add_end_ignore_mark']:
         ret_code = True
+    elif action == 'analyze_json':
+        if rules_file is None or len(rules_file) == 0:
+            print('ERROR: missing required rules_file for analyze_json action')
+            ret_code = False
+
+        elif log_files_in is None or len(log_files_in) == 0:
+            print('ERROR: missing required logs for analyze_json action')
+            ret_code = False
+
     elif action == 'analyze':
         if out_dir is None or len(out_dir) == 0:
             print('ERROR: missing required out_dir for analyze action')
@@ -713,6 +1084,30 @@ def write_result_file(run_id, out_dir, analysis_result_per_file, messages_regex_
 # ---------------------------------------------------------------------
 
 
+def load_rules_file(rules_file):
+    '''
+    @summary: Load match/ignore/expect regular expressions from a JSON rules file.
+
+    @param rules_file: Path to the JSON file with "match", "ignore" and "expect" lists.
+
+    @return: Tuple of compiled (match, ignore, expect) regex, None for an empty list.
+    '''
+    try:
+        with open(rules_file, 'r') as fp:
+            rules = json.load(fp)
+    except (IOError, ValueError) as e:
+        print('ERROR: failed to load rules file %s' % rules_file)
+        print(repr(e))
+        sys.exit(err_invalid_rules_file)
+
+    compiled = []
+    for key in ('match', 'ignore', 'expect'):
+        regex_list = rules.get(key, [])
+        compiled.append(re.compile('|'.join(regex_list)) if regex_list else None)
+    return tuple(compiled)
+# ---------------------------------------------------------------------
+
+
 def write_summary_file(run_id, out_dir, analysis_result_per_file, unused_regex_messages):
     '''
     @summary: This function writes results summary into a file
@@ -765,12 +1160,17 @@ def main(argv):
     ignore_files_in = None
     expect_files_in = None
     verbose = False
+    streaming = False
+    rules_file = None
+    maximum_log_length = None
+    state_file = None
 
     try:
-        opts, args = getopt.getopt(argv, "a:r:s:l:o:m:i:e:vh",
+        opts, args = getopt.getopt(argv, "a:r:s:l:o:m:i:e:vhS",
                                    ["action=", "run_id=", "start_marker=", "logs=",
                                     "out_dir=", "match_files_in=", "ignore_files_in=",
-                                    "expect_files_in=", "verbose", "help"])
+                                    "expect_files_in=", "verbose", "help", "streaming",
+                                    "rules_file=", "max_log_length=", "state_file="])
 
     except getopt.GetoptError:
         print("Invalid option specified")
@@ -809,7 +1209,20 @@ def main(argv):
         elif (opt in ("-v", "--verbose")):
             verbose = True
 
-    if not (check_action(action, log_files_in, out_dir, match_files_in, ignore_files_in, expect_files_in)
+        elif (opt in ("-S", "--streaming")):
+            streaming = True
+
+        elif (opt == "--rules_file"):
+            rules_file = arg
+
+        elif (opt == "--max_log_length"):
+            maximum_log_length = int(arg)
+
+        elif (opt == "--state_file"):
+            state_file = arg
+
+    if not (check_action(action, log_files_in, out_dir, match_files_in, ignore_files_in, expect_files_in,
+                         rules_file)
             and check_run_id(run_id)):
         usage()
         sys.exit(err_invalid_input)
@@ -820,7 +1233,7 @@ def main(argv):
 
     result = {}
     if action == "init":
-        analyzer.place_marker(log_file_list, analyzer.create_start_marker())
+        analyzer.place_marker(log_file_list, analyzer.create_start_marker(), state_file=state_file)
         return 0
     elif action == "analyze":
         match_file_list = match_files_in.split(tokenizer)
@@ -842,11 +1255,21 @@ def main(argv):
             log_file_list.append(system_log_file)
 
         result = analyzer.analyze_file_list(log_file_list, match_messages_regex,
-                                            ignore_messages_regex, expect_messages_regex)
+                                            ignore_messages_regex, expect_messages_regex,
+                                            streaming=streaming)
         unused_regex_messages = []
         write_result_file(run_id, out_dir, result,
                           messages_regex_e, unused_regex_messages)
         write_summary_file(run_id, out_dir, result, unused_regex_messages)
+    elif action == "analyze_json":
+        match_messages_regex, ignore_messages_regex, expect_messages_regex = load_rules_file(rules_file)
+        result = analyzer.analyze_file_list(log_file_list, match_messages_regex,
+                                            ignore_messages_regex, expect_messages_regex,
+                                            maximum_log_length=maximum_log_length,
+                                            streaming=streaming)
+        # The verdict is printed as the last line of the output
+        print(json.dumps({"result": result, "stats": analyzer.stream_stats}))
+        return 0
     elif action == "add_end_marker":
         analyzer.place_marker(
             log_file_list, analyzer.create_end_marker(), wait_for_marker=True)
@@ -15,6 +15,7 @@ import time
 
 from collections import defaultdict
 from logging.handlers import RotatingFileHandler
+from multiprocessing.pool import ThreadPool
 
 from flask import Flask, request, abort
 from flask.logging import default_handler
@@ -30,6 +31,15 @@ DUMP_FLOW_CMD = 'ovs-ofctl --names dump-flows {}'
 DEL_FLOW_CMD = 'ovs-ofctl --names del-flows {} in_port="{}"'
 ADD_FLOW_CMD = 'ovs-ofctl --names add-flow {} in_port="{}",actions={}'
 MOD_FLOW_CMD = 'ovs-ofctl --names mod-flows {} in_port="{}",actions={}'
+BUNDLE_FLOW_CMD = 'ovs-ofctl --names --bundle add-flows {} -'
+
+# Flow mods in the 'ovs-ofctl add-flows' file format, applied atomically per bridge as one OpenFlow bundle
+DEL_FLOW_MOD = 'delete in_port="{}"'
+ADD_FLOW_MOD = 'add in_port="{}",actions={}'
+MOD_FLOW_MOD = 'modify in_port="{}",actions={}'
+
+# Max number of bridges programmed or verified at the same time in bulk operations
+MUX_BULK_CONCURRENCY = 16
 
 RANDOM = 'random'
 TOGGLE = 'toggle'
@@ -100,11 +110,12 @@ def adaptive_name(template, vm_set, index):
     return rendered_name
 
 
-def run_cmd(cmdline):
+def run_cmd(cmdline, input=None):
     """Use subprocess to run a command line with shell=True
 
     Args:
         cmdline (string): The command to be executed.
+        input (string): Optional data fed to stdin of the command.
 
     Raises:
         Exception: If return code of running command line is not zero, an exception is raised.
@@ -118,7 +129,7 @@ def run_cmd(cmdline):
         stdout=subprocess.PIPE,
         stdin=subprocess.PIPE,
         stderr=subprocess.PIPE)
-    stdout, stderr = process.communicate()
+    stdout, stderr = process.communicate(input.encode('utf-8') if input is not None else None)
     ret_code = process.returncode
 
     msg = {
@@ -127,6 +138,8 @@ def run_cmd(cmdline):
         'stdout': stdout.decode('utf-8').splitlines(),
         'stderr': stderr.decode('utf-8').splitlines()
     }
+    if input is not None:
+        msg['input'] = input.splitlines()
     app.logger.debug(json.dumps(msg, indent=2))
 
     if ret_code != 0:
@@ -176,6 +189,9 @@ class Mux(object):
         # All the operations of updating mux config and getting mux status must acquire the lock firstly.
         self.lock = threading.Lock()
 
+        # Flow changes queued while the mux is part of a bulk update. None means flow changes are applied immediately.
+        self.pending_mods = None
+
         self.vm_set = vm_set
 
         self.port_index = port_index
@@ -286,7 +302,7 @@ class Mux(object):
             }
         }
 
-    def _get_flows(self):
+    def _dump_flows(self):
         """Use the 'ovs-ofctl dump-flows' command to get the open flow details of a bridge simulating mux.
 
         Example output of the 'ovs-ofctl dump-flows' command:
@@ -300,6 +316,9 @@ class Mux(object):
         >>> re.findall(r'in_port="(\S+)"\s+actions=(\S+)', out)     # noqa W605
         [('muxy-vms17-8-0', 'output:"enp59s0f1.3216",output:"enp59s0f1.3272"'),
          ('enp59s0f1.3216', 'output:"muxy-vms17-8-0"')]
+
+        Returns:
+            dict: Flows on the bridge, flows[in_port][out_port] = action
         """
 
         # By default, there are only two flows per bridge:
@@ -323,8 +342,20 @@ class Mux(object):
                 else:
                     self.debug('in_port={}, out_port={}, action={}'.format(in_port, out_port, action))
         self.debug('Parsed flows on bridge:\n{}'.format(json.dumps(flows, indent=2)))
+        return flows
 
-        # Transform parsed flows to self.flows dict
+    def _get_flows(self, flows=None):
+        """Update the flow state of the mux from the flows programmed on the bridge.
+
+        Args:
+            flows (dict): Flows already dumped from the bridge. Dump them by _dump_flows if not specified.
+        """
+        if flows is None:
+            flows = self._dump_flows()
+
+        # Transform parsed flows to self.flows dict. Direction without flow on the bridge is dropping all packets.
+        self.flows['upstream']['out_sides'] = []
+        self.flows['downstream']['out_sides'] = []
         for in_port in flows:
             if self.sides[in_port] == NIC:
                 # From NIC to TORs, upstream flow
@@ -380,6 +411,77 @@ class Mux(object):
             }
             return status
 
+    def _flow_mod(self, cmd, mod, *args):
+        """Change a flow on the bridge.
+
+        The change is applied by running the ovs-ofctl command immediately. If the mux is part of a bulk update, the
+        change is queued and applied later together with the other changes of the bridge by apply_pending_mods.
+
+        Args:
+            cmd (string): Template of the ovs-ofctl command, like DEL_FLOW_CMD.
+            mod (string): Template of the same change in ovs-ofctl flow file format, like DEL_FLOW_MOD.
+            args: in_port and optionally action description of the flow.
+        """
+        if self.pending_mods is None:
+            run_cmd(cmd.format(self.bridge, *args))
+        else:
+            self.pending_mods.append((cmd.format(self.bridge, *args), mod.format(*args)))
+
+    def _cached_flows(self):
+        """Build the flows expected on the bridge from the flow state of the mux.
+
+        Returns:
+            dict: Expected flows in the same format as returned by _dump_flows, flows[in_port][out_port] = action
+        """
+        flows = {}
+        for direction in ['upstream', 'downstream']:
+            flow = self.flows[direction]
+            if flow['out_sides']:
+                flows[self.ports[flow['in_side']]] = {self.ports[out_side]: OUTPUT for out_side in flow['out_sides']}
+        return flows
+
+    def begin_bulk_update(self):
+        """Start queueing flow changes instead of applying them immediately."""
+        with self.lock:
+            self.pending_mods = []
+
+    def apply_pending_mods(self):
+        """Apply the flow changes queued since begin_bulk_update.
+
+        All the queued changes are applied in a single OpenFlow bundle, so only one ovs-ofctl process is needed and
+        the bridge never forwards with a half updated flow table. If the bundle is rejected, fall back to applying the
+        changes one by one.
+        """
+        with self.lock:
+            pending_mods, self.pending_mods = self.pending_mods, None
+            if not pending_mods:
+                return
+            try:
+                run_cmd(BUNDLE_FLOW_CMD.format(self.bridge), input='\n'.join(mod for _, mod in pending_mods) + '\n')
+            except Exception as e:
+                self.error('applying {} flow mods in bundle failed, apply them one by one, error: {}'
+                           .format(len(pending_mods), repr(e)))
+                for cmd, _ in pending_mods:
+                    run_cmd(cmd)
+
+    def verify_flows(self):
+        """Read back the flows programmed on the bridge and compare them with the flow state of the mux.
+
+        If they are different, the flow state of the mux is updated to what is really programmed on the bridge.
+
+        Returns:
+            boolean: True if the flows on the bridge match the flow state of the mux.
+        """
+        with self.lock:
+            expected_flows = self._cached_flows()
+            actual_flows = dict(self._dump_flows())
+            if actual_flows == expected_flows:
+                return True
+            self.error('flows on bridge do not match mux state, expected: {}, actual: {}'
+                       .format(json.dumps(expected_flows), json.dumps(actual_flows)))
+            self._get_flows(actual_flows)
+            return False
+
     def set_active_side(self, new_active_side):
         """Set the active side of the mux bridge to the specified side.
 
@@ -405,18 +507,13 @@ class Mux(object):
 
             if len(self.flows['downstream']['out_sides']) == 1:
                 action_desc = '{}:"{}"'.format(OUTPUT, self.ports[NIC])
-                run_cmd(DEL_FLOW_CMD.format(
-                    self.bridge,
-                    self.active_port))
+                self._flow_mod(DEL_FLOW_CMD, DEL_FLOW_MOD, self.active_port)
                 # Immediately update state after flow config changed to ensure consistency
                 self._active_standby_state_helper(None)
                 self.flows['downstream']['in_side'] = self.active_side
                 self.flows['downstream']['out_sides'] = []
 
-                run_cmd(ADD_FLOW_CMD.format(
-                    self.bridge,
-                    new_active_port,
-                    action_desc))
+                self._flow_mod(ADD_FLOW_CMD, ADD_FLOW_MOD, new_active_port, action_desc)
                 # Immediately update state after flow config changed to ensure consistency
                 self._active_standby_state_helper(new_active_side)
                 self.flows['downstream']['in_side'] = self.active_side
@@ -447,9 +544,7 @@ class Mux(object):
 
         if new_action == DROP:
             # Update action from OUTPUT to DROP, del-flow
-            run_cmd(DEL_FLOW_CMD.format(
-                self.bridge,
-                self.active_port))
+            self._flow_mod(DEL_FLOW_CMD, DEL_FLOW_MOD, self.active_port)
             self.flows['downstream']['out_sides'] = []
 
         else:
@@ -460,10 +555,7 @@ class Mux(object):
             else:
                 active_side = self.active_side
 
-            run_cmd(ADD_FLOW_CMD.format(
-                self.bridge,
-                self.ports[active_side],
-                action_desc))
+            self._flow_mod(ADD_FLOW_CMD, ADD_FLOW_MOD, self.ports[active_side], action_desc)
             self._active_standby_state_helper(active_side)
             self.flows['downstream']['in_side'] = active_side
             self.flows['downstream']['out_sides'] = [NIC]
@@ -505,23 +597,15 @@ class Mux(object):
                 operation = 'MOD-FLOW'   # Need to modify upstream flow
 
         if operation == 'DEL-FLOW':
-            run_cmd(DEL_FLOW_CMD.format(
-                    self.bridge,
-                    self.ports[NIC]))
+            self._flow_mod(DEL_FLOW_CMD, DEL_FLOW_MOD, self.ports[NIC])
             self.flows['upstream']['out_sides'] = []
         elif operation == 'ADD-FLOW':
             action_desc = ','.join(['{}:"{}"'.format(OUTPUT, self.ports[out_side]) for out_side in target_out_sides])
-            run_cmd(ADD_FLOW_CMD.format(
-                    self.bridge,
-                    self.ports[NIC],
-                    action_desc))
+            self._flow_mod(ADD_FLOW_CMD, ADD_FLOW_MOD, self.ports[NIC], action_desc)
             self.flows['upstream']['out_sides'] = target_out_sides
         elif operation == 'MOD-FLOW':
             action_desc = ','.join(['{}:"{}"'.format(OUTPUT, self.ports[out_side]) for out_side in target_out_sides])
-            run_cmd(MOD_FLOW_CMD.format(
-                    self.bridge,
-                    self.ports[NIC],
-                    action_desc))
+            self._flow_mod(MOD_FLOW_CMD, MOD_FLOW_MOD, self.ports[NIC], action_desc)
             self.flows['upstream']['out_sides'] = target_out_sides
         self.debug('updated upstream flow, new_action={}, out_sides={}, flows={}'
                    .format(new_action, out_sides, json.dumps(self.flows, indent=2)))
@@ -583,6 +667,35 @@ class Muxes(object):
         bridge = adaptive_name(MUX_BRIDGE_TEMPLATE, self.vm_set, port_index)
         return self.muxes[bridge]
 
+    def _run_concurrently(self, func, muxes):
+        """Call func for each of the muxes with a pool of threads.
+
+        Returns:
+            list: Results of calling func for the muxes, in the same order as muxes.
+        """
+        if len(muxes) <= 1:
+            return [func(mux) for mux in muxes]
+        pool = ThreadPool(min(MUX_BULK_CONCURRENCY, len(muxes)))
+        try:
+            return pool.map(func, muxes)
+        finally:
+            pool.close()
+            pool.join()
+
+    def _bulk_update(self, muxes, update):
+        """Run update for each of the muxes and apply the resulted flow changes in bulk.
+
+        The mux state is updated in memory first while the flow changes are queued. Then the queued changes of each
+        bridge are applied in a single bundle, and the bridges are programmed concurrently.
+        """
+        for mux in muxes:
+            mux.begin_bulk_update()
+        try:
+            for mux in muxes:
+                update(mux)
+        finally:
+            self._run_concurrently(Mux.apply_pending_mods, muxes)
+
     def get_mux_status(self, port_index=None):
         if port_index is not None:
             return self._port_to_mux(port_index).status
@@ -592,19 +705,40 @@ class Muxes(object):
     def set_active_side(self, new_active_side, port_index=None):
         if port_index is not None:
             mux = self._port_to_mux(port_index)
-            mux.set_active_side(new_active_side)
+            self._bulk_update([mux], lambda mux: mux.set_active_side(new_active_side))
             return mux.status
         else:
-            [mux.set_active_side(new_active_side) for mux in self.muxes.values()]
+            self._bulk_update(list(self.muxes.values()), lambda mux: mux.set_active_side(new_active_side))
             return {mux.bridge: mux.status for mux in self.muxes.values()}
 
+    def bulk_set_active_side(self, new_active_side, port_indices=None):
+        """Set active side of the specified muxes and confirm the result from the flows programmed on the bridges.
+
+        Raises:
+            Exception: If flows programmed on some bridges do not match the expected mux state.
+
+        Returns:
+            dict: Status of the specified muxes, read back from the bridges.
+        """
+        if port_indices is None:
+            muxes = list(self.muxes.values())
+        else:
+            muxes = [self._port_to_mux(port_index) for port_index in port_indices]
+        self._bulk_update(muxes, lambda mux: mux.set_active_side(new_active_side))
+        verified = self._run_concurrently(Mux.verify_flows, muxes)
+        mismatched_bridges = [mux.bridge for mux, ok in zip(muxes, verified) if not ok]
+        if mismatched_bridges:
+            raise Exception('Flows on bridges {} do not match active side {}'.format(
+                mismatched_bridges, new_active_side))
+        return {mux.bridge: mux.status for mux in muxes}
+
     def update_flows(self, new_action, out_sides, port_index=None):
         if port_index is not None:
             mux = self._port_to_mux(port_index)
-            mux.update_flows(new_action, out_sides)
+            self._bulk_update([mux], lambda mux: mux.update_flows(new_action, out_sides))
             return mux.status
         else:
-            [mux.update_flows(new_action, out_sides) for mux in self.muxes.values()]
+            self._bulk_update(list(self.muxes.values()), lambda mux: mux.update_flows(new_action, out_sides))
             return {mux.bridge: mux.status for mux in self.muxes.values()}
 
     def reset_flows(self, port_index=None):
@@ -668,6 +802,34 @@ def _validate_posted_data(request):
     return data
 
 
+def _validate_port_indices(data):
+    """Validate the optional "port_indices" list in posted data.
+
+    If the list is malformed, abort with 400 BadRequest. If there is unknown port in the list, abort with 404.
+
+    Args:
+        data (dict): The posted data dict.
+
+    Returns:
+        list: Return the list of port indices, or None if it is not specified.
+    """
+    port_indices = data.get('port_indices')
+    if port_indices is None:
+        return None
+    if not isinstance(port_indices, list) or not all(isinstance(port_index, int) for port_index in port_indices):
+        abort(400, description='remote_addr={} method={} url={} data={} msg={}'.format(
+                request.remote_addr,
+                request.method,
+                request.url,
+                json.dumps(data),
+                'Bad posted data, expected "port_indices" to be a list of integers'
+            ))
+    unknown_ports = [port_index for port_index in port_indices if not g_muxes.has_mux(port_index)]
+    if unknown_ports:
+        abort(404, 'Unknown bridge, vm_set={}, port_indices={}'.format(g_muxes.vm_set, unknown_ports))
+    return port_indices
+
+
 def _validate_vm_set(vm_set):
     if g_muxes.vm_set != vm_set:
         abort(404, 'Unknown vm_set "{}"'.format(vm_set))
@@ -739,6 +901,29 @@ def all_mux_status(vm_set):
         return g_muxes.set_active_side(data['active_side'])
 
 
+@app.route('/mux/<vm_set>/toggle', methods=['POST'])
+def bulk_toggle_handler(vm_set):
+    """Handler for setting active side of multiple mux bridges in one request.
+
+    Posted data format:
+        {"active_side": "upper_tor|lower_tor|toggle|random", "port_indices": [0, 1, ...]}
+    The "port_indices" is optional. If it is not specified, all the mux bridges of the vm_set are updated.
+    The flow changes are applied in bulk. Response is returned after the flows are read back from the bridges and
+    confirmed to match the new active side.
+
+    Args:
+        vm_set (string): The vm_set of test setup.
+
+    Returns:
+        object: Return a flask response object.
+    """
+    _validate_vm_set(vm_set)
+    data = _validate_posted_data(request)
+    port_indices = _validate_port_indices(data)
+    app.logger.info('===== {} POST {} with {} ====='.format(request.remote_addr, request.url, json.dumps(data)))
+    return g_muxes.bulk_set_active_side(data['active_side'], port_indices)
+
+
 def _validate_out_sides(request):
     """Validate the posted data for updating flow action.
 
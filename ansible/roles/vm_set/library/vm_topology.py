@@ -1,5 +1,6 @@
 #!/usr/bin/python
 
+import csv
 import hashlib
 import json
 import os.path
@@ -14,6 +15,7 @@ import docker
 import ipaddress
 import six
 
+from multiprocessing.pool import ThreadPool
 from ansible.module_utils.basic import AnsibleModule
 
 try:
@@ -78,6 +80,8 @@ Parameters:
     - duts_mgmt_port: duts mgmt port
     - duts_name: duts names
     - fp_mtu: MTU for FP ports
+    - reconcile: for cmd 'bind', 'renumber', 'connect-vms' and 'disconnect-vms', only apply the changes of front panel
+      ovs bridges and injected PTF ports that are not in the desired state, skip the ones that are already set up
 '''
 
 EXAMPLES = '''
@@ -148,6 +152,8 @@ ROOT_BACK_BR_TEMPLATE = 'br-b-%s'
 PTF_FP_IFACE_TEMPLATE = 'eth%d'
 OVS_INTERCONNECTION_BRIDGE_TEMPLATE = 'bic-%s-%s'
 RETRIES = 10
+# Max number of OVS bridges whose flows are programmed concurrently
+OVS_FLOW_CONCURRENCY = 16
 # name of interface must be less than or equal to 15 bytes.
 MAX_INTF_LEN = 15
 
@@ -211,14 +217,27 @@ def adaptive_temporary_interface(vm_set_name, interface_name, reserved_space=0):
     return t_int_if
 
 
+def run_concurrently(func, items, concurrency=OVS_FLOW_CONCURRENCY):
+    """Call func on each of the items with a thread pool, return the results in the same order as items."""
+    if not items:
+        return []
+    pool = ThreadPool(min(concurrency, len(items)))
+    try:
+        return pool.map(func, items)
+    finally:
+        pool.close()
+        pool.join()
+
+
 class VMTopology(object):
 
-    def __init__(self, vm_names, vm_properties, fp_mtu, max_fp_num, topo):
+    def __init__(self, vm_names, vm_properties, fp_mtu, max_fp_num, topo, reconcile=False):
         self.vm_names = vm_names
         self.vm_properties = vm_properties
         self.fp_mtu = fp_mtu
         self.max_fp_num = max_fp_num
         self.topo = topo
+        self.reconcile = reconcile
         self._host_interfaces = None
         self._disabled_host_interfaces = None
         self._host_interfaces_active_active = None
@@ -394,10 +413,14 @@ class VMTopology(object):
                                 default_gw=mgmt_gw, default_gw_v6=mgmt_gw_v6)
 
     def create_bridges(self):
-        for vm in self.vm_names:
-            for fp_num in range(self.max_fp_num):
-                fp_br_name = adaptive_name(OVS_FP_BRIDGE_TEMPLATE, vm, fp_num)
-                self.create_ovs_bridge(fp_br_name, self.fp_mtu)
+        fp_br_names = [adaptive_name(OVS_FP_BRIDGE_TEMPLATE, vm, fp_num)
+                       for vm in self.vm_names for fp_num in range(self.max_fp_num)]
+        logging.info('=== Create bridges %s ===' % fp_br_names)
+        VMTopology.ovs_vsctl_transaction(['--may-exist add-br %s' % br_name for br_name in fp_br_names])
+        for fp_br_name in fp_br_names:
+            if self.fp_mtu != DEFAULT_MTU:
+                VMTopology.cmd('ifconfig %s mtu %d' % (fp_br_name, self.fp_mtu))
+            VMTopology.cmd('ifconfig %s up' % fp_br_name)
 
         if self.topo and 'DUT' in self.topo and 'vs_chassis' in self.topo['DUT']:
             # We have a KVM based virtual chassis, need to create bridge for midplane and inband.
@@ -416,10 +439,10 @@ class VMTopology(object):
         VMTopology.cmd('ifconfig %s up' % bridge_name)
 
     def destroy_bridges(self):
-        for vm in self.vm_names:
-            for fp_num in range(self.max_fp_num):
-                fp_br_name = adaptive_name(OVS_FP_BRIDGE_TEMPLATE, vm, fp_num)
-                self.destroy_ovs_bridge(fp_br_name)
+        fp_br_names = [adaptive_name(OVS_FP_BRIDGE_TEMPLATE, vm, fp_num)
+                       for vm in self.vm_names for fp_num in range(self.max_fp_num)]
+        logging.info('=== Destroy bridges %s ===' % fp_br_names)
+        VMTopology.ovs_vsctl_transaction(['--if-exists del-br %s' % br_name for br_name in fp_br_names])
 
         if self.topo and 'DUT' in self.topo and 'vs_chassis' in self.topo['DUT']:
             # In case of KVM based virtual chassis, need to destroy bridge for midplane and inband.
@@ -670,6 +693,9 @@ class VMTopology(object):
         if create_vlan_subintf:
             int_sub_if = int_if + vlan_subintf_sep + vlan_subintf_vlan_id
             t_int_sub_if = t_int_if + vlan_subintf_sep + vlan_subintf_vlan_id
+        elif self.reconcile and self.veth_in_docker_in_sync(ext_if, int_if, t_int_if):
+            logging.info('=== Veth pair %s/%s is already set up, skip ===' % (ext_if, int_if))
+            return
 
         if VMTopology.intf_exists(t_int_if):
             VMTopology.cmd("ip link del dev %s" % t_int_if)
@@ -730,6 +756,18 @@ class VMTopology(object):
         if create_vlan_subintf:
             VMTopology.iface_up(int_sub_if, pid=self.pid)
 
+    def veth_in_docker_in_sync(self, ext_if, int_if, t_int_if):
+        """Check if the veth pair (ext_if, int_if) is already set up by add_veth_if_to_docker.
+
+        A veth reports carrier up only when both ends are up, so operstate of ext_if covers int_if in PTF docker.
+        """
+        if self.pid is None or not VMTopology.intf_exists(int_if, pid=self.pid) \
+                or VMTopology.intf_exists(t_int_if) or VMTopology.intf_exists(t_int_if, pid=self.pid):
+            return False
+        if VMTopology.read_sysfs_net(ext_if, 'operstate') != 'up':
+            return False
+        return self.fp_mtu == DEFAULT_MTU or VMTopology.read_sysfs_net(ext_if, 'mtu') == str(self.fp_mtu)
+
     def add_veth_if_to_netns(self, ext_if, int_if):
         """Create vethernet devices (ext_if, int_if) and put int_if into the netns for active-active."""
         logging.info('=== Create veth pair %s/%s, set %s to netns %s ===' %
@@ -847,6 +885,7 @@ class VMTopology(object):
                             +----------------------+
 
         """
+        bindings = []
         for attr in self.VMs.values():
             for idx, vlan in enumerate(attr['vlans']):
                 br_name = adaptive_name(
@@ -858,8 +897,9 @@ class VMTopology(object):
                     INJECTED_INTERFACES_TEMPLATE, self.vm_set_name, ptf_index)
                 if len(self.duts_fp_ports[self.duts_name[dut_index]]) == 0:
                     continue
-                self.bind_ovs_ports(br_name, self.duts_fp_ports[self.duts_name[dut_index]][str(
-                    vlan_index)], injected_iface, vm_iface, disconnect_vm)
+                bindings.append((br_name, self.duts_fp_ports[self.duts_name[dut_index]][str(
+                    vlan_index)], injected_iface, vm_iface))
+        self.bind_ovs_ports_batch(bindings, disconnect_vm)
 
         if self.topo and 'DUT' in self.topo and 'vs_chassis' in self.topo['DUT']:
             # We have a KVM based virtaul chassis, bind the midplane and inband ports
@@ -951,82 +991,130 @@ class VMTopology(object):
                                    |                      +---- vm_iface
                                    +----------------------+
         """
-        br = VMTopology.get_ovs_bridge_by_port(injected_iface)
-        if br is not None and br != br_name:
-            VMTopology.cmd('ovs-vsctl del-port %s %s' % (br, injected_iface))
+        self.bind_ovs_ports_batch([(br_name, dut_iface, injected_iface, vm_iface)], disconnect_vm)
 
-        br = VMTopology.get_ovs_bridge_by_port(dut_iface)
-        if br is not None and br != br_name:
-            VMTopology.cmd('ovs-vsctl del-port %s %s' % (br, dut_iface))
+    def bind_ovs_ports_batch(self, bindings, disconnect_vm=False):
+        """
+        bind dut/injected/vm ports of multiple ovs bridges, see bind_ovs_ports
 
-        ports = VMTopology.get_ovs_br_ports(br_name)
-        if injected_iface not in ports:
-            VMTopology.cmd('ovs-vsctl add-port %s %s' %
-                           (br_name, injected_iface))
+        All the port changes are made in a single ovs-vsctl transaction. The flows of each bridge are replaced
+        with a single ovs-ofctl command, and the bridges are programmed concurrently.
 
-        if dut_iface not in ports:
-            VMTopology.cmd('ovs-vsctl add-port %s %s' % (br_name, dut_iface))
+        Args:
+            bindings (list): List of (br_name, dut_iface, injected_iface, vm_iface) tuples, one for each bridge.
+            disconnect_vm (bool): Drop packets from VM and do not forward packets from DUT to VM if True.
+        """
+        if not bindings:
+            return
 
-        bindings = VMTopology.get_ovs_port_bindings(br_name, [dut_iface])
-        dut_iface_id = bindings[dut_iface]
-        injected_iface_id = bindings[injected_iface]
-        vm_iface_id = bindings[vm_iface]
+        port_to_br = VMTopology.get_ovs_port_to_bridge()
+        if self.reconcile:
+            ofports = VMTopology.get_ovs_ofports()
+            in_sync = run_concurrently(
+                lambda binding: VMTopology.fp_binding_in_sync(binding, port_to_br, ofports, disconnect_vm), bindings)
+            logging.info('=== Bridges already in desired state: %s ===' %
+                         [binding[0] for binding, synced in zip(bindings, in_sync) if synced])
+            bindings = [binding for binding, synced in zip(bindings, in_sync) if not synced]
+            if not bindings:
+                return
+
+        vsctl_cmds = []
+        # A port may be both a stale port of one bridge and moved to another bridge in the batch, delete it only
+        # once, deleting a port twice in a transaction fails the whole transaction
+        deleted_ports = set()
+
+        def _del_port(br, port):
+            if port not in deleted_ports:
+                deleted_ports.add(port)
+                vsctl_cmds.append('del-port %s %s' % (br, port))
+
+        for br_name, dut_iface, injected_iface, vm_iface in bindings:
+            if self.reconcile:
+                # Remove stale ports, like unbind_fp_ports does before binding without reconcile
+                for port, br in port_to_br.items():
+                    if br == br_name and port not in (br_name, dut_iface, injected_iface, vm_iface):
+                        _del_port(br_name, port)
+            for iface in (injected_iface, dut_iface):
+                br = port_to_br.get(iface)
+                if br == br_name:
+                    continue
+                if br is not None:
+                    _del_port(br, iface)
+                vsctl_cmds.append('add-port %s %s' % (br_name, iface))
+        VMTopology.ovs_vsctl_transaction(vsctl_cmds)
 
-        # clear old bindings
-        VMTopology.cmd('ovs-ofctl del-flows %s' % br_name)
+        ofports = VMTopology.get_ovs_ofports([dut_iface for _, dut_iface, _, _ in bindings])
+
+        def _program_flows(binding):
+            br_name, dut_iface, injected_iface, vm_iface = binding
+            flows = VMTopology.get_fp_flows(
+                ofports[dut_iface], ofports[injected_iface], ofports[vm_iface], disconnect_vm)
+            VMTopology.ovs_replace_flows(br_name, flows)
+
+        run_concurrently(_program_flows, bindings)
+
+    @staticmethod
+    def fp_binding_in_sync(binding, port_to_br, ofports, disconnect_vm=False):
+        """Check if an ovs bridge is already bound by bind_ovs_ports_batch with the same ports and flows.
+
+        Args:
+            binding (tuple): (br_name, dut_iface, injected_iface, vm_iface)
+            port_to_br (dict): Bridge of all the ovs ports, see get_ovs_port_to_bridge.
+            ofports (dict): Openflow port numbers of all the ovs interfaces, see get_ovs_ofports.
+            disconnect_vm (bool): Whether the VM should be disconnected.
+
+        Returns:
+            bool: True if the bridge is in the desired state.
+        """
+        br_name, dut_iface, injected_iface, vm_iface = binding
+        br_ports = set([port for port, br in port_to_br.items() if br == br_name])
+        if br_ports != set([br_name, dut_iface, injected_iface, vm_iface]) \
+                or any([iface not in ofports for iface in (dut_iface, injected_iface, vm_iface)]):
+            return False
+        flows = VMTopology.get_fp_flows(ofports[dut_iface], ofports[injected_iface], ofports[vm_iface], disconnect_vm)
+        return VMTopology.get_ovs_flow_cookies(br_name) == [VMTopology.flows_cookie(flows)] * len(flows)
 
+    @staticmethod
+    def get_fp_flows(dut_iface_id, injected_iface_id, vm_iface_id, disconnect_vm=False):
+        """Get the flows of an ovs bridge binding dut/injected/vm ports, see bind_ovs_ports."""
+        flows = []
         if disconnect_vm:
             # Drop packets from VM
-            VMTopology.cmd(
-                "ovs-ofctl add-flow %s table=0,in_port=%s,action=drop" % (br_name, vm_iface_id))
+            flows.append("table=0,in_port=%s,action=drop" % vm_iface_id)
         else:
             # Add flow from a VM to an external iface
-            VMTopology.cmd("ovs-ofctl add-flow %s table=0,in_port=%s,action=output:%s" %
-                           (br_name, vm_iface_id, dut_iface_id))
+            flows.append("table=0,in_port=%s,action=output:%s" % (vm_iface_id, dut_iface_id))
 
         if disconnect_vm:
             # Add flow from external iface to ptf container
-            VMTopology.cmd("ovs-ofctl add-flow %s table=0,in_port=%s,action=output:%s" %
-                           (br_name, dut_iface_id, injected_iface_id))
+            flows.append("table=0,in_port=%s,action=output:%s" % (dut_iface_id, injected_iface_id))
         else:
             # Add flow from external iface to a VM and a ptf container
             # Allow BGP, IPinIP, fragmented packets, ICMP, SNMP packets and layer2 packets from DUT to neighbors
             # Block other traffic from DUT to EOS for EOS's stability,
             # Allow all traffic from DUT to PTF.
-            VMTopology.cmd("ovs-ofctl add-flow %s table=0,priority=10,tcp,in_port=%s,tp_src=179,action=output:%s,%s" %
-                           (br_name, dut_iface_id, vm_iface_id, injected_iface_id))
-            VMTopology.cmd("ovs-ofctl add-flow %s table=0,priority=10,tcp,in_port=%s,tp_dst=179,action=output:%s,%s" %
-                           (br_name, dut_iface_id, vm_iface_id, injected_iface_id))
-            VMTopology.cmd("ovs-ofctl add-flow %s table=0,priority=10,tcp6,in_port=%s,tp_src=179,action=output:%s,%s" %
-                           (br_name, dut_iface_id, vm_iface_id, injected_iface_id))
-            VMTopology.cmd("ovs-ofctl add-flow %s table=0,priority=10,tcp6,in_port=%s,tp_dst=179,action=output:%s,%s" %
-                           (br_name, dut_iface_id, vm_iface_id, injected_iface_id))
-            VMTopology.cmd("ovs-ofctl add-flow %s table=0,priority=10,ip,in_port=%s,nw_proto=4,action=output:%s,%s" %
-                           (br_name, dut_iface_id, vm_iface_id, injected_iface_id))
-            VMTopology.cmd("ovs-ofctl add-flow %s table=0,priority=8,ip,in_port=%s,nw_frag=yes,action=output:%s,%s" %
-                           (br_name, dut_iface_id, vm_iface_id, injected_iface_id))
-            VMTopology.cmd("ovs-ofctl add-flow %s table=0,priority=8,ipv6,in_port=%s,nw_frag=yes,action=output:%s,%s" %
-                           (br_name, dut_iface_id, vm_iface_id, injected_iface_id))
-            VMTopology.cmd("ovs-ofctl add-flow %s table=0,priority=8,icmp,in_port=%s,action=output:%s,%s" %
-                           (br_name, dut_iface_id, vm_iface_id, injected_iface_id))
-            VMTopology.cmd("ovs-ofctl add-flow %s table=0,priority=8,icmp6,in_port=%s,action=output:%s,%s" %
-                           (br_name, dut_iface_id, vm_iface_id, injected_iface_id))
-            VMTopology.cmd("ovs-ofctl add-flow %s table=0,priority=8,udp,in_port=%s,udp_src=161,action=output:%s,%s" %
-                           (br_name, dut_iface_id, vm_iface_id, injected_iface_id))
-            VMTopology.cmd("ovs-ofctl add-flow %s table=0,priority=8,udp,in_port=%s,udp_src=53,action=output:%s" %
-                           (br_name, dut_iface_id, vm_iface_id))
-            VMTopology.cmd("ovs-ofctl add-flow %s table=0,priority=8,udp6,in_port=%s,udp_src=161,action=output:%s,%s" %
-                           (br_name, dut_iface_id, vm_iface_id, injected_iface_id))
-            VMTopology.cmd("ovs-ofctl add-flow %s table=0,priority=5,ip,in_port=%s,action=output:%s" %
-                           (br_name, dut_iface_id, injected_iface_id))
-            VMTopology.cmd("ovs-ofctl add-flow %s table=0,priority=5,ipv6,in_port=%s,action=output:%s" %
-                           (br_name, dut_iface_id, injected_iface_id))
-            VMTopology.cmd("ovs-ofctl add-flow %s table=0,priority=3,in_port=%s,action=output:%s,%s" %
-                           (br_name, dut_iface_id, vm_iface_id, injected_iface_id))
+            vm_and_ptf = (dut_iface_id, vm_iface_id, injected_iface_id)
+            flows.extend([
+                "table=0,priority=10,tcp,in_port=%s,tp_src=179,action=output:%s,%s" % vm_and_ptf,
+                "table=0,priority=10,tcp,in_port=%s,tp_dst=179,action=output:%s,%s" % vm_and_ptf,
+                "table=0,priority=10,tcp6,in_port=%s,tp_src=179,action=output:%s,%s" % vm_and_ptf,
+                "table=0,priority=10,tcp6,in_port=%s,tp_dst=179,action=output:%s,%s" % vm_and_ptf,
+                "table=0,priority=10,ip,in_port=%s,nw_proto=4,action=output:%s,%s" % vm_and_ptf,
+                "table=0,priority=8,ip,in_port=%s,nw_frag=yes,action=output:%s,%s" % vm_and_ptf,
+                "table=0,priority=8,ipv6,in_port=%s,nw_frag=yes,action=output:%s,%s" % vm_and_ptf,
+                "table=0,priority=8,icmp,in_port=%s,action=output:%s,%s" % vm_and_ptf,
+                "table=0,priority=8,icmp6,in_port=%s,action=output:%s,%s" % vm_and_ptf,
+                "table=0,priority=8,udp,in_port=%s,udp_src=161,action=output:%s,%s" % vm_and_ptf,
+                "table=0,priority=8,udp,in_port=%s,udp_src=53,action=output:%s" % (dut_iface_id, vm_iface_id),
+                "table=0,priority=8,udp6,in_port=%s,udp_src=161,action=output:%s,%s" % vm_and_ptf,
+                "table=0,priority=5,ip,in_port=%s,action=output:%s" % (dut_iface_id, injected_iface_id),
+                "table=0,priority=5,ipv6,in_port=%s,action=output:%s" % (dut_iface_id, injected_iface_id),
+                "table=0,priority=3,in_port=%s,action=output:%s,%s" % vm_and_ptf,
+            ])
 
         # Add flow from a ptf container to an external iface
-        VMTopology.cmd("ovs-ofctl add-flow %s table=0,in_port=%s,action=output:%s" %
-                       (br_name, injected_iface_id, dut_iface_id))
+        flows.append("table=0,in_port=%s,action=output:%s" % (injected_iface_id, dut_iface_id))
+        return flows
 
     def unbind_ovs_ports(self, br_name, vm_port):
         """unbind all ports except the vm port from an ovs bridge"""
@@ -1313,6 +1401,24 @@ class VMTopology(object):
             cmdline = 'ifconfig -a %s' % intf
         return cmdline
 
+    @staticmethod
+    def _intf_exists_in_kernel(intf, pid=None, netns=None):
+        """Check if the specified interface exists by reading interface list from kernel, without running a command.
+
+        Returns:
+            bool or None: True or False. None if the interface list cannot be read, a command is required.
+        """
+        if pid:
+            try:
+                # /proc/<pid>/net is the view of the network namespace of the pid
+                with open('/proc/%s/net/dev' % pid) as f:
+                    return intf in [line.split(':', 1)[0].strip() for line in f.readlines()[2:]]
+            except (IOError, OSError):
+                return None
+        elif netns:
+            return None
+        return os.path.exists('/sys/class/net/%s' % intf)
+
     @staticmethod
     def intf_exists(intf, pid=None, netns=None):
         """Check if the specified interface exists.
@@ -1323,6 +1429,7 @@ class VMTopology(object):
         If a netns is specified, this command is executed in the specified network namespace. The specified network
         namespace is not a docker container. It is a network namespace created using the "ip netns" command.
         The both pip and netns arguments are specified, the pid argument takes precedence.
+        The command is not run if the interfaces can be read from /sys/class/net or /proc/<pid>/net/dev.
 
         Args:
             intf (str): Name of the interface.
@@ -1332,6 +1439,10 @@ class VMTopology(object):
         Returns:
             bool: True if the interface exists. Otherwise False.
         """
+        exists = VMTopology._intf_exists_in_kernel(intf, pid=pid, netns=netns)
+        if exists is not None:
+            return exists
+
         cmdline = VMTopology._intf_cmd(intf, pid=pid, netns=netns)
 
         try:
@@ -1350,6 +1461,7 @@ class VMTopology(object):
         If a netns is specified, this command is executed in the specified network namespace. The specified network
         namespace is not a docker container. It is a network namespace created using the "ip netns" command.
         The both pip and netns arguments are specified, the pid argument takes precedence.
+        The command is not run if the interfaces can be read from /sys/class/net or /proc/<pid>/net/dev.
 
         Args:
             intf (str): Name of the interface.
@@ -1359,6 +1471,10 @@ class VMTopology(object):
         Returns:
             bool: True if the interface does not exist. Otherwise False.
         """
+        exists = VMTopology._intf_exists_in_kernel(intf, pid=pid, netns=netns)
+        if exists is not None:
+            return not exists
+
         cmdline = VMTopology._intf_cmd(intf, pid=pid, netns=netns)
 
         try:
@@ -1392,7 +1508,8 @@ class VMTopology(object):
             return VMTopology.cmd('nsenter -t %s -n ethtool -K %s tx off' % (pid, iface_name))
 
     @staticmethod
-    def cmd(cmdline, grep_cmd=None, retry=1, negative=False, shell=False, split_cmd=True, ignore_errors=False):
+    def cmd(cmdline, grep_cmd=None, retry=1, negative=False, shell=False, split_cmd=True, ignore_errors=False,
+            input_data=None):
         """Execute a command and return the output
 
         Args:
@@ -1401,6 +1518,7 @@ class VMTopology(object):
             retry (int, optional): Max number of retry if command result is unexpected. Defaults to 1.
             negative (bool, optional): If negative is True, expect the command to fail. Defaults to False.
             ignore_errors (bool, optional): If ignore_errors is True, return the output even if the command fails.
+            input_data (str, optional): Data sent to stdin of the command. Not supported with grep_cmd.
 
         Raises:
             Exception: If command result is unexpected after max number of retries, raise an exception.
@@ -1434,7 +1552,7 @@ class VMTopology(object):
                 out, err = process_grep.communicate()
                 ret_code = process_grep.returncode
             else:
-                out, err = process.communicate()
+                out, err = process.communicate(input_data.encode('utf-8') if input_data is not None else None)
                 ret_code = process.returncode
             out, err = out.decode('utf-8'), err.decode('utf-8')
 
@@ -1510,6 +1628,105 @@ class VMTopology(object):
         # Flow reaches here when vlan_iface not present in result
         raise Exception("Can't find vlan_iface_id")
 
+    @staticmethod
+    def get_ovs_port_to_bridge():
+        """Get the bridge of all the ovs ports with a single 'ovs-vsctl show' command.
+
+        Returns:
+            dict: Key is port name, value is name of the bridge the port is on.
+        """
+        out = VMTopology.cmd('ovs-vsctl show')
+        port_to_br = {}
+        bridge = None
+        for line in out.split('\n'):
+            # Names are quoted by some ovs versions
+            fields = line.strip().split(None, 1)
+            if len(fields) != 2:
+                continue
+            indent = len(line) - len(line.lstrip())
+            name = fields[1].strip('"')
+            if fields[0] == 'Bridge' and indent == 4:
+                bridge = name
+            elif fields[0] == 'Port' and indent == 8 and bridge is not None:
+                port_to_br[name] = bridge
+        return port_to_br
+
+    @staticmethod
+    def get_ovs_ofports(vlan_iface=[]):
+        """Get the openflow port numbers of all the ovs interfaces with a single 'ovs-vsctl' command.
+
+        Args:
+            vlan_iface (list): Interfaces to wait for. Vlan interface addition may take few secs to reflect in OVS.
+
+        Returns:
+            dict: Key is interface name, value is openflow port number.
+        """
+        for retries in range(RETRIES):
+            out = VMTopology.cmd(
+                'ovs-vsctl --format=csv --data=bare --no-headings --columns=name,ofport list Interface')
+            result = {}
+            for row in csv.reader(out.splitlines()):
+                if len(row) == 2 and row[1].isdigit():
+                    result[row[0]] = row[1]
+            if all([intf in result for intf in vlan_iface]):
+                return result
+            time.sleep(2*retries+1)
+        # Flow reaches here when vlan_iface not present in result
+        raise Exception("Can't find vlan_iface_id")
+
+    @staticmethod
+    def ovs_vsctl_transaction(commands):
+        """Run ovs-vsctl commands in a single transaction.
+
+        Args:
+            commands (list): List of ovs-vsctl commands with arguments, like 'add-port br0 eth0'.
+        """
+        if commands:
+            VMTopology.cmd('ovs-vsctl ' + ' '.join('-- ' + command for command in commands))
+
+    @staticmethod
+    def ovs_replace_flows(br_name, flows):
+        """Replace all the flows of an ovs bridge.
+
+        Args:
+            br_name (str): Name of the ovs bridge.
+            flows (list): List of flows in ovs-ofctl add-flow format.
+        """
+        # Tag the flows with a cookie derived from all of them, to tell whether the flows need to be updated later
+        cookie = VMTopology.flows_cookie(flows)
+        # clear old bindings
+        VMTopology.cmd('ovs-ofctl del-flows %s' % br_name)
+        VMTopology.cmd('ovs-ofctl add-flows %s -' % br_name,
+                       input_data=''.join('cookie=%#x,%s\n' % (cookie, flow) for flow in flows))
+
+    @staticmethod
+    def flows_cookie(flows):
+        """Get the openflow cookie identifying a list of flows."""
+        return int(hashlib.md5('\n'.join(flows).encode('utf-8')).hexdigest()[:15], 16)
+
+    @staticmethod
+    def get_ovs_flow_cookies(br_name):
+        """Get cookies of all the flows of an ovs bridge.
+
+        Returns:
+            list: Cookie of each flow.
+        """
+        out = VMTopology.cmd('ovs-ofctl dump-flows %s' % br_name, ignore_errors=True)
+        return [int(cookie, 16) for cookie in re.findall(r'^\s*cookie=(0x[0-9a-fA-F]+),', out, re.MULTILINE)]
+
+    @staticmethod
+    def read_sysfs_net(intf, attr):
+        """Read an attribute of a host interface from sysfs, like operstate and mtu.
+
+        Returns:
+            str or None: The attribute value, None if it cannot be read.
+        """
+        try:
+            with open('/sys/class/net/%s/%s' % (intf, attr)) as f:
+                return f.read().strip()
+        except (IOError, OSError):
+            return None
+
     @staticmethod
     def get_pid(ptf_name):
         cli = docker.from_env()
@@ -1711,7 +1928,8 @@ def main():
             fp_mtu=dict(required=False, type='int', default=DEFAULT_MTU),
             max_fp_num=dict(required=False, type='int',
                             default=NUM_FP_VLANS_PER_FP),
-            netns_mgmt_ip_addr=dict(required=False, type='str', default=None)
+            netns_mgmt_ip_addr=dict(required=False, type='str', default=None),
+            reconcile=dict(required=False, type='bool', default=False)
         ),
         supports_check_mode=False)
 
@@ -1721,6 +1939,7 @@ def main():
     fp_mtu = module.params['fp_mtu']
     max_fp_num = module.params['max_fp_num']
     vm_properties = module.params['vm_properties']
+    reconcile = module.params['reconcile']
 
     config_module_logging(construct_log_filename(cmd, vm_set_name))
 
@@ -1730,7 +1949,7 @@ def main():
     try:
 
         topo = module.params['topo']
-        net = VMTopology(vm_names, vm_properties, fp_mtu, max_fp_num, topo)
+        net = VMTopology(vm_names, vm_properties, fp_mtu, max_fp_num, topo, reconcile=reconcile)
 
         if cmd == 'create':
             net.create_bridges()
@@ -1932,7 +2151,9 @@ def main():
                 net.delete_network_namespace()
 
             if vms_exists:
-                net.unbind_fp_ports()
+                if not reconcile:
+                    # In reconcile mode, ports left on the bridges are fixed by bind_fp_ports
+                    net.unbind_fp_ports()
                 net.add_injected_fp_ports_to_docker()
                 net.bind_fp_ports()
                 net.add_bp_port_to_docker(ptf_bp_ip_addr, ptf_bp_ipv6_addr)
@@ -55,6 +55,7 @@ function usage
   echo "    Optional argument for add-topo:"
   echo "        -e ptf_imagetag=<tag>    # Use PTF image with specified tag for creating PTF container"
   echo "        -e disable_updategraph=<true|false>    # Disable updategraph service when deploying testbed"
+  echo "        -e vm_topology_reconcile=true    # Only fix VM front panel bridges and PTF ports not in desired state"
   echo "To deploy topology with the help of the last cached deployed topology for the specified testbed on a server:"
   echo "        $0 deploy-topo-with-cache 'testbed-name' 'inventory' ~/.password"
   echo "To remove topology for specified testbed on a server: $0 remove-topo 'testbed-name' ~/.password"
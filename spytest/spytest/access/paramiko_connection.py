@@ -3,6 +3,7 @@ import os
 import re
 import time
 import socket
+import select
 import logging
 
 import telnetlib
@@ -53,6 +54,36 @@ def dtrace(*args):
         print(args)
 
 
+class ExpectStats(object):
+    """Time to prompt and throughput of the commands run on a connection."""
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.count, self.timeouts = 0, 0
+        self.nbytes, self.elapsed = 0, 0.0
+        self.slowest, self.last = None, None
+
+    def add(self, command, nbytes, elapsed, matched):
+        rate = int(nbytes / elapsed) if elapsed > 0 else 0
+        self.last = {"command": command, "bytes": nbytes, "time_to_prompt": round(elapsed, 3),
+                     "bytes_per_sec": rate, "matched": matched}
+        self.count += 1
+        if not matched:
+            self.timeouts += 1
+        self.nbytes += nbytes
+        self.elapsed += elapsed
+        if matched and (self.slowest is None or elapsed > self.slowest["time_to_prompt"]):
+            self.slowest = self.last
+        return self.last
+
+    def summary(self):
+        rate = int(self.nbytes / self.elapsed) if self.elapsed > 0 else 0
+        return {"count": self.count, "timeouts": self.timeouts, "bytes": self.nbytes,
+                "time": round(self.elapsed, 3), "bytes_per_sec": rate, "slowest": self.slowest}
+
+
 class ParamikoConnection:
 
     def __init__(self, **kwargs):
@@ -351,6 +382,9 @@ class ParamikoConnection:
                                  delay_factor, max_loops, auto_find_prompt,
                                  strip_prompt, **kwargs)
 
+    def get_expect_stats(self):
+        return self.conn.get_expect_stats()
+
     def dmsg_fmt(self, data, nl="\n"):
         msg = ctrl_chars.tostring(data)
         msg = msg.replace("\n", "<LF>")
@@ -454,7 +488,11 @@ class DeviceConnection:
                                                 use_cache=use_cache, wait_time=wait_time)
         return "{}\n{}".format(output, prompt)
 
+    def get_expect_stats(self):
+        return self.conn.stats.summary()
+
     def close(self):
+        self.log("STATS: ", self.get_expect_stats())
         self.conn.close()
 
     def disconnect(self):
@@ -527,6 +565,12 @@ class BaseConnection(object):
     TELNET = "telnet"
 
     ANSI_ESCAPE_REGEX = re.compile(r'\x1B(?:[@-Z\\-_]|\[[0-?]*[ -/]*[@-~])')
+    IGNORE_REGEX = re.compile(r"\[.*\]\s*serial\d+: too much work for irq\d+")
+
+    # max time to block waiting for data in expect, before checking the deadline again
+    EXPECT_WAIT_MAX = 1.0
+    # max size of the received data searched again for prompt when new data arrives
+    EXPECT_MAX_WINDOW = 65536
 
     def __init__(self, device, ip_addr, port, timeout):
         self.device = device
@@ -536,6 +580,7 @@ class BaseConnection(object):
         self.last_prompt = ''
         self.enter_char = '\n'
         self.cached_read_data = []
+        self.stats = ExpectStats()
 
     def add_cached_read_data(self, output):
         if output: self.cached_read_data.append(output)
@@ -589,14 +634,15 @@ class BaseConnection(object):
     def recv_flush(self):
         return None
 
+    def wait_recv(self, timeout):
+        time.sleep(float(1.0 / 200))
+
     def decode_recv(self, data):
-        ignore_patterns = [r"\[.*\]\s*serial\d+: too much work for irq\d+"]
         if data:
             data = data.decode("utf-8", "ignore")
             data = data.replace('\r', '')
             data = data.replace('\x1bE', '')
-            for pattern in ignore_patterns:
-                data = re.sub(pattern, '', data)
+            data = self.IGNORE_REGEX.sub('', data)
             mylog.verbose("REMOVE-ME: decode_recv: {}".format(data))
         else:
             data = ""
@@ -614,7 +660,6 @@ class BaseConnection(object):
             exp_list = [exp_list]
 
         indices = range(len(exp_list))
-        cooked, text = '', ''
         num_match = 1
         first_line_found = False
         first_line_trace = False
@@ -627,23 +672,28 @@ class BaseConnection(object):
             if exp_list[i].search(send_str):
                 num_match = 2
 
-        deadline = _time() + timeout
-        poll_time = float(1.0 / 200)
+        # the received text is kept as chunks already searched followed by the tail,
+        # only the tail is searched again for the patterns when new data arrives
+        window = max([len(exp.pattern) for exp in exp_list] + [1])
+        chunks, tail, pos, cooked = [], '', 0, ''
+        nbytes, start = 0, _time()
+        deadline = start + timeout
 
         while True:
             data = self.recv()
             if not data:
-                time.sleep(poll_time)
-                if self.check_timeout(timeout, deadline):
+                remaining = deadline - _time()
+                if remaining < 0:
                     break
-                else:
-                    continue
+                self.wait_recv(min(remaining, self.EXPECT_WAIT_MAX))
+                continue
 
-            text += data
+            nbytes += len(data)
+            tail += data
 
             if skip_first_line and not first_line_found:
-                if '\n' in text:
-                    text = '\n' + text.split('\n', 1)[1]
+                if '\n' in tail:
+                    tail = '\n' + tail.split('\n', 1)[1]
                     first_line_found = True
                 else:
                     continue
@@ -659,19 +709,42 @@ class BaseConnection(object):
 
                 mylog.recv(self.device, decoded_data)
 
+            consumed = False
             for i in indices:
-                m = exp_list[i].search(text)
+                m = exp_list[i].search(tail, pos)
                 if m:
                     num_match = num_match - 1
-                    cooked = text[:m.end()]
-                    text = text[m.end():]
                     if num_match == 0:
-                        return i, m, cooked + text
+                        self.add_expect_stats(send_str, nbytes, start, True)
+                        return i, m, "".join(chunks) + tail
+                    cooked = "".join(chunks) + tail[:m.end()]
+                    chunks, tail, pos = [], tail[m.end():], 0
+                    consumed = True
+
+            if not consumed and len(tail) > window:
+                # move the text that can no longer be part of a new match into chunks,
+                # keeping one character before the window so that ^ and lookbehind
+                # patterns see the same context as when searching the whole text
+                cut = tail.rfind('\n', 0, len(tail) - window)
+                if cut < 0 and len(tail) > self.EXPECT_MAX_WINDOW:
+                    cut = len(tail) - self.EXPECT_MAX_WINDOW
+                if cut > 1:
+                    chunks.append(tail[:cut - 1])
+                    tail, pos = tail[cut - 1:], 1
 
             if self.check_timeout(timeout, deadline):
                 break
 
-        return -1, None, cooked + text
+        self.add_expect_stats(send_str, nbytes, start, False)
+        return -1, None, cooked + "".join(chunks) + tail
+
+    def add_expect_stats(self, send_str, nbytes, start, matched):
+        stats = self.stats.add(send_str, nbytes, _time() - start, matched)
+        mylog.verbose("expect stats: {}".format(stats))
+        trace("expect stats %s: %s", self.ip_addr, stats)
+
+    def get_expect_stats(self):
+        return self.stats.summary()
 
     def decode_string(self, string):
         try: string = string.decode("ascii", "ignore")
@@ -824,6 +897,9 @@ class TelnetConnection(BaseConnection):
         else:
             self.__telnet.write(send_str.encode('ascii'))
 
+    def wait_recv(self, timeout):
+        select.select([self.__telnet.get_socket()], [], [], timeout)
+
     def recv(self):
         data = self.__telnet.read_very_eager()
         data = self.decode_recv(data)
@@ -865,10 +941,10 @@ class SshConnection(BaseConnection):
         self.__ssh_channel.sendall(send_str)
 
     def recv(self):
-        data = b""
+        chunks = []
         while self.__ssh_channel.recv_ready():
-            data = data + self.__ssh_channel.recv(65533)
-        data = self.decode_recv(data)
+            chunks.append(self.__ssh_channel.recv(65533))
+        data = self.decode_recv(b"".join(chunks))
         self.add_cached_read_data(data)
         return data
 
@@ -876,6 +952,12 @@ class SshConnection(BaseConnection):
         while self.__ssh_channel.recv_ready():
             self.__ssh_channel.recv(65533)
 
+    def wait_recv(self, timeout):
+        # the channel stays readable once closed, wait with the default poll then
+        if self.__ssh_channel.closed or self.__ssh_channel.eof_received:
+            return super(SshConnection, self).wait_recv(timeout)
+        select.select([self.__ssh_channel], [], [], timeout)
+
     def get_file(self, remote_path, local_path):
         sftp = paramiko.SFTPClient.from_transport(self.__ssh.get_transport())
         try:
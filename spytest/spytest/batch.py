@@ -6,6 +6,7 @@ import psutil
 import socket
 import signal
 import logging
+import heapq
 from random import randint
 from random import Random
 from operator import itemgetter
@@ -65,6 +66,7 @@ def batch_init():
     wa.tclist_cache = {}
     wa.chip_coverate_history = {}
     wa.platform_coverate_history = {}
+    wa.module_time_history = {}
 
     # None disable backup/rerun nodes
     # 0 create same number of backup/rerun nodes
@@ -112,6 +114,27 @@ def load_coverage_history():
         tcmap.read_coverage_history(csv_file)
 
 
+def load_module_time_history():
+    # comma separated list of modules csv reports of previous runs, local paths or URLs
+    module_time_history = env.get("SPYTEST_BATCH_MODULE_TIME_HISTORY", "")
+    csv_files = []
+    for index, entry in enumerate(utils.csv2list(module_time_history)):
+        if not entry:
+            continue
+        if not os.path.exists(entry):
+            csv_file = os.path.join(wa.logs_path, "module_time_history_{}.csv".format(index))
+            try:
+                utils.download_url(entry, csv_file)
+            except Exception as exp:
+                warn("Failed to download module time history {}: {}".format(entry, exp))
+                continue
+            entry = csv_file
+        csv_files.append(entry)
+    wa.module_time_history = tcmap.read_module_time_history(csv_files)
+    if csv_files:
+        trace("Module time history: {} modules from {}".format(len(wa.module_time_history), csv_files))
+
+
 def init_type_nodes():
     node_types = ["one", "two", "three", "four"]
     backup_nodes = env.get("SPYTEST_BATCH_BACKUP_NODES")
@@ -542,6 +565,25 @@ class SpyTestScheduling(object):
         self.max_order = self.default_order
         self._load_buckets()
 
+        # longest processing time first: assign the longest module among the
+        # modules of same order, using the module time of previous runs.
+        # modules which can be executed by fewer nodes are still assigned first.
+        # without module time history the modules are assigned in collection order
+        self.lpt_support = bool(wa.module_time_history) and \
+            env.match("SPYTEST_BATCH_LPT_SCHEDULING", "1", "1")
+        self.module_time = {}
+        self.module_time_basenames = {}
+        for mname, secs in wa.module_time_history.items():
+            self.module_time_basenames.setdefault(os.path.basename(mname), secs)
+        self.default_module_time = env.getint("SPYTEST_BATCH_DEFAULT_MODULE_TIME", 0)
+        if not self.default_module_time:
+            # median of the known modules, used for modules without history
+            known = sorted(wa.module_time_history.values())
+            self.default_module_time = known[len(known) // 2] if known else 600
+        self.predicted_makespan = None
+        self.sched_start_time = None
+        self.sched_end_time = None
+
         self.test_spytest_infra_first = None
         self.test_spytest_infra_second = None
         self.test_spytest_infra_last = None
@@ -714,6 +756,16 @@ class SpyTestScheduling(object):
             md.default = True
         return md
 
+    def get_module_time(self, mname):
+        if mname not in self.module_time:
+            secs = wa.module_time_history.get(mname)
+            if secs is None:
+                secs = self.module_time_basenames.get(os.path.basename(mname))
+            if secs is None:
+                secs = self.default_module_time
+            self.module_time[mname] = secs
+        return self.module_time[mname]
+
     def add_nodeid(self, nodeid, action, modules):
         report(action, nodeid, "")
         nodeid2 = item_utils.map_nodeid(nodeid)
@@ -806,6 +858,8 @@ class SpyTestScheduling(object):
             debug("Collection: {} {} {}".format(mname, ",".join(minfo.nodes),
                   ",".join([str(i) for i in minfo.node_indexes])))
         self.collection_is_completed = True
+        self.sched_start_time = get_timenow()
+        self._predict_makespan()
 
         # start worker monitoring
         poll_time = env.getint("SPYTEST_BATCH_POLL_STATUS_TIME", "0")
@@ -976,8 +1030,40 @@ class SpyTestScheduling(object):
             trace("Modules: {} Functions: {} Tests: {}".format(mcount, fcount, tcount))
             trace("\n" + utils.sprint_vtable(header, rows))
 
+    def _predict_makespan(self):
+        # simulate the scheduling of main modules on main workers with the module times
+        workers = [worker.name for worker in wa.workers.values() if worker.node_type == "Main"]
+        modules = SpyTestDict(self.main_modules)
+        loads = {name: [0, 0] for name in workers}
+        free = [(0, name) for name in workers]
+        heapq.heapify(free)
+        while free:
+            start, name = heapq.heappop(free)
+            mname = self._pick_module(name, modules)[0]
+            if mname is None:
+                continue
+            del modules[mname]
+            secs = self.get_module_time(mname)
+            loads[name][0] += 1
+            loads[name][1] += secs
+            heapq.heappush(free, (start + secs, name))
+        self.predicted_makespan = max([load[1] for load in loads.values()] or [0])
+        header = ["Node", "Modules", "Predicted Time"]
+        rows = [[name, loads[name][0], utils.time_format(int(loads[name][1]))] for name in workers]
+        msg = "Predicted Makespan: {} LPT: {} Unassigned Modules: {}"
+        trace(msg.format(utils.time_format(int(self.predicted_makespan)), self.lpt_support, len(modules)))
+        trace("\n" + utils.sprint_vtable(header, rows))
+
+    def report_makespan(self):
+        if self.predicted_makespan is None or not self.sched_end_time:
+            return
+        actual = get_elapsed(self.sched_start_time, False, 0, self.sched_end_time)
+        msg = "Predicted Makespan: {} Actual Makespan: {}"
+        trace(msg.format(utils.time_format(int(self.predicted_makespan)), utils.time_format(actual)))
+
     def mark_test_complete(self, node, item_index, duration=0):
         wa.lock.acquire()
+        self.sched_end_time = get_timenow()
         name = get_gw_name(node.gateway)
         item_list = self.collection[item_index]
         if item_index in self.node_modules[node]:
@@ -1003,34 +1089,49 @@ class SpyTestScheduling(object):
                 return True
         return False
 
-    def _assign_test(self, node, modules=None):
-        name = get_gw_name(node.gateway)
-        worker = self.wa.workers[name]
-        modules = modules or self.main_modules
+    def _pick_module(self, name, modules):
         orders = list(range(0, self.max_order + 1))
         if env.match("SPYTEST_BATCH_ORDER_HIGH2LOW", "1", "1"):
             orders = reversed(orders)
         for order in orders:
+            picked, picked_md, picked_key = None, None, None
             for mname, minfo in modules.items():
                 if name not in minfo.nodes:
                     continue
                 md = self.get_module_data(mname, minfo.used_tpref)
                 if self.order_support and md.order != order:
                     continue
-                if self._assign_pretest(node):
-                    return True
-                del modules[mname]
-                self.node_modules[node].extend(minfo.node_indexes)
-                if self.test_spytest_infra_last is not None:
-                    if env.match("SPYTEST_BATCH_APPEND_INFRA_TEST", "1", "1"):
-                        self.node_modules[node].append(self.test_spytest_infra_last)
-                worker.assigned = worker.assigned + len(minfo.node_indexes)
-                debug("[{}]: ===== Assigned order:{} {} {}".format(name, md.order, mname, minfo.node_indexes))
-                for item_index in minfo.node_indexes:
-                    report("add", self.collection[item_index], name)
-                report("save", "", "")
-                return True
-        return False
+                if not self.lpt_support:
+                    return mname, md
+                # prefer the modules which can be executed by fewer nodes, then the longest
+                key = (-len(minfo.nodes), self.get_module_time(mname))
+                if picked is None or key > picked_key:
+                    picked, picked_md, picked_key = mname, md, key
+            if picked is not None:
+                return picked, picked_md
+        return None, None
+
+    def _assign_test(self, node, modules=None):
+        name = get_gw_name(node.gateway)
+        worker = self.wa.workers[name]
+        modules = modules or self.main_modules
+        mname, md = self._pick_module(name, modules)
+        if mname is None:
+            return False
+        if self._assign_pretest(node):
+            return True
+        minfo = modules.pop(mname)
+        self.node_modules[node].extend(minfo.node_indexes)
+        if self.test_spytest_infra_last is not None:
+            if env.match("SPYTEST_BATCH_APPEND_INFRA_TEST", "1", "1"):
+                self.node_modules[node].append(self.test_spytest_infra_last)
+        worker.assigned = worker.assigned + len(minfo.node_indexes)
+        msg = "[{}]: ===== Assigned order:{} {} {} time:{}"
+        debug(msg.format(name, md.order, mname, minfo.node_indexes, int(self.get_module_time(mname))))
+        for item_index in minfo.node_indexes:
+            report("add", self.collection[item_index], name)
+        report("save", "", "")
+        return True
 
     def _pending_count(self, worker, modules=None, dbg=False):
         count, modules = 0, modules or self.main_modules
@@ -1613,6 +1714,7 @@ def configure(config, logs_path, root_logs_path):
     wa.tcmap = dict()
     load_module_csv()
     load_coverage_history()
+    load_module_time_history()
     init_stdout(config, logs_path)
     dist.configure(config, logs_path, is_worker(), wa)
     create_dashboard()
@@ -1675,6 +1777,7 @@ def unconfigure(config):
         debug("============== batch unconfigure =====================")
         if wa.custom_scheduling and wa.sched:
             wa.sched._pending_count(None, dbg=True)
+            wa.sched.report_makespan()
     for line in utils.dump_connections("batch unconfig: "):
         trace(line)
     return retval
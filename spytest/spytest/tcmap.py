@@ -536,6 +536,41 @@ def read_coverage_history(csv_file):
     return chip_cov, platform_cov
 
 
+def read_module_time_history(csv_files):
+    """
+    read the module execution time from the modules csv reports of previous runs
+    returns dict of module name to the average execution time in seconds
+    """
+    total_secs, counts = {}, {}
+    for csv_file in csv_files:
+        if not os.path.exists(csv_file):
+            continue
+        cols, name_index, time_index = None, 0, -1
+        fd = open(csv_file, 'r')
+        for row in csv.reader(fd):
+            if not cols:
+                cols = row
+                for index, col in enumerate(cols):
+                    if col.endswith("Module Name"):
+                        name_index = index
+                    elif col == "Exec Time":
+                        time_index = index
+                if time_index < 0:
+                    break
+                continue
+            # skip the total row which does not have the module name
+            if len(row) <= time_index or not row[name_index]:
+                continue
+            secs = utils.time_parse(row[time_index])
+            if secs <= 0:
+                continue
+            module = row[name_index]
+            total_secs[module] = total_secs.get(module, 0) + secs
+            counts[module] = counts.get(module, 0) + 1
+        fd.close()
+    return {module: total_secs[module] / counts[module] for module in total_secs}
+
+
 def _print_msg(msg):
     print(msg)
 
@@ -6,10 +6,19 @@ in the data returned by recv. Instead, it delivers the VLAN TCI in a control
 message. Python 2.x doesn't have built-in support for recvmsg, so we have to
 use ctypes to call it. The recv function exported by this module reconstructs
 the VLAN tag if it was offloaded.
+
+The RxRing class exported by this module receives through a TPACKET_V3
+memory mapped ring instead, so that a whole block of frames is handed over
+per poll. The kernel reports the offloaded VLAN tag in the frame header,
+which is used to reconstruct the tag the same way as recv does.
 """
 
+import mmap
+import select
 import struct
 from ctypes import sizeof
+from ctypes import string_at
+from ctypes import addressof
 from ctypes import get_errno
 from ctypes import byref
 from ctypes import c_void_p
@@ -29,6 +38,12 @@ ETH_P_8021Q = 0x8100
 SOL_PACKET = 263
 PACKET_AUXDATA = 8
 TP_STATUS_VLAN_VALID = 1 << 4
+TP_STATUS_VLAN_TPID_VALID = 1 << 6
+TP_STATUS_KERNEL = 0
+TP_STATUS_USER = 1 << 0
+PACKET_RX_RING = 5
+PACKET_VERSION = 10
+TPACKET_V3 = 2
 
 class struct_iovec(Structure):
     _fields_ = [
@@ -47,6 +62,17 @@ class struct_msghdr(Structure):
         ("msg_flags", c_int),
     ]
 
+class struct_tpacket_req3(Structure):
+    _fields_ = [
+        ("tp_block_size", c_uint),
+        ("tp_block_nr", c_uint),
+        ("tp_frame_size", c_uint),
+        ("tp_frame_nr", c_uint),
+        ("tp_retire_blk_tov", c_uint),
+        ("tp_sizeof_priv", c_uint),
+        ("tp_feature_req_word", c_uint),
+    ]
+
 class struct_cmsghdr(Structure):
     _fields_ = [
         ("cmsg_len", c_size_t),
@@ -124,3 +150,79 @@ def recv(sk, bufsize):
         return buf.raw[:12] + tag + buf.raw[12:rv]
     else:
         return buf.raw[:rv]
+
+
+class RxRing(object):
+    """
+    TPACKET_V3 receive ring on an AF_PACKET socket
+    @sk Socket, must not be bound yet
+    @block_size Size of one ring block, power of 2 multiple of page size
+    @block_nr Number of blocks in the ring
+    @frame_size Largest frame expected
+    @timeout_ms Time after which the kernel retires a partially filled block
+    """
+    # struct tpacket_block_desc: version, offset_to_priv, tpacket_hdr_v1
+    # block_status, num_pkts, offset_to_first_pkt
+    block_hdr = struct.Struct("=IIIII")
+    # struct tpacket3_hdr: next_offset, sec, nsec, snaplen, len, status,
+    # mac, net, hv1.rxhash, hv1.vlan_tci, hv1.vlan_tpid
+    frame_hdr = struct.Struct("=IIIIIIHHIIH")
+
+    def __init__(self, sk, block_size=1 << 18, block_nr=64, frame_size=1 << 14, timeout_ms=10):
+        self.sk = sk
+        self.block_size = block_size
+        self.block_nr = block_nr
+        self.block_index = 0
+
+        sk.setsockopt(SOL_PACKET, PACKET_VERSION, TPACKET_V3)
+        req = struct_tpacket_req3()
+        req.tp_block_size = block_size
+        req.tp_block_nr = block_nr
+        req.tp_frame_size = frame_size
+        req.tp_frame_nr = (block_size * block_nr) // frame_size
+        req.tp_retire_blk_tov = timeout_ms
+        sk.setsockopt(SOL_PACKET, PACKET_RX_RING, string_at(addressof(req), sizeof(req)))
+        self.ring = mmap.mmap(sk.fileno(), block_size * block_nr,
+                              mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+        self.poll = select.poll()
+        self.poll.register(sk.fileno(), select.POLLIN | select.POLLERR)
+
+    def close(self):
+        try: self.ring.close()
+        except Exception: pass
+
+    def recv(self, timeout_ms=1000):
+        """
+        Receive all the frames in the next ready block
+        Returns empty list if no block is ready within the timeout
+        """
+        (ring, offset) = (self.ring, self.block_index * self.block_size)
+        status = self.block_hdr.unpack_from(ring, offset)[2]
+        if not status & TP_STATUS_USER:
+            self.poll.poll(timeout_ms)
+            status = self.block_hdr.unpack_from(ring, offset)[2]
+            if not status & TP_STATUS_USER:
+                return []
+
+        frames = []
+        (num_pkts, pkt_offset) = self.block_hdr.unpack_from(ring, offset)[3:5]
+        pkt_offset = offset + pkt_offset
+        for _ in range(num_pkts):
+            hdr = self.frame_hdr.unpack_from(ring, pkt_offset)
+            (next_offset, snaplen, tp_status, tp_mac, vlan_tci, vlan_tpid) = \
+                (hdr[0], hdr[3], hdr[5], hdr[6], hdr[9], hdr[10])
+            start = pkt_offset + tp_mac
+            data = ring[start:start + snaplen]
+            if vlan_tci != 0 or tp_status & TP_STATUS_VLAN_VALID:
+                # Insert VLAN tag
+                if not tp_status & TP_STATUS_VLAN_TPID_VALID:
+                    vlan_tpid = ETH_P_8021Q
+                tag = struct.pack("!HH", vlan_tpid, vlan_tci)
+                data = data[:12] + tag + data[12:]
+            frames.append(data)
+            pkt_offset = pkt_offset + next_offset
+
+        # hand the block back to the kernel
+        struct.pack_into("=I", ring, offset + 8, TP_STATUS_KERNEL)
+        self.block_index = (self.block_index + 1) % self.block_nr
+        return frames
@@ -8,6 +8,9 @@ from or_event import OrEvent
 from utils import Utils
 from logger import Logger
 
+# wall clock for TX scheduling, time.clock is CPU time on linux
+clock = getattr(time, "monotonic", time.time)
+
 def isLinkUp(intf, dbg = False):
     flags_path = "/sys/class/net/{}/operstate".format(intf)
     if os.path.isfile(flags_path):
@@ -97,10 +100,7 @@ class ScapyDriver(object):
         self.logger.debug("get-cap: {}".format(self.iface))
         retval = []
         for pkt in self.pkts_captured:
-            (data, hex_bytes) = (str(pkt), [])
-            for index in range(len(data)):
-                hex_bytes.append("%02X"% ord(data[index]))
-            retval.append(hex_bytes)
+            retval.append(["%02X" % byte for byte in bytearray(pkt)])
         return retval
 
     def rx_any_enable(self):
@@ -118,8 +118,8 @@ class ScapyDriver(object):
             # read packets
             while self.rx_any_enable():
                 try:
-                    packet = self.packet.readp(iface=self.iface)
-                    if packet:
+                    packets = self.packet.readp(iface=self.iface)
+                    for packet in packets or []:
                         self.handle_recv(None, packet)
                 except Exception as e:
                     if str(e) != "[Errno 100] Network is down":
@@ -150,11 +150,11 @@ class ScapyDriver(object):
             self.logger.debug("{} framesReceived: {}".format(self.iface, framesReceived))
         if pktlen > 1518:
             self.port.incrStat('oversizeFramesReceived')
-        for stream in self.port.track_streams:
-            if self.packet.match_stream(stream, packet):
-                stream.incrStat('framesReceived')
-                stream.incrStat('bytesReceived', pktlen)
-                break # no need to check in other streams
+        # TX inserts the stream signature before the CRC
+        stream = self.port.track_sids.get(packet[-12:-4]) if packet else None
+        if stream:
+            stream.incrStat('framesReceived')
+            stream.incrStat('bytesReceived', pktlen)
 
     def handle_capture(self, packet):
         self.pkts_captured.append(packet)
@@ -301,7 +301,7 @@ class ScapyDriver(object):
                     self.logger.debug(" start {} {}/{}".format(stream.stream_id, stream.enable, stream.enable2))
                 if stream.enable and stream.enable2:
                     pwa = self.packet.build_first(stream)
-                    pwa.tx_time = time.clock()
+                    pwa.tx_time = clock()
                     pwa_list.append(pwa)
                     sids[stream.stream_id] = 0
                     self.stop_ack_wait(stream.stream_id)
@@ -334,11 +334,16 @@ class ScapyDriver(object):
                 if not pwa.stream.enable or not pwa.stream.enable2:
                     continue
                 self.pwa_wait(pwa)
+                if pwa.template:
+                    pwa, sent = self.send_burst(pwa)
+                    tx_count = tx_count + sent
+                    if pwa: pwa_next_list.append(pwa)
+                    continue
                 try:
-                    send_start_time = time.clock()
+                    send_start_time = clock()
                     pkt = self.send_packet(pwa, pwa.stream.stream_id)
                     bytesSent = len(pkt)
-                    send_time = time.clock() - send_start_time
+                    send_time = clock() - send_start_time
 
                     # increment port counters
                     framesSent = self.port.incrStat('framesSent')
@@ -359,21 +364,54 @@ class ScapyDriver(object):
                     self.logger.log_exception(e, traceback.format_exc())
                     pwa.stream.enable2 = False
                 else:
-                    build_start_time = time.clock()
+                    build_start_time = clock()
                     pwa = self.packet.build_next(pwa)
                     if not pwa: continue
-                    build_time = time.clock() - build_start_time
+                    build_time = clock() - build_start_time
                     ipg = self.packet.build_ipg(pwa)
-                    pwa.tx_time = time.clock() + ipg - build_time - send_time
+                    pwa.tx_time = clock() + ipg - build_time - send_time
                     pwa_next_list.append(pwa)
             pwa_list = pwa_next_list
         self.logger.debug("txThreadMainInner {} Completed {}".format(self.iface, tx_count))
 
+    def send_burst(self, pwa):
+        # render all the frames that are due and hand them over in one go
+        (stream, frames, now, next_pwa) = (pwa.stream, [], clock(), pwa)
+        try:
+            while next_pwa and len(frames) < max(self.packet.tx_batch, 1):
+                frames.append(self.packet.render_frame(next_pwa))
+                next_pwa = self.packet.build_next(next_pwa)
+                if not next_pwa: break
+                # schedule on absolute time so that IPG does not drift
+                # but do not try to catch up after a long stall
+                tx_time = next_pwa.tx_time + self.packet.build_ipg(next_pwa)
+                next_pwa.tx_time = tx_time if tx_time > now - 1 else now
+                if next_pwa.tx_time > now: break
+            self.packet.send_frames(frames, self.iface, stream.stream_id, pwa.left)
+        except Exception as e:
+            self.logger.log_exception(e, traceback.format_exc())
+            stream.enable2 = False
+            return None, 0
+
+        # increment port and stream counters
+        bytesSent = sum([len(frame) for frame in frames])
+        framesSent = self.port.incrStat('framesSent', len(frames))
+        self.port.incrStat('bytesSent', bytesSent)
+        if self.dbg > 2:
+            self.logger.debug("{} framesSent: {}".format(self.iface, framesSent))
+        stream.incrStat('framesSent', len(frames))
+        stream.incrStat('bytesSent', bytesSent)
+        self.stream_pkts[stream.stream_id] = self.stream_pkts[stream.stream_id] + len(frames)
+        if self.dbg > 1:
+            self.logger.debug("{}/{} framesSent: {}".format(self.iface,
+                                stream.stream_id, self.stream_pkts[stream.stream_id]))
+        return next_pwa, len(frames)
+
     def pwa_sort(self, pwa):
         return pwa.tx_time
 
     def pwa_wait(self, pwa):
-        delay = pwa.tx_time - time.clock()
+        delay = pwa.tx_time - clock()
         if self.dbg > 2 or (self.dbg > 1 and pwa.left != 0):
             self.logger.debug("stream: {} delay: {} pps: {}".format(pwa.stream.stream_id, delay, pwa.rate_pps))
         if delay <= 0:
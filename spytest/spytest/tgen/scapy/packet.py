@@ -5,6 +5,7 @@ import zlib
 import time
 import copy
 import random
+import struct
 import textwrap
 import binascii
 import socket
@@ -120,6 +121,135 @@ stale_list_ignore = [
     "ipv6_dst_count",
 ]
 
+class TxField(object):
+    """
+    one varying header field of a TX template, tracked as an integer
+    and patched into the template bytes at a fixed offset
+    """
+    def __init__(self, offset, size, value, mask=0):
+        self.offset = offset
+        self.size = size
+        self.mask = mask
+        self.value = value
+        self.initial = value
+        self.step = 0
+        self.count = 0
+        self.index = 0
+        self.values = None
+        self.csums = []
+
+    def advance(self):
+        # same semantics as build_next_dma for increment/decrement/list
+        self.index = self.index + 1
+        if self.values:
+            if self.index >= len(self.values):
+                self.index = 0
+            self.value = self.values[self.index]
+        elif self.count > 0 and self.index >= self.count:
+            self.value = self.initial
+            self.index = 0
+        else:
+            self.value = (self.value + self.step) % (1 << (self.size * 8))
+            if self.mask: self.value = self.value & self.mask
+
+    def words(self, value):
+        return sum([(value >> (16 * i)) & 0xFFFF for i in range(self.size // 2)])
+
+class TxChecksum(object):
+    """
+    16 bit ones complement checksum kept up to date incrementally:
+    the base is the checksum sum with all the varying fields removed
+    """
+    def __init__(self, offset, value, zero=0):
+        self.offset = offset
+        self.base = (~value) & 0xFFFF
+        self.zero = zero
+
+    @staticmethod
+    def fold(value):
+        while value >> 16:
+            value = (value & 0xFFFF) + (value >> 16)
+        return value
+
+    def remove(self, words):
+        # ones complement subtraction of the original field words
+        self.base = self.fold(self.base + 0xFFFF * (words // 0xFFFF + 1) - words)
+
+    def compute(self, words):
+        value = (~self.fold(self.base + words)) & 0xFFFF
+        return value or self.zero
+
+class TxTemplate(object):
+    """
+    pre-rendered frame of a stream whose per packet changes are plain
+    field arithmetic, so that the next frame is produced by patching
+    bytes instead of mutating and re-serializing the scapy layers
+    """
+    def __init__(self, data, sid):
+        self.data = bytearray(data)
+        self.base_len = len(data)
+        # same signature as send_packet for streams without sid
+        self.sid = bytearray((sid or "DeadBeef").encode())
+        self.fields = []
+        self.csums = []
+        self.length_mode = "fixed"
+        self.frame_size = 0
+        self.frame_size_min = 0
+        self.frame_size_max = 0
+        self.frame_size_step = 0
+
+    def add_field(self, field):
+        self.fields.append(field)
+        for csum in field.csums:
+            csum.remove(field.words(field.value))
+            if csum not in self.csums:
+                self.csums.append(csum)
+
+    def set_length(self, length_mode, frame_size, frame_size_min, frame_size_max, frame_size_step):
+        self.length_mode = length_mode
+        self.frame_size_min = frame_size_min
+        self.frame_size_max = frame_size_max
+        self.frame_size_step = frame_size_step
+        self.frame_size = frame_size
+        # zero padding up to the largest frame, sliced as per frame size
+        padLen = int(frame_size_max - self.base_len - 4)
+        if padLen > 0:
+            self.data.extend(bytearray(padLen))
+
+    def advance(self):
+        for field in self.fields:
+            field.advance()
+        # same frame size selection as add_padding
+        if self.length_mode == "random":
+            self.frame_size = random.randrange(self.frame_size_min, self.frame_size_max+1)
+        elif self.length_mode in ["increment", "incr"]:
+            self.frame_size = self.frame_size + self.frame_size_step
+            if self.frame_size > self.frame_size_max:
+                self.frame_size = self.frame_size_min
+
+    def render(self, add_signature):
+        data = self.data
+        for field in self.fields:
+            (offset, size, value) = (field.offset, field.size, field.value)
+            if field.mask:
+                old = (data[offset] << 8) | data[offset+1]
+                value = (old & ~field.mask & 0xFFFF) | value
+            data[offset:offset+size] = binascii.unhexlify("%0*x" % (size * 2, value))
+        for csum in self.csums:
+            words = sum([field.words(field.value) for field in self.fields if csum in field.csums])
+            struct.pack_into("!H", data, csum.offset, csum.compute(words))
+
+        length = self.base_len
+        if self.length_mode != "fixed":
+            length = max(length, self.frame_size - 4)
+            if self.frame_size - 4 > self.base_len:
+                add_signature = True
+        frame = data[:length]
+        if add_signature:
+            frame[-len(self.sid):] = self.sid
+        crc = socket.htonl(zlib.crc32(bytes(frame)) & 0xFFFFFFFF)
+        return bytes(frame + struct.pack("!I", crc)), add_signature
+
 class ScapyPacket(object):
 
     def __init__(self, iface, dbg=0, dry=False, hex=False, logger=None):
@@ -130,6 +260,9 @@ class ScapyPacket(object):
         except Exception: self.logger.info("SCAPY VERSION = UNKNOWN")
         self.utils = Utils(self.dry, logger=self.logger)
         self.max_rate_pps = self.utils.get_env_int("SPYTEST_SCAPY_MAX_RATE_PPS", 100)
+        self.tx_template = self.utils.get_env_int("SPYTEST_SCAPY_TX_TEMPLATE", 1)
+        self.tx_batch = self.utils.get_env_int("SPYTEST_SCAPY_TX_BATCH", 64)
+        self.rx_ring_enable = self.utils.get_env_int("SPYTEST_SCAPY_RX_RING", 1)
         self.dbg = dbg
         self.show_summary = bool(self.dbg > 2)
         self.hex = hex
@@ -138,7 +271,9 @@ class ScapyPacket(object):
         self.tx_count = 0
         self.rx_count = 0
         self.rx_sock = None
+        self.rx_ring = None
         self.tx_sock = None
+        self.tx_raw_sock = None
         self.finished = False
         self.exabgp_nslist = []
         self.cleanup()
@@ -225,8 +360,10 @@ class ScapyPacket(object):
         self.logger.info("ScapyPacket {} cleanup...".format(self.iface))
         self.exabgpd_stop_all()
         self.finished = True
+        self.rx_ring = self.close_sock(self.rx_ring)
         self.rx_sock = self.close_sock(self.rx_sock)
         self.tx_sock = self.close_sock(self.tx_sock)
+        self.tx_raw_sock = self.close_sock(self.tx_raw_sock)
         self.init_bridge(self.iface)
         self.finished = False
 
@@ -234,7 +371,13 @@ class ScapyPacket(object):
         if not self.iface or self.dry: return
         ETH_P_ALL = 3
         self.rx_sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW, socket.htons(ETH_P_ALL))
-        self.rx_sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 12 * 1024)
+        if self.rx_ring_enable:
+            try:
+                self.rx_ring = afpacket.RxRing(self.rx_sock)
+            except Exception as exp:
+                self.logger.info("Failed to create RX ring {} {}".format(self.iface, exp))
+        if not self.rx_ring:
+            self.rx_sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 12 * 1024)
         self.rx_sock.bind((self.iface+"-rx", 3))
         afpacket.enable_auxdata(self.rx_sock)
 
@@ -252,24 +395,28 @@ class ScapyPacket(object):
             return None
 
         try:
-            data = afpacket.recv(self.rx_sock, 12 * 1024)
+            if self.rx_ring:
+                frames = self.rx_ring.recv()
+            else:
+                frames = [afpacket.recv(self.rx_sock, 12 * 1024)]
         except Exception as exp:
             if self.finished:
                 return None
             raise exp
-        packet = Ether(data)
-        self.rx_count = self.rx_count + 1
+        self.rx_count = self.rx_count + len(frames)
         self.trace_stats()
 
+        # frames are returned raw, decode only for tracing
         if self.dbg > 1:
-            cmd = "" if not self.show_summary else packet.command()
-            msg = "readp:{} len:{} count:{} {}".format
-            self.logger.debug(msg(iface, len(data), self.rx_count, cmd))
-
-        if self.dbg > 2:
-            self.trace_packet(packet, self.hex)
+            for data in frames:
+                packet = Ether(data)
+                cmd = "" if not self.show_summary else packet.command()
+                msg = "readp:{} len:{} count:{} {}".format
+                self.logger.debug(msg(iface, len(data), self.rx_count, cmd))
+                if self.dbg > 2:
+                    self.trace_packet(packet, self.hex)
 
-        return packet
+        return frames
 
     def sendp(self, pkt, data, iface, stream_name, left):
         self.tx_count = self.tx_count + 1
@@ -299,6 +446,40 @@ class ScapyPacket(object):
                 self.logger.debug("Failed to send legacy {} {}".format(iface, exp))
                 if self.is_vde: self.os_system("ip link set dev {0} up".format(iface))
 
+    def send_frames(self, frames, iface, stream_name, left):
+        self.tx_count = self.tx_count + len(frames)
+        self.trace_stats()
+
+        if self.dbg > 1:
+            msg = "send_frames:{}:{} frames:{} count:{}".format
+            self.logger.debug(msg(iface, stream_name, len(frames), self.tx_count))
+
+        if self.dry:
+            return
+
+        if not self.tx_raw_sock:
+            try:
+                self.tx_raw_sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW)
+                self.tx_raw_sock.bind((iface, 0))
+            except Exception as exp:
+                self.tx_raw_sock = self.close_sock(self.tx_raw_sock)
+                self.logger.debug("Failed to create raw socket {} {}".format(iface, exp))
+
+        # plain send per frame on a raw socket is cheaper than marshalling
+        # a sendmmsg vector through ctypes, so batch only the scheduling
+        if self.tx_raw_sock:
+            try: return sum([self.tx_raw_sock.send(frame) for frame in frames])
+            except Exception as exp:
+                self.logger.debug("Failed to send batch {} {}".format(iface, exp))
+                self.tx_raw_sock = self.close_sock(self.tx_raw_sock)
+        for frame in frames:
+            try:
+                sendp(frame, iface=iface, verbose=False)
+            except Exception as exp:
+                self.logger.debug("Failed to send legacy {} {}".format(iface, exp))
+                if self.is_vde: self.os_system("ip link set dev {0} up".format(iface))
+                break
+
     def trace_stats(self):
         #self.logger.debug("Name: {} RX: {} TX: {}".format(self.iface, self.rx_count, self.tx_count))
         pass
@@ -316,6 +497,10 @@ class ScapyPacket(object):
         if fields: self.show_pkt(pkt)
         if hex: hexdump(pkt)
 
+    def render_frame(self, pwa):
+        frame, pwa.add_signature = pwa.template.render(pwa.add_signature)
+        return frame
+
     def send_packet(self, pwa, iface, stream_name, left):
         if pwa.padding:
             strpkt = str(pwa.pkt/pwa.padding)
@@ -767,6 +952,7 @@ class ScapyPacket(object):
         pwa.frame_size_max = frame_size_max
         pwa.frame_size_step = frame_size_step
         self.add_padding(pwa, True)
+        pwa.template = self.build_template(pwa)
 
         return pwa
 
@@ -796,6 +982,11 @@ class ScapyPacket(object):
 
     def build_next_dma(self, pwa):
 
+        # patch the pre-rendered frame when the stream has a template
+        if pwa.template:
+            pwa.template.advance()
+            return pwa
+
         # Change Ether SRC MAC
         mac_src_mode  = pwa.stream.kws.get("mac_src_mode", "fixed").strip()
         mac_src_step  = pwa.stream.kws.get("mac_src_step", "00:00:00:00:00:01")
@@ -985,9 +1176,9 @@ class ScapyPacket(object):
             tcp_dst_port_count  = self.utils.intval(pwa.stream.kws, "tcp_dst_port_count", 0)
             if tcp_dst_port_mode in ["increment", "decrement", "incr", "decr"]:
                 if tcp_dst_port_mode in ["increment", "incr"]:
-                    pwa.pkt[TCP].dport = pwa.pkt[TCP].sport + tcp_dst_port_step
+                    pwa.pkt[TCP].dport = pwa.pkt[TCP].dport + tcp_dst_port_step
                 else:
-                    pwa.pkt[TCP].dport = pwa.pkt[TCP].sport - tcp_dst_port_step
+                    pwa.pkt[TCP].dport = pwa.pkt[TCP].dport - tcp_dst_port_step
                 pwa.tcp_dst_port_count = pwa.tcp_dst_port_count + 1
                 if tcp_dst_port_count > 0 and pwa.tcp_dst_port_count >= tcp_dst_port_count:
                     pwa.pkt[TCP].dport = self.utils.intval(pwa.stream.kws, "tcp_dst_port", 0)
@@ -1019,9 +1210,9 @@ class ScapyPacket(object):
             udp_dst_port_count  = self.utils.intval(pwa.stream.kws, "udp_dst_port_count", 0)
             if udp_dst_port_mode in ["increment", "decrement", "incr", "decr"]:
                 if udp_dst_port_mode in ["increment", "incr"]:
-                    pwa.pkt[UDP].dport = pwa.pkt[UDP].sport + udp_dst_port_step
+                    pwa.pkt[UDP].dport = pwa.pkt[UDP].dport + udp_dst_port_step
                 else:
-                    pwa.pkt[UDP].dport = pwa.pkt[UDP].sport - udp_dst_port_step
+                    pwa.pkt[UDP].dport = pwa.pkt[UDP].dport - udp_dst_port_step
                 pwa.udp_dst_port_count = pwa.udp_dst_port_count + 1
                 if udp_dst_port_count > 0 and pwa.udp_dst_port_count >= udp_dst_port_count:
                     pwa.pkt[UDP].dport = self.utils.intval(pwa.stream.kws, "udp_dst_port", 0)
@@ -1034,6 +1225,107 @@ class ScapyPacket(object):
 
         return pwa
 
+    def template_field(self, template, kws, name, offset, size, kind, mask=0):
+        mode = kws.get("{}_mode".format(name), "fixed").strip()
+        if mode == "fixed":
+            return True
+        if kind == "port":
+            increment, decrement = ["increment", "incr"], ["decrement", "decr"]
+        else:
+            increment, decrement = ["increment"], ["decrement"]
+        if mode not in increment + decrement + ["list"]:
+            return False
+        if mode == "list" and name not in ["mac_src", "mac_dst"]:
+            return False
+
+        value = int(binascii.hexlify(bytes(template.data[offset:offset+size])), 16)
+        field = TxField(offset, size, value & mask if mask else value, mask)
+        if mode == "list":
+            field.values = [int(mac.replace(":", ""), 16) for mac in kws[name]]
+            field.value = field.initial = field.values[0]
+        else:
+            step = kws.get("{}_step".format(name), None)
+            if kind == "mac":
+                step = int((step or "00:00:00:00:00:01").replace(":", "").replace(".", ""), 16)
+            elif kind == "ipv4":
+                step = struct.unpack("!I", socket.inet_aton(step or "0.0.0.1"))[0]
+            elif kind == "ipv6":
+                step = self.utils.ipv6_ip2long(step or "::1")
+            else:
+                step = int(step or 1)
+            field.step = step if mode in increment else -step
+            field.count = self.utils.intval(kws, "{}_count".format(name), 0)
+        return field
+
+    def build_template(self, pwa):
+        if not self.tx_template or self.dbg > 1:
+            return None
+
+        pkt = pwa.pkt
+        data = bytes(pkt)
+        offsets = {}
+        for layer in [ARP, Dot1Q, IP, IPv6, TCP, UDP]:
+            if layer in pkt:
+                offsets[layer] = len(data) - len(bytes(pkt[layer]))
+        template = TxTemplate(data, pwa.stream.get_sid())
+
+        # checksums covering the varying fields
+        (ip_csum, l4_csum) = (None, None)
+        if IP in pkt:
+            offset = offsets[IP] + 10
+            ip_csum = TxChecksum(offset, struct.unpack_from("!H", data, offset)[0])
+        for layer, (csum_offset, zero) in [(TCP, (16, 0)), (UDP, (6, 0xFFFF))]:
+            if layer in pkt:
+                offset = offsets[layer] + csum_offset
+                value = struct.unpack_from("!H", data, offset)[0]
+                if value or layer != UDP:
+                    l4_csum = TxChecksum(offset, value, zero)
+                break
+        if l4_csum is None and IPv6 in pkt:
+            l4 = pkt[IPv6].payload
+            if l4.__class__.__name__.startswith("ICMPv6"):
+                offset = len(data) - len(bytes(l4)) + 2
+                l4_csum = TxChecksum(offset, struct.unpack_from("!H", data, offset)[0])
+        l4_csums = [l4_csum] if l4_csum else []
+
+        specs = [("mac_src", 6, 6, "mac", 0, []), ("mac_dst", 0, 6, "mac", 0, [])]
+        if ARP in pkt:
+            specs.append(("arp_src_hw", offsets[ARP] + 8, 6, "mac", 0, []))
+            specs.append(("arp_dst_hw", offsets[ARP] + 18, 6, "mac", 0, []))
+        if IP in pkt:
+            specs.append(("ip_src", offsets[IP] + 12, 4, "ipv4", 0, [ip_csum] + l4_csums))
+            specs.append(("ip_dst", offsets[IP] + 16, 4, "ipv4", 0, [ip_csum] + l4_csums))
+        if IPv6 in pkt:
+            specs.append(("ipv6_src", offsets[IPv6] + 8, 16, "ipv6", 0, l4_csums))
+            specs.append(("ipv6_dst", offsets[IPv6] + 24, 16, "ipv6", 0, l4_csums))
+        if Dot1Q in pkt:
+            specs.append(("vlan_id", offsets[Dot1Q], 2, "vlan", 0xFFF, []))
+        for layer, prefix in [(TCP, "tcp"), (UDP, "udp")]:
+            if layer in pkt:
+                specs.append(("{}_src_port".format(prefix), offsets[layer], 2, "port", 0, l4_csums))
+                specs.append(("{}_dst_port".format(prefix), offsets[layer] + 2, 2, "port", 0, l4_csums))
+
+        for name, offset, size, kind, mask, csums in specs:
+            field = self.template_field(template, pwa.stream.kws, name, offset, size, kind, mask)
+            if not field:
+                return None
+            if field is not True:
+                field.csums = csums
+                template.add_field(field)
+
+        if pwa.length_mode in ["random", "increment", "incr"]:
+            # first frame size is the one already picked by add_padding
+            frame_size = pwa.frame_size_current
+            if pwa.padding: frame_size = len(data) + len(pwa.padding) + 4
+            template.set_length(pwa.length_mode, frame_size, pwa.frame_size_min,
+                                pwa.frame_size_max, pwa.frame_size_step)
+        elif pwa.length_mode != "fixed":
+            return None
+
+        self.logger.debug("{}: using TX template for {} fields:{}".format(self.iface,
+                          pwa.stream.stream_id, len(template.fields)))
+        return template
+
     def build_next(self, pwa):
         if self.dbg > 2 or (self.dbg > 1 and pwa.left != 0):
             self.logger.debug("build_next {}/{} {} left={}".format(self.iface, pwa.stream.stream_id, pwa.transmit_mode, pwa.left))
@@ -1072,16 +1364,6 @@ class ScapyPacket(object):
         pps = self.utils.min_value(pwa.rate_pps, self.max_rate_pps)
         return (1.0 * pwa.pkts_per_burst)/float(pps)
 
-    def match_stream(self, stream, pkt):
-        sid = stream.get_sid()
-        if not sid: return False
-        strpkt = str(pkt)
-        if sid == strpkt[-12:-4]:
-            self.logger.debug("{}: CMP0: {} {}".format(self.iface, sid, strpkt[-12:-4]))
-            return True
-        #self.logger.debug("{}: CMP1: {} {}".format(self.iface, sid, strpkt[-12:-4]))
-        return False
-
     def if_delete_cmds(self, index, intf):
         ns = "{}_{}".format(intf.name, index)
 
@@ -38,17 +38,24 @@ class ScapyStream(object):
         #print("ScapyStream: {} {} {}".format(self.port, self.stream_id, kws))
         if self.track_port:
             self.track_port.track_streams.append(self)
+            self.track_port.track_sids.setdefault(self.get_sid_bytes(), self)
         self.stream_lock = threading.Lock()
 
     def __del__(self):
         print("ScapyStream {} exiting...".format(self.stream_id))
         if self.track_port:
             self.track_port.track_streams.remove(self)
+            if self.track_port.track_sids.get(self.get_sid_bytes()) is self:
+                self.track_port.track_sids.pop(self.get_sid_bytes())
 
     def get_sid(self):
         #if not self.track_port: return None
         return '{:08x}'.format((int(self.port)<<16) + (int(self.index)))
 
+    def get_sid_bytes(self):
+        # signature as it appears in the received frames
+        return self.get_sid().encode()
+
     def lock(self):
         self.stream_lock.acquire()
 
@@ -110,6 +117,7 @@ class ScapyPort(object):
         self.utils = Utils(self.dry, logger=self.logger)
         self.streams = SpyTestDict()
         self.track_streams = []
+        self.track_sids = dict()
         self.interfaces = SpyTestDict()
         self.stats = SpyTestDict()
         initStatistics(self.stats)
@@ -134,6 +142,7 @@ class ScapyPort(object):
             stream.track_port = None
             stream.unlock()
         self.track_streams = []
+        self.track_sids = dict()
 
     def cleanup(self):
         self.logger.debug("ScapyPort {} cleanup...".format(self.name))
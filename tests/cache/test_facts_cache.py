@@ -0,0 +1,130 @@
+import json
+import os
+import pickle
+
+import pytest
+
+from tests.common.cache import facts_cache
+from tests.common.cache.facts_cache import FactsCache
+from tests.common.helpers.assertions import pytest_assert
+
+pytestmark = [
+    pytest.mark.disable_loganalyzer,
+    pytest.mark.topology("any"),
+    pytest.mark.device_type("vs"),
+]
+
+FACTS_SIZE = 1000
+
+
+def _new_cache(cache_location, memory_limit=facts_cache.MEMORY_LIMIT):
+    """Create a FactsCache instance of its own, bypassing the singleton."""
+    return type.__call__(FactsCache, cache_location=cache_location, memory_limit=memory_limit)
+
+
+def _facts(name):
+    return {"name": name, "data": name[0] * FACTS_SIZE}
+
+
+@pytest.fixture
+def cache_location(tmpdir):
+    return str(tmpdir.join("_cache"))
+
+
+def test_facts_cache_lru_eviction(cache_location):
+    """Least recently used facts should be evicted from memory above the memory limit and read again from disk."""
+    facts_size = len(pickle.dumps(_facts("a"), pickle.HIGHEST_PROTOCOL))
+    cache = _new_cache(cache_location, memory_limit=facts_size * 2)
+
+    for key in ("a", "b"):
+        pytest_assert(cache.write("dut1", key, _facts(key)), "Failed to cache facts {}".format(key))
+    pytest_assert(cache.read("dut1", "a") == _facts("a"), "Facts a mismatch")
+    pytest_assert(cache.write("dut1", "c", _facts("c")), "Failed to cache facts c")
+
+    stats = cache.stats
+    pytest_assert(stats["evictions"] == 1 and stats["memory_entries"] == 2,
+                  "Only the least recently used facts b should be evicted: {}".format(stats))
+    pytest_assert(stats["memory_usage"] == facts_size * 2, "Memory usage mismatch: {}".format(stats))
+
+    pytest_assert(cache.read("dut1", "a") == _facts("a"), "Facts a mismatch")
+    pytest_assert(cache.stats.get("disk_reads", 0) == 0, "Facts a should be read from memory")
+
+    pytest_assert(cache.read("dut1", "b") == _facts("b"), "Evicted facts b mismatch")
+    stats = cache.stats
+    pytest_assert(stats["disk_reads"] == 1 and stats["evictions"] == 2,
+                  "Evicted facts b should be read from disk and evict facts c: {}".format(stats))
+    pytest_assert(cache.read("dut1", "a") == _facts("a") and cache.stats["disk_reads"] == 1,
+                  "Facts a should be kept in memory")
+
+
+def test_facts_cache_zone_invalidation(cache_location):
+    """A changed fingerprint should invalidate the zone of the DUT and of its ASICs only."""
+    cache = _new_cache(cache_location)
+    zones = ["dut1", "dut1-asic0", "dut1-asic1", "dut1-lc2", "dut10"]
+
+    pytest_assert(not cache.check_fingerprint("dut1", "fingerprint1"), "Fingerprint of dut1 should be new")
+    for zone in zones:
+        pytest_assert(cache.write(zone, "facts", _facts(zone)), "Failed to cache facts of {}".format(zone))
+    pytest_assert(cache.check_fingerprint("dut1", "fingerprint1"), "Fingerprint of dut1 should be unchanged")
+
+    pytest_assert(not cache.check_fingerprint("dut1", "fingerprint2"), "Fingerprint of dut1 should be changed")
+    # Read through a new instance as well, so that the facts are read from disk
+    for reader in (cache, _new_cache(cache_location)):
+        for zone in zones:
+            invalidated = zone in ("dut1", "dut1-asic0", "dut1-asic1")
+            facts = reader.read(zone, "facts")
+            pytest_assert((facts is FactsCache.NOTEXIST) == invalidated,
+                          "Facts of {} should be {}".format(zone, "invalidated" if invalidated else "kept"))
+            if not invalidated:
+                pytest_assert(facts == _facts(zone), "Facts of {} mismatch".format(zone))
+
+    pytest_assert(cache.check_fingerprint("dut1", "fingerprint2"), "Fingerprint of dut1 should be saved")
+    pytest_assert(not cache.check_fingerprint("dut1-lc2", "fingerprint1"), "Fingerprint of dut1-lc2 should be new")
+    pytest_assert(cache.read("dut1-lc2", "facts") is FactsCache.NOTEXIST, "Facts of dut1-lc2 should be invalidated")
+    pytest_assert(cache.read("dut10", "facts") == _facts("dut10"), "Facts of dut10 should be kept")
+
+
+def test_facts_cache_index(cache_location, monkeypatch):
+    """The index updated incrementally by caches sharing one folder should match the pickle files on disk."""
+    monkeypatch.setattr(facts_cache, "INDEX_JOURNAL_LIMIT", 5)
+    caches = [_new_cache(cache_location), _new_cache(cache_location)]
+
+    for i in range(12):
+        pytest_assert(caches[i % 2].write("dut{}".format(i % 3), "facts{}".format(i % 4), _facts(str(i))),
+                      "Failed to cache facts {}".format(i))
+    caches[0].cleanup(zone="dut1", key="facts1")
+    caches[1].cleanup(zone="dut2")
+    caches[0].check_fingerprint("dut0", "fingerprint0")
+
+    expected = caches[0]._build_index()
+    for cache in caches:
+        with cache._locked_index() as index:
+            pytest_assert(index.files == expected.files, "Index files mismatch")
+            pytest_assert(index.total_size == sum(expected.files.values()), "Index total size mismatch")
+            pytest_assert(index.fingerprints == {"dut0": "fingerprint0"}, "Index fingerprints mismatch")
+
+    with open(os.path.join(cache_location, facts_cache.INDEX_FILE)) as f:
+        snapshot = json.load(f)
+    with open(os.path.join(cache_location, facts_cache.INDEX_JOURNAL_FILE)) as f:
+        journal = [json.loads(line) for line in f]
+    pytest_assert(len(journal) <= facts_cache.INDEX_JOURNAL_LIMIT, "Journal should be emptied by snapshots")
+    index = facts_cache._CacheIndex(snapshot["files"], snapshot["fingerprints"])
+    for change in journal:
+        index.apply(change)
+    pytest_assert(index.files == expected.files, "Saved index mismatch")
+
+
+def test_facts_cache_usage_limit(cache_location, monkeypatch):
+    """Writing facts over SIZE_LIMIT should fail, overwriting cached facts by facts of the same size should not."""
+    facts_size = len(pickle.dumps(_facts("a"), pickle.HIGHEST_PROTOCOL))
+    monkeypatch.setattr(facts_cache, "SIZE_LIMIT", facts_size * 2)
+    cache = _new_cache(cache_location)
+
+    for key in ("a", "b", "a"):
+        pytest_assert(cache.write("dut1", key, _facts(key)), "Failed to cache facts {}".format(key))
+    with pytest.raises(Exception, match="Cache usage exceeds limitations"):
+        cache.write("dut1", "c", _facts("c"))
+    pytest_assert(cache.read("dut1", "c") is FactsCache.NOTEXIST, "Facts c should not be cached")
+
+    cache.cleanup(zone="dut1", key="b")
+    pytest_assert(cache.write("dut1", "c", _facts("c")), "Failed to cache facts c after cleanup")
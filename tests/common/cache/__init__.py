@@ -1,4 +1,5 @@
 from .facts_cache import FactsCache
 from .facts_cache import cached
+from .facts_cache import DUT_FINGERPRINT_CMD
 
-__all__ = [FactsCache, cached]
+__all__ = [FactsCache, cached, DUT_FINGERPRINT_CMD]
@@ -1,14 +1,19 @@
 
 
+import fcntl
 import inspect
+import json
 import logging
 import os
 import pickle
+import re
 import shutil
 import sys
+import tempfile
 
-from collections import defaultdict
-from threading import Lock
+from collections import OrderedDict, defaultdict
+from contextlib import contextmanager
+from threading import RLock, Lock
 from six import with_metaclass
 
 
@@ -19,6 +24,17 @@ CACHE_LOCATION = os.path.join(CURRENT_PATH, '../../../_cache')
 
 SIZE_LIMIT = 1000000000  # 1G bytes, max disk usage allowed by cache
 ENTRY_LIMIT = 1000000    # Max number of pickle files allowed in cache.
+MEMORY_LIMIT = 256000000  # 256M bytes, max size of facts kept in memory, measured by their pickled size
+
+INDEX_FILE = '.index.json'          # Snapshot of the size of every pickle file and zone fingerprints
+INDEX_JOURNAL_FILE = '.index.journal'  # Index changes appended on every write since the snapshot was taken
+INDEX_JOURNAL_LIMIT = 10000         # Number of journal entries after which the snapshot is taken again
+LOCK_FILE = '.lock'                 # Serializes index updates of parallel pytest workers sharing one cache
+
+# Fingerprint of the DUT image version and config_db, cached facts of a DUT are invalidated when it changes
+DUT_FINGERPRINT_CMD = 'cat /etc/sonic/sonic_version.yml /etc/sonic/config_db*.json 2>/dev/null | md5sum'
+
+NAMESPACE_ZONE_SUFFIX = r'-asic\d+'  # Suffix added to the zone of a host by the default zone getter for an ASIC
 
 
 class Singleton(type):
@@ -34,38 +50,232 @@ class Singleton(type):
         return cls._instances[cls]
 
 
+class _CacheIndex(object):
+    """Size of every pickle file in the cache folder, their total size and the fingerprints of zones.
+
+    Changes made through set_file(), remove_file() and set_fingerprint() are recorded in 'changes', so that
+    only they need to be appended to the index journal.
+    """
+
+    def __init__(self, files=None, fingerprints=None):
+        self.files = files or {}
+        self.fingerprints = fingerprints or {}
+        self.total_size = sum(self.files.values())
+        self.changes = []
+
+    def apply(self, change):
+        kind, name, value = change
+        if kind == 'file':
+            self.total_size -= self.files.pop(name, 0)
+            if value is not None:
+                self.files[name] = value
+                self.total_size += value
+        elif kind == 'fingerprint':
+            self.fingerprints[name] = value
+
+    def _change(self, change):
+        self.apply(change)
+        self.changes.append(change)
+
+    def set_file(self, entry, size):
+        self._change(('file', entry, size))
+
+    def remove_file(self, entry):
+        if entry in self.files:
+            self._change(('file', entry, None))
+
+    def set_fingerprint(self, zone, fingerprint):
+        self._change(('fingerprint', zone, fingerprint))
+
+    def dumps(self):
+        return json.dumps({'files': self.files, 'fingerprints': self.fingerprints}).encode('utf-8')
+
+
 class FactsCache(with_metaclass(Singleton, object)):
     """Singleton class for reading from cache and write to cache.
 
     Used singleton design pattern. Only a single instance of this class can be initialized.
 
+    Facts are kept in two tiers: an in-memory LRU bounded by MEMORY_LIMIT bytes and pickle files on disk.
+    Disk usage is tracked by an index kept in memory and saved next to the pickle files as a snapshot plus a
+    journal of the changes made since the snapshot. Every write appends to the journal under a file lock,
+    pickle files are written to a temporary file and renamed, so that parallel pytest workers can share one
+    cache.
+
     Args:
         with_metaclass ([function]): Python 2&3 compatible function from the six library for adding metaclass.
     """
 
     NOTEXIST = object()
 
-    def __init__(self, cache_location=CACHE_LOCATION):
+    def __init__(self, cache_location=CACHE_LOCATION, memory_limit=MEMORY_LIMIT):
         self._cache_location = os.path.abspath(cache_location)
-        self._cache = defaultdict(dict)
-        self._write_lock = Lock()
+        self._memory_limit = memory_limit
+        self._cache = OrderedDict()     # (zone, key) => (value, size), least recently used first
+        self._memory_usage = 0
+        self._lock = RLock()
+        self._stats = defaultdict(int)
+        self._index = None              # _CacheIndex, as of _journal_offset bytes of the journal
+        self._index_version = None      # Identifies the snapshot the index was loaded from
+        self._journal_offset = 0
+        self._journal_entries = 0
+        self._journal_torn = False      # The journal ends with a partially written entry
+
+    @property
+    def stats(self):
+        """Counters of cache hits, misses, evictions, disk reads and writes."""
+        stats = dict(self._stats)
+        stats['memory_entries'] = len(self._cache)
+        stats['memory_usage'] = self._memory_usage
+        return stats
+
+    def _facts_file(self, zone, key):
+        return os.path.join(self._cache_location, '{}/{}.pickle'.format(zone, key))
+
+    @contextmanager
+    def _locked_index(self):
+        """Lock the cache folder and yield its index. Changes made to the index are saved on exit.
+
+        Only the journal entries appended by other processes since the last call are read, and only the changes
+        made to the index are appended to the journal. The snapshot is rebuilt by walking the cache folder only
+        when it does not exist yet, and is taken again when the journal grows over INDEX_JOURNAL_LIMIT entries.
+        """
+        if not os.path.exists(self._cache_location):
+            os.makedirs(self._cache_location)
+        with self._lock, open(os.path.join(self._cache_location, LOCK_FILE), 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                index = self._load_index()
+                index.changes = []
+                yield index
+                self._save_index(index)
+            except BaseException:
+                # Changes may be applied to the index in memory but not saved, load it again next time
+                self._index = None
+                raise
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _get_index_version(self):
+        try:
+            st = os.stat(os.path.join(self._cache_location, INDEX_FILE))
+        except OSError:
+            return None
+        return (st.st_ino, getattr(st, 'st_mtime_ns', st.st_mtime), st.st_size)
+
+    def _load_index(self):
+        version = self._get_index_version()
+        if self._index is None or version is None or version != self._index_version:
+            index = None
+            if version is not None:
+                try:
+                    with open(os.path.join(self._cache_location, INDEX_FILE)) as f:
+                        snapshot = json.load(f)
+                    index = _CacheIndex(snapshot['files'], snapshot['fingerprints'])
+                except (IOError, ValueError, KeyError):
+                    pass
+            if index is None:
+                self._take_snapshot(self._build_index())
+            else:
+                self._index = index
+                self._index_version = version
+                self._journal_offset = 0
+                self._journal_entries = 0
 
-    def _check_usage(self):
+        try:
+            with open(os.path.join(self._cache_location, INDEX_JOURNAL_FILE), 'rb') as f:
+                f.seek(self._journal_offset)
+                data = f.read()
+        except IOError:
+            data = b''
+        end = data.rfind(b'\n') + 1
+        for line in data[:end].splitlines():
+            try:
+                self._index.apply(json.loads(line.decode('utf-8')))
+            except (ValueError, TypeError):
+                continue
+            self._journal_entries += 1
+        self._journal_offset += end
+        self._journal_torn = end < len(data)
+        return self._index
+
+    def _save_index(self, index):
+        if not index.changes:
+            return
+        if self._journal_torn or self._journal_entries + len(index.changes) > INDEX_JOURNAL_LIMIT:
+            self._take_snapshot(index)
+            return
+        data = ''.join(json.dumps(change) + '\n' for change in index.changes).encode('utf-8')
+        fd = os.open(os.path.join(self._cache_location, INDEX_JOURNAL_FILE), os.O_WRONLY | os.O_APPEND | os.O_CREAT,
+                     0o644)
+        try:
+            os.write(fd, data)
+        finally:
+            os.close(fd)
+        self._journal_offset += len(data)
+        self._journal_entries += len(index.changes)
+
+    def _take_snapshot(self, index):
+        """Save the whole index as snapshot and empty the journal."""
+        self._atomic_write(os.path.join(self._cache_location, INDEX_FILE), index.dumps())
+        with open(os.path.join(self._cache_location, INDEX_JOURNAL_FILE), 'wb'):
+            pass
+        self._index = index
+        self._index_version = self._get_index_version()
+        self._journal_offset = 0
+        self._journal_entries = 0
+        self._journal_torn = False
+
+    def _build_index(self):
+        files = {}
+        for root, _, filenames in os.walk(self._cache_location):
+            for f in filenames:
+                if f.endswith('.pickle'):
+                    fp = os.path.join(root, f)
+                    files[os.path.relpath(fp, self._cache_location)[:-len('.pickle')]] = os.path.getsize(fp)
+        logger.debug('Built cache index of {} entries'.format(len(files)))
+        return _CacheIndex(files)
+
+    def _atomic_write(self, path, data):
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.rename(tmp_path, path)
+        except Exception:
+            os.remove(tmp_path)
+            raise
+
+    def _check_usage(self, index, new_entry, new_size):
         """Check cache usage, raise exception if usage exceeds the limitations.
         """
-        total_size = 0
-        total_entries = 0
-        for root, _, files in os.walk(self._cache_location):
-            for f in files:
-                fp = os.path.join(root, f)
-                total_size += os.path.getsize(fp)
-                total_entries += 1
+        total_size = index.total_size - index.files.get(new_entry, 0) + new_size
+        total_entries = len(index.files) + (0 if new_entry in index.files else 1)
 
         if total_size > SIZE_LIMIT or total_entries > ENTRY_LIMIT:
             msg = 'Cache usage exceeds limitations. total_size={}, SIZE_LIMIT={}, total_entries={}, ENTRY_LIMIT={}' \
                 .format(total_size, SIZE_LIMIT, total_entries, ENTRY_LIMIT)
             raise Exception(msg)
 
+    def _remember(self, zone, key, value, size):
+        """Put facts into the in-memory LRU and evict the least recently used facts above the memory limit."""
+        with self._lock:
+            self._forget(zone, key)
+            self._cache[(zone, key)] = (value, size)
+            self._memory_usage += size
+            while self._memory_usage > self._memory_limit and len(self._cache) > 1:
+                (old_zone, old_key), (_, old_size) = self._cache.popitem(last=False)
+                self._memory_usage -= old_size
+                self._stats['evictions'] += 1
+                logger.debug('Evicted cached facts "{}.{}" from memory'.format(old_zone, old_key))
+
+    def _forget(self, zone, key=None):
+        with self._lock:
+            entries = [(zone, key)] if key else [entry for entry in self._cache if entry[0] == zone]
+            for entry in entries:
+                if entry in self._cache:
+                    self._memory_usage -= self._cache.pop(entry)[1]
+
     def read(self, zone, key):
         """Read cached facts.
 
@@ -77,21 +287,30 @@ class FactsCache(with_metaclass(Singleton, object)):
         Returns:
             obj: Cached object, usually a dictionary.
         """
+        with self._lock:
+            if (zone, key) in self._cache:
+                self._cache[(zone, key)] = self._cache.pop((zone, key))
+                self._stats['hits'] += 1
+                logger.debug('Read cached facts "{}.{}"'.format(zone, key))
+                return self._cache[(zone, key)][0]
+
         # Lazy load
-        if zone in self._cache and key in self._cache[zone]:
-            logger.debug('Read cached facts "{}.{}"'.format(zone, key))
-            return self._cache[zone][key]
-        else:
-            facts_file = os.path.join(self._cache_location, '{}/{}.pickle'.format(zone, key))
-            try:
-                with open(facts_file, 'rb') as f:
-                    self._cache[zone][key] = pickle.load(f)
-                    logger.debug('Loaded cached facts "{}.{}" from {}'.format(zone, key, facts_file))
-                    return self._cache[zone][key]
-            except (IOError, ValueError) as e:
-                logger.info('Load cache file "{}" failed with exception: {}'
-                            .format(os.path.abspath(facts_file), repr(e)))
-                return self.NOTEXIST
+        facts_file = self._facts_file(zone, key)
+        try:
+            with open(facts_file, 'rb') as f:
+                data = f.read()
+            value = pickle.loads(data)
+        except (IOError, ValueError, EOFError, pickle.UnpicklingError) as e:
+            self._stats['misses'] += 1
+            logger.info('Load cache file "{}" failed with exception: {}'
+                        .format(os.path.abspath(facts_file), repr(e)))
+            return self.NOTEXIST
+
+        self._stats['hits'] += 1
+        self._stats['disk_reads'] += 1
+        self._remember(zone, key, value, len(data))
+        logger.debug('Loaded cached facts "{}.{}" from {}'.format(zone, key, facts_file))
+        return value
 
     def write(self, zone, key, value):
         """Store facts to cache.
@@ -105,23 +324,58 @@ class FactsCache(with_metaclass(Singleton, object)):
         Returns:
             boolean: Caching facts is successful or not.
         """
-        with self._write_lock:
-            self._check_usage()
-            facts_file = os.path.join(self._cache_location, '{}/{}.pickle'.format(zone, key))
-            try:
+        facts_file = self._facts_file(zone, key)
+        try:
+            data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+            with self._lock, self._locked_index() as index:
+                entry = '{}/{}'.format(zone, key)
+                self._check_usage(index, entry, len(data))
+
                 cache_subfolder = os.path.join(self._cache_location, zone)
                 if not os.path.exists(cache_subfolder):
                     logger.info('Create cache dir {}'.format(cache_subfolder))
                     os.makedirs(cache_subfolder)
 
-                with open(facts_file, 'wb') as f:
-                    pickle.dump(value, f, pickle.HIGHEST_PROTOCOL)
-                    self._cache[zone][key] = value
-                    logger.info('Cached facts "{}.{}" to {}'.format(zone, key, facts_file))
-                    return True
-            except (IOError, ValueError) as e:
-                logger.error('Dump cache file "{}" failed with exception: {}'.format(facts_file, repr(e)))
-                return False
+                self._atomic_write(facts_file, data)
+                index.set_file(entry, len(data))
+                self._remember(zone, key, value, len(data))
+                self._stats['writes'] += 1
+                logger.info('Cached facts "{}.{}" to {}'.format(zone, key, facts_file))
+                return True
+        except (IOError, OSError, ValueError, pickle.PicklingError) as e:
+            logger.error('Dump cache file "{}" failed with exception: {}'.format(facts_file, repr(e)))
+            return False
+
+    def check_fingerprint(self, zone, fingerprint):
+        """Invalidate cached facts of a zone when its fingerprint changed.
+
+        The fingerprint identifies the state the cached facts were gathered from, for example the DUT image
+        version plus a hash of config_db. Facts cached under the zone and under the zones the default zone getter
+        derives from it for the ASIC namespaces ('<zone>-asic<N>') are removed when the stored fingerprint differs.
+        Zones of other hosts sharing the prefix, like '<zone>-lc2', are kept.
+
+        Args:
+            zone (str): Zone name, usually hostname.
+            fingerprint (str): Current fingerprint of the zone.
+
+        Returns:
+            boolean: True if the cached facts were still valid.
+        """
+        with self._lock, self._locked_index() as index:
+            stored = index.fingerprints.get(zone)
+            if stored == fingerprint:
+                return True
+            index.set_fingerprint(zone, fingerprint)
+            zones = set(entry.split('/')[0] for entry in index.files)
+
+        if stored is not None:
+            logger.info('Fingerprint of zone "{}" changed from {} to {}, invalidate cached facts'
+                        .format(zone, stored, fingerprint))
+        zone_pattern = re.compile('{}(?:{})?$'.format(re.escape(zone), NAMESPACE_ZONE_SUFFIX))
+        for cached_zone in zones:
+            if zone_pattern.match(cached_zone):
+                self.cleanup(zone=cached_zone)
+        return False
 
     def cleanup(self, zone=None, key=None):
         """Cleanup cached files.
@@ -134,27 +388,33 @@ class FactsCache(with_metaclass(Singleton, object)):
         """
         if zone:
             if key:
-                if zone in self._cache and key in self._cache[zone]:
-                    del self._cache[zone][key]
-                    logger.debug('Removed "{}.{}" from cache.'.format(zone, key))
+                self._forget(zone, key)
+                logger.debug('Removed "{}.{}" from cache.'.format(zone, key))
                 try:
-                    cache_file = os.path.join(self._cache_location, zone, '{}.pickle'.format(key))
-                    os.remove(cache_file)
+                    with self._locked_index() as index:
+                        index.remove_file('{}/{}'.format(zone, key))
+                        cache_file = os.path.join(self._cache_location, zone, '{}.pickle'.format(key))
+                        os.remove(cache_file)
                     logger.debug('Removed cache file "{}.pickle"'.format(cache_file))
                 except OSError as e:
                     logger.error('Cleanup cache {}.{}.pickle failed with exception: {}'.format(zone, key, repr(e)))
             else:
-                if zone in self._cache:
-                    del self._cache[zone]
-                    logger.debug('Removed zone "{}" from cache'.format(zone))
+                self._forget(zone)
+                logger.debug('Removed zone "{}" from cache'.format(zone))
                 try:
-                    cache_subfolder = os.path.join(self._cache_location, zone)
-                    shutil.rmtree(cache_subfolder)
+                    with self._locked_index() as index:
+                        for entry in [entry for entry in index.files if entry.split('/')[0] == zone]:
+                            index.remove_file(entry)
+                        cache_subfolder = os.path.join(self._cache_location, zone)
+                        shutil.rmtree(cache_subfolder)
                     logger.debug('Removed cache subfolder "{}"'.format(cache_subfolder))
                 except OSError as e:
                     logger.error('Remove cache subfolder "{}" failed with exception: {}'.format(zone, repr(e)))
         else:
-            self._cache = defaultdict(dict)
+            with self._lock:
+                self._cache = OrderedDict()
+                self._memory_usage = 0
+                self._index = None
             try:
                 shutil.rmtree(self._cache_location)
                 logger.debug('Removed all cache files under "{}"'.format(self._cache_location))
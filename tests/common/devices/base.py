@@ -1,10 +1,13 @@
 import inspect
 import json
 import logging
+import threading
 
+from functools import partial
 from multiprocessing.pool import ThreadPool
 
 from tests.common.errors import RunAnsibleModuleFail
+from tests.common.devices.ssh_transport import SshTransport, SshTransportUnavailable
 
 logger = logging.getLogger(__name__)
 
@@ -30,7 +33,15 @@ class AnsibleHostBase(object):
     This class filters an object from the ansible_adhoc fixture by hostname. The object can be considered as an
     ansible host object although it is not under the hood. Anyway, we can use this object to run ansible module
     on the host.
+
+    If ssh_fast_path is enabled, the shell and command modules are run over a persistent SSH connection of the host
+    instead of by Ansible. Other modules are still run by Ansible.
     """
+    ssh_fast_path = False
+    _ssh_transport = None
+    # Guards creating the SSH transport of a host by concurrent fan_out calls. Creating a transport doesn't connect,
+    # so a single lock for all the hosts is held only briefly.
+    _ssh_transport_lock = threading.Lock()
 
     class CustomEncoder(json.JSONEncoder):
         def default(self, obj):
@@ -48,18 +59,20 @@ class AnsibleHostBase(object):
 
     def __getattr__(self, module_name):
         if self.host.has_module(module_name):
-            self.module_name = module_name
-            self.module = getattr(self.host, module_name)
-
-            return self._run
+            # Bind the module to the returned callable instead of storing it in the object, so that different modules
+            # can be run on the same host from multiple threads.
+            return partial(self._run, module_name, getattr(self.host, module_name))
         raise AttributeError(
             "'%s' object has no attribute '%s'" % (self.__class__, module_name)
             )
 
-    def _run(self, *module_args, **complex_args):
+    def _run(self, module_name, module, *module_args, **complex_args):
 
+        # Avoid inspect.getframeinfo, which reads the source file of the caller for every call
         previous_frame = inspect.currentframe().f_back
-        filename, line_number, function_name, lines, index = inspect.getframeinfo(previous_frame)
+        filename = previous_frame.f_code.co_filename
+        line_number = previous_frame.f_lineno
+        function_name = previous_frame.f_code.co_name
 
         verbose = complex_args.pop('verbose', True)
 
@@ -70,7 +83,7 @@ class AnsibleHostBase(object):
                     function_name,
                     line_number,
                     self.hostname,
-                    self.module_name,
+                    module_name,
                     json.dumps(module_args, cls=AnsibleHostBase.CustomEncoder),
                     json.dumps(complex_args, cls=AnsibleHostBase.CustomEncoder)
                 )
@@ -82,7 +95,7 @@ class AnsibleHostBase(object):
                     function_name,
                     line_number,
                     self.hostname,
-                    self.module_name
+                    module_name
                 )
             )
 
@@ -91,14 +104,19 @@ class AnsibleHostBase(object):
 
         if module_async:
             def run_module(module_args, complex_args):
-                return self.module(*module_args, **complex_args)[self.hostname]
+                return module(*module_args, **complex_args)[self.hostname]
             pool = ThreadPool()
             result = pool.apply_async(run_module, (module_args, complex_args))
             return pool, result
 
-        module_args = json.loads(json.dumps(module_args, cls=AnsibleHostBase.CustomEncoder))
-        complex_args = json.loads(json.dumps(complex_args, cls=AnsibleHostBase.CustomEncoder))
-        res = self.module(*module_args, **complex_args)[self.hostname]
+        res = None
+        if self.ssh_fast_path and SshTransport.supports(module_name, module_args, complex_args):
+            res = self._run_ssh_fast_path(module_name, module_args, complex_args)
+
+        if res is None:
+            module_args = json.loads(json.dumps(module_args, cls=AnsibleHostBase.CustomEncoder))
+            complex_args = json.loads(json.dumps(complex_args, cls=AnsibleHostBase.CustomEncoder))
+            res = module(*module_args, **complex_args)[self.hostname]
 
         if verbose:
             logger.debug(
@@ -107,7 +125,7 @@ class AnsibleHostBase(object):
                     function_name,
                     line_number,
                     self.hostname,
-                    self.module_name, json.dumps(res, cls=AnsibleHostBase.CustomEncoder)
+                    module_name, json.dumps(res, cls=AnsibleHostBase.CustomEncoder)
                 )
             )
         else:
@@ -117,17 +135,37 @@ class AnsibleHostBase(object):
                     function_name,
                     line_number,
                     self.hostname,
-                    self.module_name,
+                    module_name,
                     res.is_failed,
                     res.get('rc', None)
                 )
             )
 
         if (res.is_failed or 'exception' in res) and not module_ignore_errors:
-            raise RunAnsibleModuleFail("run module {} failed".format(self.module_name), res)
+            raise RunAnsibleModuleFail("run module {} failed".format(module_name), res)
 
         return res
 
+    def _run_ssh_fast_path(self, module_name, module_args, complex_args):
+        """Run the shell or command module over the persistent SSH connection of the host.
+
+        Returns:
+            ModuleResult: The module result. None if the command cannot be run over SSH, it should be run by Ansible.
+        """
+        try:
+            if self._ssh_transport is None:
+                with self._ssh_transport_lock:
+                    if self._ssh_transport is None:
+                        try:
+                            self._ssh_transport = SshTransport.from_ansible_host(self)
+                        except Exception as e:
+                            raise SshTransportUnavailable("Failed to get SSH variables: {}".format(repr(e)))
+            return self._ssh_transport.run(module_name, module_args, complex_args)
+        except SshTransportUnavailable as e:
+            logger.warning("[{}] SSH fast path is unavailable, fall back to Ansible: {}".format(self.hostname, e))
+            self.ssh_fast_path = False
+            return None
+
 
 class NeighborDevice(dict):
     def __str__(self):
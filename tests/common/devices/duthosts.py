@@ -1,7 +1,10 @@
 import sys
 import logging
 
+from functools import partial
+
 from tests.common.devices.multi_asic import MultiAsicSonicHost
+from tests.common.helpers.parallel import fan_out
 
 logger = logging.getLogger(__name__)
 
@@ -16,9 +19,12 @@ class DutHosts(object):
     """
     class _Nodes(list):
         """ Internal class representing a list of MultiAsicSonicHosts """
-        def _run_on_nodes(self, *module_args, **complex_args):
-            """ Delegate the call to each of the nodes, return the results in a dict."""
-            return {node.hostname: getattr(node, self.attr)(*module_args, **complex_args) for node in self}
+        def _run_on_nodes(self, attr, *module_args, **complex_args):
+            """ Delegate the call to each of the nodes concurrently, return the results in a dict."""
+            hostnames = [node.hostname for node in self]
+            results = fan_out(lambda node: getattr(node, attr)(*module_args, **complex_args), self,
+                              names=hostnames, description="duthosts.{}".format(attr))
+            return dict(zip(hostnames, results))
 
         def __getattr__(self, attr):
             """ To support calling ansible modules on a list of MultiAsicSonicHost
@@ -29,8 +35,7 @@ class DutHosts(object):
                a dictionary with key being the MultiAsicSonicHost's hostname,
                and value being the output of ansible module on that MultiAsicSonicHost
             """
-            self.attr = attr
-            return self._run_on_nodes
+            return partial(self._run_on_nodes, attr)
 
         def __eq__(self, o):
             """ To support eq operator on the DUTs (nodes) in the testbed """
@@ -3,11 +3,14 @@ import ipaddress
 import json
 import logging
 
+from functools import partial
+
 from tests.common.errors import RunAnsibleModuleFail
 from tests.common.devices.sonic import SonicHost
 from tests.common.devices.sonic_asic import SonicAsic
 from tests.common.helpers.assertions import pytest_assert
 from tests.common.helpers.constants import DEFAULT_ASIC_ID, DEFAULT_NAMESPACE, ASICS_PRESENT
+from tests.common.helpers.parallel import fan_out
 
 logger = logging.getLogger(__name__)
 
@@ -91,10 +94,11 @@ class MultiAsicSonicHost(object):
     def get_default_critical_services_list(self):
         return self._DEFAULT_SERVICES
 
-    def _run_on_asics(self, *module_args, **complex_args):
+    def _run_on_asics(self, multi_asic_attr, *module_args, **complex_args):
         """ Run an asible module on asics based on 'asic_index' keyword in complex_args
 
         Args:
+            multi_asic_attr: name of the SonicAsic method to run
             module_args: other ansible module args passed from the caller
             complex_args: other ansible keyword args
 
@@ -110,12 +114,12 @@ class MultiAsicSonicHost(object):
                     - for single asic SonicHost this would still be the same as
                       the ansible module on the global namespace
                 else if asic_index is string 'all', then a list of ansible module output
-                for all the asics on the SonicHost
+                for all the asics on the SonicHost, the asics are run concurrently
                     - for single asic, this would be a list of size 1.
         """
         if "asic_index" not in complex_args:
             # Default ASIC/namespace
-            return getattr(self.sonichost, self.multi_asic_attr)(*module_args, **complex_args)
+            return getattr(self.sonichost, multi_asic_attr)(*module_args, **complex_args)
         else:
             asic_complex_args = copy.deepcopy(complex_args)
             asic_index = asic_complex_args.pop("asic_index")
@@ -124,11 +128,14 @@ class MultiAsicSonicHost(object):
                 if self.sonichost.facts['num_asic'] == 1:
                     if asic_index != 0:
                         raise ValueError("Trying to run module '{}' against asic_index '{}' on a single asic dut '{}'"
-                                         .format(self.multi_asic_attr, asic_index, self.sonichost.hostname))
-                return getattr(self.asic_instance(asic_index), self.multi_asic_attr)(*module_args, **asic_complex_args)
+                                         .format(multi_asic_attr, asic_index, self.sonichost.hostname))
+                return getattr(self.asic_instance(asic_index), multi_asic_attr)(*module_args, **asic_complex_args)
             elif type(asic_index) == str and asic_index.lower() == "all":
                 # All ASICs/namespace
-                return [getattr(asic, self.multi_asic_attr)(*module_args, **asic_complex_args) for asic in self.asics]
+                return fan_out(lambda asic: getattr(asic, multi_asic_attr)(*module_args, **asic_complex_args),
+                               self.asics,
+                               names=["{}/asic{}".format(self.hostname, asic.asic_index) for asic in self.asics],
+                               description="{}.{}(asic_index='all')".format(self.hostname, multi_asic_attr))
             else:
                 raise ValueError("Argument 'asic_index' must be an int or string 'all'.")
 
@@ -283,8 +290,7 @@ class MultiAsicSonicHost(object):
         """
         sonic_asic_attr = getattr(SonicAsic, attr, None)
         if not attr.startswith("_") and sonic_asic_attr and callable(sonic_asic_attr):
-            self.multi_asic_attr = attr
-            return self._run_on_asics
+            return partial(self._run_on_asics, attr)
         else:
             return getattr(self.sonichost, attr)  # For backward compatibility
 
@@ -22,6 +22,7 @@ from tests.common.cache import cached
 from tests.common.helpers.constants import DEFAULT_ASIC_ID, DEFAULT_NAMESPACE
 from tests.common.helpers.platform_api.chassis import is_inband_port
 from tests.common.helpers.parallel import parallel_run_threaded
+from tests.common.helpers.show_table import parse_column_positions, parse_show_table
 from tests.common.errors import RunAnsibleModuleFail
 from tests.common import constants
 
@@ -1469,61 +1470,10 @@ Totals               6450                 6449
             Returns a list. Each item is a tuple with two elements. The first element is start position of a column.
             The second element is the end position of the column.
         """
-        prev = ' ',
-        positions = []
-        for pos, char in enumerate(sep_line + ' '):
-            if char == sep_char:
-                if char != prev:
-                    left = pos
-            else:
-                if char != prev:
-                    right = pos
-                    positions.append((left, right))
-            prev = char
-        return positions
-
-    def _parse_show(self, output_lines, header_len=1):
-
-        result = []
-
-        sep_line_pattern = re.compile(r"^( *-+ *)+$")
-        sep_line_found = False
-        for idx, line in enumerate(output_lines):
-            if sep_line_pattern.match(line):
-                sep_line_found = True
-                header_lines = output_lines[idx-header_len:idx]
-                sep_line = output_lines[idx]
-                content_lines = output_lines[idx+1:]
-                break
-
-        if not sep_line_found:
-            logging.error('Failed to find separation line in the show command output')
-            return result
-
-        try:
-            positions = self._parse_column_positions(sep_line)
-        except Exception as e:
-            logging.error('Possibly bad command output, exception: {}'.format(repr(e)))
-            return result
-
-        headers = []
-        for (left, right) in positions:
-            header = " ".join([header_line[left:right].strip().lower() for header_line in header_lines]).strip()
-            headers.append(header)
+        return parse_column_positions(sep_line, sep_char)
 
-        for content_line in content_lines:
-            # When an empty line is encountered while parsing the tabulate content, it is highly possible that the
-            # tabulate content has been drained. The empty line and rest of the lines should not be parsed.
-            if len(content_line) == 0:
-                break
-            item = {}
-            for idx, (left, right) in enumerate(positions):
-                k = headers[idx]
-                v = content_line[left:right].strip()
-                item[k] = v
-            result.append(item)
-
-        return result
+    def _parse_show(self, output_lines, header_len=1, as_columns=False):
+        return parse_show_table(output_lines, header_len, as_columns=as_columns)
 
     def show_and_parse(self, show_cmd, header_len=1, **kwargs):
         """Run a show command and parse the output using a generic pattern.
@@ -1589,20 +1539,24 @@ Totals               6450                 6449
 
         Args:
             show_cmd: The show command that will be executed.
+            as_columns: Return the parsed output column oriented. Defaults to False.
 
         Returns:
             Return the parsed output of the show command in a list of dictionary. Each list item is a dictionary,
             corresponding to one content line under the header in the output. Keys of the dictionary are the column
             headers in lowercase.
+            If as_columns is True, return a dictionary keyed by the column headers in lowercase, the value is the list
+            of values of the column, in the order of content lines.
         """
         start_line_index = kwargs.pop("start_line_index", 0)
         end_line_index = kwargs.pop("end_line_index", None)
+        as_columns = kwargs.pop("as_columns", False)
         output = self.shell(show_cmd, **kwargs)["stdout_lines"]
         if end_line_index is None:
             output = output[start_line_index:]
         else:
             output = output[start_line_index:end_line_index]
-        return self._parse_show(output, header_len)
+        return self._parse_show(output, header_len, as_columns=as_columns)
 
     @cached(name='mg_facts')
     def get_extended_minigraph_facts(self, tbinfo, namespace=DEFAULT_NAMESPACE):
@@ -0,0 +1,225 @@
+"""
+Run the shell and command modules on a host over a persistent SSH connection.
+
+Running a module through Ansible packages the module, opens a new SSH session and copies the module over for every
+call. For the shell and command modules, which are the majority of the calls issued by test cases, the SshTransport
+keeps one SSH connection per host and runs each command in a new channel of the connection. The returned result has
+the same shape as the result of the Ansible modules.
+"""
+import datetime
+import logging
+import select
+import shlex
+import socket
+import threading
+
+import paramiko
+
+from ansible.parsing.dataloader import DataLoader
+from ansible.template import Templar
+from pytest_ansible.results import ModuleResult
+
+logger = logging.getLogger(__name__)
+
+# Supported modules and the supported arguments of them, calls with other arguments are run by Ansible
+SUPPORTED_MODULE_ARGS = {
+    "shell": ("cmd", "chdir", "executable"),
+    "command": ("cmd", "chdir"),
+}
+
+RECV_SIZE = 65536
+
+
+class SshTransportUnavailable(Exception):
+    """Raised when the command could not be started over SSH. It is safe to run the command by Ansible instead."""
+    pass
+
+
+class SshTransport(object):
+    """
+    @summary: Persistent SSH connection for running shell/command on a host.
+
+    A single SSH connection is shared by all the calls, each call runs in its own channel. Commands are run as root
+    like the Ansible modules with become=True. Passwordless sudo is used if the host supports it, otherwise the become
+    password is fed to sudo for each command.
+    """
+
+    def __init__(self, hostname, address, port, username, password=None, become_password=None, timeout=30):
+        self.hostname = hostname
+        self.address = address
+        self.port = port
+        self.username = username
+        self.password = password
+        self.become_password = become_password
+        self.timeout = timeout
+
+        self.client = None
+        self.sudo = None
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_ansible_host(cls, ansible_host):
+        """Create the transport using the connection variables of an AnsibleHostBase object.
+
+        Args:
+            ansible_host: An AnsibleHostBase object.
+
+        Returns:
+            SshTransport: The transport for the host.
+        """
+        inv_mgr = ansible_host.host.options["inventory_manager"]
+        var_mgr = ansible_host.host.options["variable_manager"]
+        hostvars = var_mgr.get_vars(host=inv_mgr.get_host(ansible_host.hostname))
+        templar = Templar(loader=DataLoader(), variables=hostvars)
+
+        def _get_var(*names):
+            for name in names:
+                if name in hostvars:
+                    return templar.template(hostvars[name])
+            return None
+
+        password = _get_var("ansible_password", "ansible_ssh_pass")
+        return cls(
+            ansible_host.hostname,
+            _get_var("ansible_host") or ansible_host.hostname,
+            int(_get_var("ansible_port", "ansible_ssh_port") or 22),
+            _get_var("ansible_user", "ansible_ssh_user"),
+            password=password,
+            become_password=_get_var("ansible_become_password", "ansible_become_pass", "ansible_sudo_pass") or password
+        )
+
+    @staticmethod
+    def supports(module_name, module_args, complex_args):
+        """Check whether a module call can be run by the transport."""
+        if module_name not in SUPPORTED_MODULE_ARGS:
+            return False
+        if any(arg not in SUPPORTED_MODULE_ARGS[module_name] for arg in complex_args):
+            return False
+        if module_args:
+            return len(module_args) == 1 and isinstance(module_args[0], str) and "cmd" not in complex_args
+        return isinstance(complex_args.get("cmd"), str)
+
+    def _connect(self):
+        with self.lock:
+            if self.client is not None and self.client.get_transport() is not None \
+                    and self.client.get_transport().is_active():
+                return self.client.get_transport()
+
+            self.close()
+            client = paramiko.SSHClient()
+            client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+            try:
+                client.connect(self.address, port=self.port, username=self.username, password=self.password,
+                               timeout=self.timeout, look_for_keys=self.password is None,
+                               allow_agent=self.password is None)
+            except Exception as e:
+                client.close()
+                raise SshTransportUnavailable("Failed to connect to {}: {}".format(self.hostname, repr(e)))
+            client.get_transport().set_keepalive(30)
+            # Channel requests are small messages waiting for reply, do not let them wait for delayed ACK
+            client.get_transport().sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self.client = client
+            logger.debug("[{}] SSH transport connected to {}:{}".format(self.hostname, self.address, self.port))
+
+            if self.sudo is None:
+                rc, _, _ = self._exec("sudo -n true")
+                if rc == 0:
+                    self.sudo = "sudo -n -H"
+                elif self.become_password is not None:
+                    # Always ask for password, so that the password line is never left to the command's stdin
+                    self.sudo = "sudo -k -S -p '' -H"
+                else:
+                    raise SshTransportUnavailable("sudo requires password on {}".format(self.hostname))
+            return client.get_transport()
+
+    def _exec(self, command, stdin=None):
+        """Run a command in a new channel, return the exit status, stdout and stderr."""
+        try:
+            channel = self.client.get_transport().open_session(timeout=self.timeout)
+            channel.exec_command(command)
+        except Exception as e:
+            raise SshTransportUnavailable("Failed to start command on {}: {}".format(self.hostname, repr(e)))
+
+        try:
+            if stdin is not None:
+                channel.sendall(stdin)
+            channel.shutdown_write()
+            stdout, stderr = [], []
+            while True:
+                if channel.recv_ready():
+                    stdout.append(channel.recv(RECV_SIZE))
+                elif channel.recv_stderr_ready():
+                    stderr.append(channel.recv_stderr(RECV_SIZE))
+                elif channel.eof_received or channel.closed:
+                    break
+                else:
+                    select.select([channel], [], [], 1)
+            rc = channel.recv_exit_status()
+        finally:
+            channel.close()
+        return rc, b"".join(stdout), b"".join(stderr)
+
+    def run(self, module_name, module_args, complex_args):
+        """Run the shell or command module.
+
+        Args:
+            module_name (str): shell or command.
+            module_args (tuple): Positional module args, the command to run.
+            complex_args (dict): Keyword module args.
+
+        Raises:
+            SshTransportUnavailable: The command could not be started.
+
+        Returns:
+            ModuleResult: Result in the same shape as the Ansible module result.
+        """
+        cmd = module_args[0] if module_args else complex_args["cmd"]
+        if module_name == "command":
+            argv = shlex.split(cmd)
+            script = " ".join(shlex.quote(arg) for arg in argv)
+            executable = "/bin/sh"
+        else:
+            script = cmd
+            executable = complex_args.get("executable") or "/bin/sh"
+        if complex_args.get("chdir"):
+            script = "cd {} || exit 1\n{}".format(shlex.quote(complex_args["chdir"]), script)
+
+        self._connect()
+        command = "{} {} -c {}".format(self.sudo, shlex.quote(executable), shlex.quote(script))
+        stdin = "{}\n".format(self.become_password).encode("utf-8") if self.sudo.startswith("sudo -k") else None
+
+        start = datetime.datetime.now()
+        try:
+            rc, stdout, stderr = self._exec(command, stdin)
+        except SshTransportUnavailable:
+            raise
+        except Exception as e:
+            # The command may have been started, do not retry it. Report it like an unreachable host.
+            self.close()
+            return ModuleResult({"failed": True, "unreachable": True, "changed": False, "cmd": cmd,
+                                 "msg": "SSH connection to {} lost: {}".format(self.hostname, repr(e))})
+        end = datetime.datetime.now()
+
+        stdout = stdout.decode("utf-8", "replace").rstrip("\r\n")
+        stderr = stderr.decode("utf-8", "replace").rstrip("\r\n")
+        res = {
+            "changed": True,
+            "cmd": argv if module_name == "command" else cmd,
+            "rc": rc,
+            "start": str(start),
+            "end": str(end),
+            "delta": str(end - start),
+            "stdout": stdout,
+            "stderr": stderr,
+            "stdout_lines": stdout.splitlines(),
+            "stderr_lines": stderr.splitlines(),
+            "failed": rc != 0,
+        }
+        if rc != 0:
+            res["msg"] = "non-zero return code"
+        return ModuleResult(res)
+
+    def close(self):
+        if self.client is not None:
+            self.client.close()
+            self.client = None
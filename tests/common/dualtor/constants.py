@@ -11,6 +11,7 @@ OUTPUT = "output"
 FLAP_COUNTER = "flap_counter"
 CLEAR_FLAP_COUNTER = "clear_flap_counter"
 RESET = "reset"
+BULK_TOGGLE = "toggle"
 
 MUX_SIM_ALLOWED_DISRUPTION_SEC = 10
 CONFIG_RELOAD_ALLOWED_DISRUPTION_SEC = 120
@@ -12,7 +12,7 @@ from tests.common.dualtor.dual_tor_common import mux_config
 from tests.common.dualtor.dual_tor_common import CableType
 from tests.common.helpers.assertions import pytest_assert
 from tests.common.dualtor.constants import UPPER_TOR, LOWER_TOR, TOGGLE, RANDOM, NIC, DROP, \
-                                           OUTPUT, FLAP_COUNTER, CLEAR_FLAP_COUNTER, RESET
+                                           OUTPUT, FLAP_COUNTER, CLEAR_FLAP_COUNTER, RESET, BULK_TOGGLE
 
 __all__ = [
     'mux_server_info',
@@ -169,17 +169,30 @@ def _post(server_url, data):
     Returns:
         True if succeed. False otherwise
     """
+    return _post_status(server_url, data) == 200
+
+
+def _post_status(server_url, data):
+    """
+    Helper function for posting data to y_cable server and getting the status code of response.
+
+    Args:
+        server_url: a str, the full address of mux server, like http://10.0.0.64:8080/mux/vms17-8[/1/drop|output]
+        data: data to post {"out_sides": ["nic", "upper_tor", "lower_tor"]}
+    Returns:
+        The status code of response, None if no response was received
+    """
     try:
         server_url = '{}?reqId={}'.format(server_url, uuid.uuid4())  # Add query string param reqId for debugging
         logger.debug('POST {} with {}'.format(server_url, data))
         headers = {'Accept': 'application/json', 'Content-Type': 'application/json'}
         resp = requests.post(server_url, json=data, headers=headers, timeout=10)
         logger.debug('Received response {}/{} with content {}'.format(resp.status_code, resp.reason, resp.text))
-        return resp.status_code == 200
+        return resp.status_code
     except Exception as e:
         logger.warn("POST {} with data {} failed, err: {}".format(server_url, data, repr(e)))
 
-    return False
+    return None
 
 
 @pytest.fixture(scope='function')
@@ -400,14 +413,36 @@ def get_active_torhost(upper_tor_host, lower_tor_host, check_simulator_read_side
     return _get_active_torhost
 
 
+def _post_toggle_all(mux_server_url, side):
+    """
+    Helper function for toggling all ports of the mux simulator to the specified side.
+
+    The bulk toggle API applies flow changes of all the ports in bulk and only returns after the flows are confirmed
+    on the mux bridges. Fall back to the per vm_set API only in case the mux simulator does not support bulk toggle.
+    Any other failure is returned as is: the bulk toggle may have been applied already, toggling again would flip
+    the ports back for side toggle|random.
+
+    Args:
+        mux_server_url: a str, the address of mux simulator server + vmset_name, like http://10.0.0.64:8080/mux/vms17-8
+        side: a str, upper_tor|lower_tor|toggle|random
+    Returns:
+        True if succeed. False otherwise
+    """
+    data = {"active_side": side}
+    status = _post_status(mux_server_url + "/{}".format(BULK_TOGGLE), data)
+    if status not in (404, 405):
+        return status == 200
+    logger.info('Bulk toggle is not supported, toggle all ports to "{}" with {}'.format(side, mux_server_url))
+    return _post(mux_server_url, data)
+
+
 def _toggle_all_simulator_ports(mux_server_url, side, tbinfo):
     # Skip on non dualtor testbed
     if 'dualtor' not in tbinfo['topo']['name']:
         return
     pytest_assert(side in TOGGLE_SIDES, "Unsupported side '{}'".format(side))
-    data = {"active_side": side}
     logger.info('Toggle all ports to "{}"'.format(side))
-    pytest_assert(_post(mux_server_url, data), "Failed to toggle all ports to '{}'".format(side))
+    pytest_assert(_post_toggle_all(mux_server_url, side), "Failed to toggle all ports to '{}'".format(side))
 
 
 @pytest.fixture(scope='module')
@@ -498,18 +533,18 @@ def _toggle_all_simulator_ports_to_target_dut(target_dut_hostname, duthosts, mux
     logging.info("Toggling mux cable to {}".format(target_dut_hostname))
     dut_index = tbinfo['duts'].index(target_dut_hostname)
     if dut_index == 0:
-        data = {"active_side": UPPER_TOR}
+        side = UPPER_TOR
     else:
-        data = {"active_side": LOWER_TOR}
+        side = LOWER_TOR
 
     # Allow retry for mux cable toggling
     is_toggle_done = False
     for attempt in range(1, 4):
         logger.info('attempt={}, toggle active side of all muxcables to {} from mux simulator'.format(
             attempt,
-            data['active_side']
+            side
         ))
-        _post(mux_server_url, data)
+        _post_toggle_all(mux_server_url, side)
         time.sleep(5)
         if _check_toggle_done(duthosts, target_dut_hostname):
             is_toggle_done = True
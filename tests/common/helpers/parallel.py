@@ -5,9 +5,12 @@ import os
 import shutil
 import tempfile
 import signal
+import threading
 import traceback
 import time
 
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, wait
 from multiprocessing import Process, Manager, Pipe, TimeoutError
 from multiprocessing.pool import ThreadPool
 from psutil import wait_procs
@@ -252,6 +255,124 @@ def reset_ansible_local_tmp(target):
     return wrapper
 
 
+class _FanOutState(threading.local):
+    # Nesting level of fan_out in current thread. Each level has its own executor, so that a task waiting for
+    # nested tasks never starves them of workers.
+    depth = 0
+    # Set by sequential_fan_out to run the fan_out calls of current thread sequentially
+    sequential = False
+
+
+_fan_out_state = _FanOutState()
+_fan_out_lock = threading.Lock()
+_fan_out_executors = {}
+_fan_out_config = {"max_workers": 16, "timeout": None}
+
+
+def configure_fan_out(max_workers=None, timeout=None):
+    """
+    Configure the executors shared by fan_out.
+
+    @param max_workers: max number of concurrent tasks of each fan_out nesting level, 1 to run tasks sequentially
+    @param timeout: seconds to wait for all tasks of a fan_out call, None for no timeout
+    """
+    with _fan_out_lock:
+        if max_workers is not None:
+            _fan_out_config["max_workers"] = max(1, max_workers)
+        _fan_out_config["timeout"] = timeout if timeout else None
+        for executor in _fan_out_executors.values():
+            executor.shutdown(wait=False)
+        _fan_out_executors.clear()
+
+
+def _get_fan_out_executor(depth):
+    with _fan_out_lock:
+        if depth not in _fan_out_executors:
+            _fan_out_executors[depth] = ThreadPoolExecutor(max_workers=_fan_out_config["max_workers"],
+                                                           thread_name_prefix="fan_out_{}".format(depth))
+        return _fan_out_executors[depth]
+
+
+@contextmanager
+def sequential_fan_out():
+    """
+    Run the fan_out calls made by current thread in the context sequentially, like:
+
+        with sequential_fan_out():
+            duthosts.shell("config reload -y")
+    """
+    sequential = _fan_out_state.sequential
+    _fan_out_state.sequential = True
+    try:
+        yield
+    finally:
+        _fan_out_state.sequential = sequential
+
+
+def fan_out(func, targets, names=None, description="fan_out"):
+    """
+    Call func on each of the targets concurrently with the shared bounded executors.
+
+    Errors are collected after all the calls are done. The exception of the first failed target is re-raised
+    unchanged, so callers see the same exception as with sequential calls. When more calls failed, the
+    exceptions of all the failed targets are logged and attached to it as attribute fan_out_errors,
+    a dict of target name and exception.
+
+    @param func: function to call with a target as the only argument
+    @param targets: list of targets, like hosts or ASICs
+    @param names: names of the targets used in log and errors, str(target) by default
+    @param description: description of the call used in log and errors
+    @return: list of results of calling func, in the same order as targets
+    """
+    targets = list(targets)
+    names = names or [str(target) for target in targets]
+    if len(targets) <= 1 or _fan_out_config["max_workers"] <= 1 or _fan_out_state.sequential:
+        return [func(target) for target in targets]
+
+    depth = _fan_out_state.depth
+    elapsed = [None] * len(targets)
+
+    def _call(index):
+        _fan_out_state.depth = depth + 1
+        call_start = time.time()
+        try:
+            return func(targets[index])
+        finally:
+            elapsed[index] = time.time() - call_start
+
+    start = time.time()
+    executor = _get_fan_out_executor(depth)
+    futures = [executor.submit(_call, index) for index in range(len(targets))]
+    _, not_done = wait(futures, timeout=_fan_out_config["timeout"])
+    total = time.time() - start
+    if not_done:
+        pending = [name for name, future in zip(names, futures) if future in not_done]
+        raise TimeoutError("{} timed out after {} seconds on {}".format(description, _fan_out_config["timeout"],
+                                                                        pending))
+
+    results, errors = [], {}
+    for name, future in zip(names, futures):
+        error = future.exception()
+        if error is not None:
+            errors[name] = error
+            results.append(None)
+        else:
+            results.append(future.result())
+
+    slowest = max(range(len(targets)), key=lambda index: elapsed[index])
+    logger.info("{} on {} targets took {:.2f}s, slowest {} {:.2f}s, sequential would take {:.2f}s, failed: {}".format(
+        description, len(targets), total, names[slowest], elapsed[slowest], sum(elapsed), list(errors.keys())))
+
+    if errors:
+        first_error = list(errors.values())[0]
+        if len(errors) > 1:
+            for name, error in list(errors.items())[1:]:
+                logger.error("{} failed on {}: {}".format(description, name, repr(error)))
+            first_error.fan_out_errors = errors
+        raise first_error
+    return results
+
+
 def parallel_run_threaded(target_functions, timeout=10, thread_count=2):
     """
     Run target functions with a thread pool.
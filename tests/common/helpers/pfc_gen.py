@@ -5,16 +5,26 @@ Script to generate PFC packets.
 
 """
 import binascii
+import errno
 import sys
 import optparse
 import logging
 import logging.handlers
+import signal
 import time
-from socket import socket, AF_PACKET, SOCK_RAW
+from socket import socket, error as socket_error, AF_PACKET, SOCK_RAW
 
 logger = logging.getLogger('MyLogger')
 logger.setLevel(logging.DEBUG)
 
+# time.monotonic is not available in python2
+_monotonic = getattr(time, 'monotonic', time.time)
+
+# In paced mode, sleep until this long before the send time of the next burst, then busy-wait for the rest, so that
+# the oversleep of time.sleep does not delay the burst
+BUSY_WAIT_TIME = 0.001
+DEFAULT_BURST = 8
+
 
 def checksum(msg):
     s = 0
@@ -33,6 +43,87 @@ def checksum(msg):
     return s
 
 
+class StormStopped(Exception):
+    pass
+
+
+def _raise_storm_stopped(signum, frame):
+    raise StormStopped()
+
+
+class PauseFrameSender(object):
+    """
+    Send a prebuilt pause frame to a list of raw sockets, one frame to each socket per iteration.
+
+    The number of iterations done is kept in 'sent', so that the achieved rate can still be reported when the sending
+    is interrupted, e.g. the storm is stopped by pkill.
+    """
+
+    def __init__(self, sockets, packet):
+        self.sockets = sockets
+        self.packet = packet
+        self.sent = 0
+        self.start = None
+        self.end = None
+
+    @property
+    def elapsed(self):
+        if self.start is None:
+            return 0.0
+        return (self.end if self.end is not None else _monotonic()) - self.start
+
+    @property
+    def achieved_rate(self):
+        """Frames per second sent to each interface."""
+        elapsed = self.elapsed
+        return self.sent / elapsed if elapsed else 0.0
+
+    def _send_all(self):
+        for s in self.sockets:
+            while True:
+                try:
+                    s.send(self.packet)
+                    break
+                except socket_error as e:
+                    # The queue of the interface is full, retry until it is drained
+                    if e.errno != errno.ENOBUFS:
+                        raise
+
+    def send(self, num, interval):
+        """Send num iterations, sleep interval seconds after each frame."""
+        self.start = _monotonic()
+        while self.sent < num:
+            for s in self.sockets:
+                s.send(self.packet)
+                if interval:
+                    time.sleep(interval)
+            self.sent += 1
+        self.end = _monotonic()
+
+    def send_paced(self, num, rate, burst):
+        """
+        Send num iterations at rate iterations per second, in bursts of burst back-to-back iterations.
+
+        The send time of each burst is computed from the start time, so the oversleep and the time of sending one burst
+        do not add up. A late burst is sent immediately.
+        """
+        period = float(burst) / rate
+        self.start = _monotonic()
+        next_burst = 0
+        while self.sent < num:
+            deadline = self.start + next_burst * period
+            remaining = deadline - _monotonic()
+            if remaining > BUSY_WAIT_TIME:
+                time.sleep(remaining - BUSY_WAIT_TIME)
+            while _monotonic() < deadline:
+                pass
+            for _ in range(min(burst, num - self.sent)):
+                self._send_all()
+                self.sent += 1
+            next_burst += 1
+        self.end = _monotonic()
+
+
 def main():
     usage = "usage: %prog [options] arg1 arg2"
     parser = optparse.OptionParser(usage=usage)
@@ -50,6 +141,12 @@ def main():
                       help="Send global pause frames (not PFC)", default=False)
     parser.add_option("-s", "--send_pfc_frame_interval", type="float", dest="send_pfc_frame_interval",
                       help="Interval sending pfc frame", metavar="send_pfc_frame_interval", default=0)
+    parser.add_option("-R", "--rate", type="float", dest="rate",
+                      help="Send frames at this rate per interface in frames per second, paced by busy-waiting, "
+                      "instead of sleeping send_pfc_frame_interval after each frame", metavar="rate", default=0)
+    parser.add_option("-b", "--burst", type="int", dest="burst",
+                      help="Number of frames sent back-to-back to each interface in paced mode", metavar="burst",
+                      default=DEFAULT_BURST)
 
     (options, args) = parser.parse_args()
 
@@ -75,6 +172,16 @@ def main():
         parser.print_help()
         sys.exit(1)
 
+    if options.rate < 0 or (options.rate and options.send_pfc_frame_interval):
+        print("Rate is not valid. Need to be positive, and '-s' option should not be set.")
+        parser.print_help()
+        sys.exit(1)
+
+    if options.burst < 1:
+        print("Burst is not valid. Need to be at least 1.")
+        parser.print_help()
+        sys.exit(1)
+
     interfaces = options.interface.split(',')
 
     try:
@@ -156,14 +263,25 @@ def main():
 
     pre_str = 'GLOBAL_PF' if options.global_pf else 'PFC'
     print(("Generating %s Packet(s)" % options.num))
+    # The storm is usually stopped by pkill, still report the achieved rate then
+    signal.signal(signal.SIGTERM, _raise_storm_stopped)
+    sender = PauseFrameSender(sockets, packet)
     logger.debug(pre_str + '_STORM_START')
-    iteration = options.num
-    while iteration > 0:
-        for s in sockets:
-            s.send(packet)
-            time.sleep(options.send_pfc_frame_interval)
-        iteration -= 1
-    logger.debug(pre_str + '_STORM_END')
+    try:
+        if options.rate:
+            sender.send_paced(options.num, options.rate, options.burst)
+        else:
+            sender.send(options.num, options.send_pfc_frame_interval)
+        logger.debug(pre_str + '_STORM_END')
+    except (StormStopped, KeyboardInterrupt):
+        pass
+
+    stats = "Sent %d frame(s) to each of %d interface(s) in %.3f seconds, %.1f pps per interface" % (
+        sender.sent, len(sockets), sender.elapsed, sender.achieved_rate)
+    if options.rate:
+        stats += ", requested %.1f pps" % options.rate
+    print(stats)
+    logger.debug(stats)
 
 
 if __name__ == "__main__":
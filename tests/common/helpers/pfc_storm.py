@@ -30,7 +30,9 @@ class PFCStorm(object):
                 pfc_queue_index(int) : queue on which the PFC storm should be generated. default: 3
                 pfc_frames_number(int) : Number of PFC frames to generate. default: 100000
                 pfc_gen_file(string): Script which generates the PFC traffic. default: 'pfc_gen.py'
-                Other keys: 'pfc_storm_defer_time', 'pfc_storm_stop_defer_time', 'pfc_asym'
+                Other keys: 'pfc_storm_defer_time', 'pfc_storm_stop_defer_time', 'pfc_asym', 'pfc_send_rate'
+                    (frames per second per interface, paced by pfc_gen.py instead of sleeping between frames),
+                    'pfc_send_burst' (frames sent back-to-back per interface in paced mode)
         """
         self.dut = duthost
         hostvars = self.dut.host.options['variable_manager']._hostvars[self.dut.hostname]
@@ -148,6 +150,10 @@ class PFCStorm(object):
             self.extra_vars.update({"pfc_storm_stop_defer_time": self.pfc_storm_stop_defer_time})
         if getattr(self, "pfc_asym", None):
             self.extra_vars.update({"pfc_asym": self.pfc_asym})
+        if getattr(self, "pfc_send_rate", None):
+            self.extra_vars.update({"pfc_send_rate": self.pfc_send_rate})
+        if getattr(self, "pfc_send_burst", None):
+            self.extra_vars.update({"pfc_send_burst": self.pfc_send_burst})
 
     def _prepare_start_template(self):
         """
@@ -0,0 +1,168 @@
+"""Parser of the tabulated output of show commands, like 'show interface status'.
+
+The output is expected to have header lines, then a separation line with '-' under each column header, then the
+content lines. Both header and column content are within the width of '-' chars for that column.
+
+The column layout (positions and headers) is computed once for each distinct header and separation line and cached,
+content lines are then split with precomputed slices. Show commands are often run repeatedly in polling loops, so the
+same layout is parsed again and again.
+"""
+import logging
+
+from collections import deque
+from functools import lru_cache
+from operator import itemgetter
+
+logger = logging.getLogger(__name__)
+
+SEP_CHAR = '-'
+
+
+def is_sep_line(line, sep_char=SEP_CHAR):
+    """Check whether a line is a separation line, which has only spaces and at least one sep_char.
+
+    Same as matching regex r"^( *-+ *)+$", without the backtracking of the nested repetition on long lines.
+    """
+    return sep_char in line and not line.strip(' ' + sep_char)
+
+
+def parse_column_positions(sep_line, sep_char=SEP_CHAR):
+    """Parse the position of each columns in the command output
+
+    Args:
+        sep_line: The output line separating actual data and column headers
+        sep_char: The character used in separation line. Defaults to '-'.
+
+    Returns:
+        Returns a list. Each item is a tuple with two elements. The first element is start position of a column.
+        The second element is the end position of the column.
+    """
+    prev = ' ',
+    positions = []
+    for pos, char in enumerate(sep_line + ' '):
+        if char == sep_char:
+            if char != prev:
+                left = pos
+        else:
+            if char != prev:
+                right = pos
+                positions.append((left, right))
+        prev = char
+    return positions
+
+
+class ShowTableLayout(object):
+    """Column layout of a show command output.
+
+    Attributes:
+        headers: List of column headers in lowercase, multiple header lines of a column are joined by space.
+        slices: List of slice objects of the columns.
+    """
+
+    def __init__(self, header_lines, sep_line):
+        positions = parse_column_positions(sep_line)
+        self.headers = [
+            " ".join([header_line[left:right].strip().lower() for header_line in header_lines]).strip()
+            for left, right in positions
+        ]
+        self.slices = [slice(left, right) for left, right in positions]
+        if len(self.slices) == 1:
+            # itemgetter returns the item itself instead of a tuple when there is only one item
+            _getter = itemgetter(self.slices[0])
+            self._getter = lambda line: (_getter(line),)
+        else:
+            self._getter = itemgetter(*self.slices)
+
+    def split(self, line):
+        """Split a content line into list of stripped column values."""
+        return list(map(str.strip, self._getter(line)))
+
+    def parse_row(self, line):
+        """Parse a content line into a dict keyed by column headers."""
+        return dict(zip(self.headers, map(str.strip, self._getter(line))))
+
+
+@lru_cache(maxsize=256)
+def get_layout(header_lines, sep_line):
+    """Get the cached column layout of the header lines (tuple) and separation line."""
+    return ShowTableLayout(header_lines, sep_line)
+
+
+def _content_lines(lines):
+    # When an empty line is encountered while parsing the tabulate content, it is highly possible that the
+    # tabulate content has been drained. The empty line and rest of the lines should not be parsed.
+    for line in lines:
+        if len(line) == 0:
+            return
+        yield line
+
+
+def _find_table(output_lines, header_len):
+    for idx, line in enumerate(output_lines):
+        if is_sep_line(line):
+            try:
+                layout = get_layout(tuple(output_lines[idx - header_len:idx]), line)
+            except Exception as e:
+                logger.error('Possibly bad command output, exception: {}'.format(repr(e)))
+                return None, None
+            return layout, idx + 1
+    logger.error('Failed to find separation line in the show command output')
+    return None, None
+
+
+def parse_show_table(output_lines, header_len=1, as_columns=False):
+    """Parse the tabulated output of a show command.
+
+    Args:
+        output_lines: List of output lines of the show command.
+        header_len: Number of header lines above the separation line.
+        as_columns: Return the table column oriented if True.
+
+    Returns:
+        By default, a list of dict. Each dict is a content line, keyed by column headers in lowercase.
+        If as_columns is True, a dict keyed by column headers, the value is the list of the column values of all
+        content lines. Empty list or dict if the output cannot be parsed.
+    """
+    layout, start = _find_table(output_lines, header_len)
+    if layout is None:
+        return {} if as_columns else []
+
+    content_lines = _content_lines(output_lines[start:])
+    if not as_columns:
+        return list(map(layout.parse_row, content_lines))
+
+    rows = list(map(layout.split, content_lines))
+    columns = list(zip(*rows)) if rows else [() for _ in layout.headers]
+    return dict(zip(layout.headers, map(list, columns)))
+
+
+def iter_show_table(lines, header_len=1):
+    """Parse the tabulated output of a show command while reading it.
+
+    Args:
+        lines: Iterable of output lines, like a file object or the stdout of a process. Trailing line breaks are
+            ignored.
+        header_len: Number of header lines above the separation line.
+
+    Yields:
+        dict: Each content line, keyed by column headers in lowercase.
+    """
+    lines = (line.rstrip('\r\n') for line in lines)
+    header_lines = deque(maxlen=header_len)
+    layout = None
+    for line in lines:
+        if is_sep_line(line):
+            try:
+                layout = get_layout(tuple(header_lines) if header_len else (), line)
+            except Exception as e:
+                logger.error('Possibly bad command output, exception: {}'.format(repr(e)))
+                return
+            break
+        header_lines.append(line)
+
+    if layout is None:
+        logger.error('Failed to find separation line in the show command output')
+        return
+
+    for line in _content_lines(lines):
+        yield layout.parse_row(line)
@@ -3,6 +3,7 @@
 This plugin supports adding any mark to specified test cases based on conditions. All the information of test cases,
 marks, and conditions can be specified in a centralized file.
 """
+import hashlib
 import json
 import logging
 import os
@@ -12,6 +13,9 @@ import yaml
 import glob
 import pytest
 
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from tests.common.cache import DUT_FINGERPRINT_CMD
 from tests.common.testbed import TestbedInfo
 from .issue import check_issues
 
@@ -82,6 +86,13 @@ def load_conditions(session):
     if not conditions_files:
         pytest.fail('There is no conditions files')
 
+    # Parsing the conditions files is slow, reuse the conditions parsed by previous run if the files are not changed.
+    digest = get_conditions_files_digest(conditions_files)
+    conditions_cached = session.config.cache.get('TESTS_MARK_CONDITIONS_PARSED', None)
+    if conditions_cached and conditions_cached.get('digest') == digest:
+        logger.debug('Loaded test mark conditions files {} from cache'.format(conditions_files))
+        return conditions_cached['conditions']
+
     try:
         logger.debug('Trying to load test mark conditions files: {}'.format(conditions_files))
         for conditions_file in conditions_files:
@@ -94,9 +105,27 @@ def load_conditions(session):
         logger.error('Failed to load {}, exception: {}'.format(conditions_files, repr(e)), exc_info=True)
         pytest.fail('Loading conditions file "{}" failed. Possibly invalid yaml file.'.format(conditions_files))
 
+    session.config.cache.set('TESTS_MARK_CONDITIONS_PARSED', {'digest': digest, 'conditions': conditions_list})
     return conditions_list
 
 
+def get_conditions_files_digest(conditions_files):
+    """Get digest of the conditions files, for checking whether the parsed conditions cached on disk are still valid.
+
+    Args:
+        conditions_files (list): List of conditions file paths, the order of files matters.
+
+    Returns:
+        str: Hex digest of the names and contents of the files.
+    """
+    digest = hashlib.sha256()
+    for conditions_file in conditions_files:
+        digest.update(conditions_file.encode('utf-8'))
+        with open(conditions_file, 'rb') as f:
+            digest.update(hashlib.sha256(f.read()).digest())
+    return digest.hexdigest()
+
+
 def read_asic_name(hwsku):
     '''
     Get asic generation name from file 'ansible/group_vars/sonic/variables'
@@ -157,27 +186,67 @@ def load_dut_basic_facts(inv_name, dut_name):
     return results
 
 
+def load_dut_fingerprint(inv_name, dut_name):
+    """Run 'ansible -m shell' command to get fingerprint of the DUT image version and config.
+
+    Args:
+        inv_name (str): The name of inventory.
+        dut_name (str): The name of dut.
+
+    Returns:
+        str or None: Return the fingerprint or None if something went wrong.
+    """
+    logger.info('Getting dut fingerprint')
+    try:
+        inv_full_path = os.path.join(os.path.dirname(__file__), '../../../../ansible', inv_name)
+        ansible_cmd = ['ansible', '-m', 'shell', '-i', inv_full_path, dut_name, '-a', DUT_FINGERPRINT_CMD, '-o']
+        raw_output = subprocess.check_output(ansible_cmd).decode('utf-8')
+        logger.debug('raw dut fingerprint:\n{}'.format(raw_output))
+        match = re.search(r'\(stdout\)\s+([0-9a-f]{32})', raw_output)
+        if match:
+            return match.group(1)
+    except Exception as e:
+        logger.error('Failed to load dut fingerprint, exception: {}'.format(repr(e)))
+    return None
+
+
 def get_basic_facts(session):
+    """Get basic facts and store them in cache as 'BASIC_FACTS'.
+
+    The cached basic facts are reused as long as the testbed is the same and the image version and config of the DUT
+    are not changed. If the DUT fingerprint cannot be got, the cached basic facts of the same testbed are reused.
+
+    Args:
+        session (obj): Pytest session object.
+    """
     testbed_name = session.config.option.testbed
 
     testbed_name_cached = session.config.cache.get('TB_NAME', None)
     basic_facts_cached = session.config.cache.get('BASIC_FACTS', None)
+    fingerprint_cached = session.config.cache.get('BASIC_FACTS_FINGERPRINT', None)
 
-    if testbed_name_cached != testbed_name:
-        # clear chche
-        session.config.cache.set('TB_NAME', None)
-        session.config.cache.set('BASIC_FACTS', None)
+    fingerprint = None
+    if session.config.getoption("--dut_vendor", "sonic") == "sonic":
+        tbinfo = TestbedInfo(session.config.option.testbed_file).testbed_topo.get(testbed_name, None)
+        fingerprint = load_dut_fingerprint(get_inv_name(session, tbinfo), tbinfo['duts'][0])
 
-        # get basic facts
-        basic_facts = load_basic_facts(session)
+    if testbed_name_cached == testbed_name and basic_facts_cached and \
+            (fingerprint is None or fingerprint == fingerprint_cached):
+        logger.info('Use cached basic facts of testbed {}, dut fingerprint {}'.format(testbed_name, fingerprint))
+        return
 
-        # update cache
-        session.config.cache.set('TB_NAME', testbed_name)
-        session.config.cache.set('BASIC_FACTS', basic_facts)
-    else:
-        if not basic_facts_cached:
-            basic_facts = load_basic_facts(session)
-            session.config.cache.set('BASIC_FACTS', basic_facts)
+    # clear chche
+    session.config.cache.set('TB_NAME', None)
+    session.config.cache.set('BASIC_FACTS', None)
+    session.config.cache.set('BASIC_FACTS_FINGERPRINT', None)
+
+    # get basic facts
+    basic_facts = load_basic_facts(session)
+
+    # update cache
+    session.config.cache.set('TB_NAME', testbed_name)
+    session.config.cache.set('BASIC_FACTS', basic_facts)
+    session.config.cache.set('BASIC_FACTS_FINGERPRINT', fingerprint)
 
 
 def get_http_proxies(inv_name):
@@ -360,46 +429,46 @@ def load_basic_facts(session):
     results['testbed'] = testbed_name
 
     dut_name = tbinfo['duts'][0]
-    if session.config.option.customize_inventory_file:
-        inv_name = session.config.option.customize_inventory_file
-    elif 'inv_name' in list(tbinfo.keys()):
-        inv_name = tbinfo['inv_name']
-    else:
-        inv_name = 'lab'
+    inv_name = get_inv_name(session, tbinfo)
     proxies = get_http_proxies(inv_name)
     session.config.cache.set('PROXIES', proxies)
 
     # Since internal repo add vendor test support, add check to see if it's sonic-os, other wise skip load facts.
     vendor = session.config.getoption("--dut_vendor", "sonic")
     if vendor == "sonic":
-        # Load DUT basic facts
-        _facts = load_dut_basic_facts(inv_name, dut_name)
-        if _facts:
-            results.update(_facts)
+        # Each loader runs its own ansible command, run them concurrently. The facts are merged in the list order.
+        # Load possible other facts by adding the loader here.
+        loaders = [
+            load_dut_basic_facts,
+            load_minigraph_facts,
+            load_config_facts,
+            load_switch_capabilities_facts,
+        ]
+        with ThreadPoolExecutor(max_workers=len(loaders)) as executor:
+            futures = [executor.submit(loader, inv_name, dut_name) for loader in loaders]
+            for future in futures:
+                _facts = future.result()
+                if _facts:
+                    results.update(_facts)
 
-        # Load minigraph basic facts
-        _facts = load_minigraph_facts(inv_name, dut_name)
-        if _facts:
-            results.update(_facts)
-
-        # Load config basic facts
-        _facts = load_config_facts(inv_name, dut_name)
-        if _facts:
-            results.update(_facts)
+    return results
 
-        # Load switch capabilities basic facts
-        _facts = load_switch_capabilities_facts(inv_name, dut_name)
-        if _facts:
-            results.update(_facts)
 
-        # Load console basic facts
-        _facts = load_config_facts(inv_name, dut_name)
-        if _facts:
-            results.update(_facts)
+def get_inv_name(session, tbinfo):
+    """Get name of the inventory of the testbed.
 
-        # Load possible other facts here
+    Args:
+        session (obj): Pytest session object.
+        tbinfo (dict): Testbed info.
 
-    return results
+    Returns:
+        str: The name of inventory.
+    """
+    if session.config.option.customize_inventory_file:
+        return session.config.option.customize_inventory_file
+    elif 'inv_name' in list(tbinfo.keys()):
+        return tbinfo['inv_name']
+    return 'lab'
 
 
 def find_longest_matches(nodeid, conditions):
@@ -429,6 +498,65 @@ def find_longest_matches(nodeid, conditions):
     return longest_matches
 
 
+def build_conditions_trie(conditions):
+    """Build a prefix trie of the test case names in the conditions list.
+
+    Each trie node is a dict keyed by the next character of test case name. The None key of a node holds indexes of
+    the conditions whose test case name ends at the node.
+
+    Args:
+        conditions (list): List of conditions
+
+    Returns:
+        dict: Root node of the trie.
+    """
+    trie = {}
+    for index, condition in enumerate(conditions):
+        node = trie
+        # condition is a dict which has only one item, so we use condition.keys()[0] to get its key.
+        for char in list(condition.keys())[0]:
+            node = node.setdefault(char, {})
+        node.setdefault(None, []).append(index)
+    return trie
+
+
+def find_matches_in_trie(nodeid, conditions, conditions_trie):
+    """Find the matches of the given test case name using the prefix trie of the conditions list.
+
+    The result is the same as find_longest_matches, but the time taken is proportional to the length of test case
+    name instead of number of conditions.
+
+    Args:
+        nodeid (str): Full test case name
+        conditions (list): List of conditions
+        conditions_trie (dict): Prefix trie built from the conditions list by build_conditions_trie
+
+    Returns:
+        list: Matched conditions in the same order as in the conditions list
+    """
+    node = conditions_trie
+    indexes = list(node.get(None, []))
+    for char in nodeid:
+        node = node.get(char)
+        if node is None:
+            break
+        indexes.extend(node.get(None, []))
+    return [conditions[index] for index in sorted(indexes)]
+
+
+@lru_cache(maxsize=None)
+def compile_condition(condition_str):
+    """Compile a condition string to code object, so that the same condition string is only parsed once.
+
+    Args:
+        condition_str (str): Condition string with issue URLs already replaced.
+
+    Returns:
+        code: Code object that can be evaluated using python "eval()" function.
+    """
+    return compile(condition_str, '<condition>', 'eval')
+
+
 def update_issue_status(condition_str, session):
     """Replace issue URL with 'True' or 'False' based on its active state.
 
@@ -469,7 +597,8 @@ def update_issue_status(condition_str, session):
     return condition_str
 
 
-def evaluate_condition(dynamic_update_skip_reason, mark_details, condition, basic_facts, session):
+def evaluate_condition(dynamic_update_skip_reason, mark_details, condition, basic_facts, session,
+                       condition_results=None):
     """Evaluate a condition string based on supplied basic facts.
 
     Args:
@@ -481,6 +610,8 @@ def evaluate_condition(dynamic_update_skip_reason, mark_details, condition, basi
         basic_facts (dict): A one level dict with basic facts. Keys of the dict can be used as variables in the
             condition string evaluation.
         session (obj): Pytest session object, for getting cached data.
+        condition_results (dict): Optional cache of evaluation results of raw condition strings. It must only be
+            shared by evaluations using the same basic facts.
 
     Returns:
         bool: True or False based on condition string evaluation result.
@@ -488,21 +619,27 @@ def evaluate_condition(dynamic_update_skip_reason, mark_details, condition, basi
     if condition is None or condition.strip() == '':
         return True    # Empty condition item will be evaluated as True. Equivalent to be ignored.
 
-    condition_str = update_issue_status(condition, session)
-    try:
-        condition_result = bool(eval(condition_str, basic_facts))
-        if condition_result and dynamic_update_skip_reason:
-            mark_details['reason'].append(condition)
-        return condition_result
-    except Exception:
-        logger.error('Failed to evaluate condition, raw_condition={}, condition_str={}'.format(
-            condition,
-            condition_str))
-        return False
+    if condition_results is not None and condition in condition_results:
+        condition_result = condition_results[condition]
+    else:
+        condition_str = update_issue_status(condition, session)
+        try:
+            condition_result = bool(eval(compile_condition(condition_str), basic_facts))
+        except Exception:
+            logger.error('Failed to evaluate condition, raw_condition={}, condition_str={}'.format(
+                condition,
+                condition_str))
+            condition_result = False
+        if condition_results is not None:
+            condition_results[condition] = condition_result
+
+    if condition_result and dynamic_update_skip_reason:
+        mark_details['reason'].append(condition)
+    return condition_result
 
 
 def evaluate_conditions(dynamic_update_skip_reason, mark_details, conditions, basic_facts,
-                        conditions_logical_operator, session):
+                        conditions_logical_operator, session, condition_results=None):
     """Evaluate all the condition strings.
 
     Evaluate a single condition or multiple conditions. If multiple conditions are supplied, apply AND or OR
@@ -517,6 +654,7 @@ def evaluate_conditions(dynamic_update_skip_reason, mark_details, conditions, ba
             condition string evaluation.
         conditions_logical_operator (str): logical operator which should be applied to conditions(by default 'AND')
         session (obj): Pytest session object, for getting cached data.
+        condition_results (dict): Optional cache of evaluation results of raw condition strings.
 
     Returns:
         bool: True or False based on condition strings evaluation result.
@@ -526,15 +664,18 @@ def evaluate_conditions(dynamic_update_skip_reason, mark_details, conditions, ba
     if isinstance(conditions, list):
         # Apply 'AND' or 'OR' operation to list of conditions based on conditions_logical_operator(by default 'AND')
         if conditions_logical_operator == 'OR':
-            return any([evaluate_condition(dynamic_update_skip_reason, mark_details, c, basic_facts, session)
+            return any([evaluate_condition(dynamic_update_skip_reason, mark_details, c, basic_facts, session,
+                                           condition_results)
                         for c in conditions])
         else:
-            return all([evaluate_condition(dynamic_update_skip_reason, mark_details, c, basic_facts, session)
+            return all([evaluate_condition(dynamic_update_skip_reason, mark_details, c, basic_facts, session,
+                                           condition_results)
                         for c in conditions])
     else:
         if conditions is None or conditions.strip() == '':
             return True
-        return evaluate_condition(dynamic_update_skip_reason, mark_details, conditions, basic_facts, session)
+        return evaluate_condition(dynamic_update_skip_reason, mark_details, conditions, basic_facts, session,
+                                  condition_results)
 
 
 def pytest_collection(session):
@@ -581,11 +722,15 @@ def pytest_collection_modifyitems(session, config, items):
     logger.info('Available basic facts that can be used in conditional skip:\n{}'.format(
         json.dumps(basic_facts, indent=2)))
     dynamic_update_skip_reason = session.config.option.dynamic_update_skip_reason
+    conditions_trie = build_conditions_trie(conditions)
+    # Basic facts are the same for all the items, each distinct condition only needs to be evaluated once.
+    condition_results = {}
     for item in items:
-        longest_matches = find_longest_matches(item.nodeid, conditions)
+        longest_matches = find_matches_in_trie(item.nodeid, conditions, conditions_trie)
 
         if longest_matches:
-            logger.debug('Found match "{}" for test case "{}"'.format(longest_matches, item.nodeid))
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug('Found match "{}" for test case "{}"'.format(longest_matches, item.nodeid))
 
             for match in longest_matches:
                 # match is a dict which has only one item, so we use match.values()[0] to get its value.
@@ -601,7 +746,8 @@ def pytest_collection_modifyitems(session, config, items):
                             add_mark = True
                         else:
                             add_mark = evaluate_conditions(dynamic_update_skip_reason, mark_details, mark_conditions,
-                                                           basic_facts, conditions_logical_operator, session)
+                                                           basic_facts, conditions_logical_operator, session,
+                                                           condition_results)
 
                     if add_mark:
                         reason = ''
@@ -9,6 +9,12 @@ from tests.common.helpers.parallel import parallel_run, reset_ansible_local_tmp
 def pytest_addoption(parser):
     parser.addoption("--disable_loganalyzer", action="store_true", default=False,
                      help="disable loganalyzer analysis for 'loganalyzer' fixture")
+    parser.addoption("--loganalyzer_streaming", action="store_true", default=False,
+                     help="analyze extracted logs with the streaming loganalyzer")
+    parser.addoption("--loganalyzer_on_dut", action="store_true", default=False,
+                     help="analyze extracted logs on the DUT and only return the verdict")
+    parser.addoption("--loganalyzer_fetch_on_failure", action="store_true", default=False,
+                     help="with --loganalyzer_on_dut, download the extracted logs when analysis fails")
 
 
 @reset_ansible_local_tmp
@@ -50,7 +56,10 @@ def loganalyzer(duthosts, request):
     analyzers = {}
     parallel_run(analyzer_logrotate, [], {}, duthosts, timeout=120)
     for duthost in duthosts:
-        analyzer = LogAnalyzer(ansible_host=duthost, marker_prefix=request.node.name)
+        analyzer = LogAnalyzer(ansible_host=duthost, marker_prefix=request.node.name,
+                               streaming=request.config.getoption("--loganalyzer_streaming"),
+                               on_dut=request.config.getoption("--loganalyzer_on_dut"),
+                               fetch_logs_on_failure=request.config.getoption("--loganalyzer_fetch_on_failure"))
         analyzer.load_common_config()
         analyzers[duthost.hostname] = analyzer
     markers = parallel_run(analyzer_add_marker, [analyzers], {}, duthosts, timeout=120)
@@ -1,6 +1,8 @@
+import json
 import logging
 import os
 import re
+import shlex
 import time
 import pprint
 
@@ -71,11 +73,14 @@ class LogAnalyzerError(Exception):
 
 
 class LogAnalyzer:
-    def __init__(self, ansible_host, marker_prefix, dut_run_dir="/tmp", start_marker=None, additional_files={}):
+    def __init__(self, ansible_host, marker_prefix, dut_run_dir="/tmp", start_marker=None, additional_files={},
+                 streaming=False, on_dut=False, fetch_logs_on_failure=False):
         self.ansible_host = ansible_host
         ansible_host.loganalyzer = self
         self.dut_run_dir = dut_run_dir
         self.extracted_syslog = os.path.join(self.dut_run_dir, "syslog")
+        # Inode and offset of the start markers in the log files, used by extract_log to skip scanning rotated logs
+        self.marker_state_file = os.path.join(self.dut_run_dir, "loganalyzer_markers.json")
         self.marker_prefix = marker_prefix.replace(' ', '_')
         # use existing syslog msg as marker to search in logs instead of writing a new one
         self.start_marker = start_marker
@@ -87,6 +92,12 @@ class LogAnalyzer:
         self.expected_matches_target = 0
         self._markers = []
         self.fail = True
+        # Use the streaming analyzer instead of loading the extracted logs into memory
+        self.streaming = streaming
+        # Analyze the extracted logs on the DUT and only return the verdict
+        self.on_dut = on_dut
+        # In on-DUT mode, download the extracted logs only when analysis found a problem
+        self.fetch_logs_on_failure = fetch_logs_on_failure
 
         self.additional_files = list(additional_files.keys())
         self.additional_start_str = list(additional_files.values())
@@ -275,8 +286,8 @@ class LogAnalyzer:
         Adds the marker to the log files
         """
         start_marker = ".".join((self.marker_prefix, time.strftime("%Y-%m-%d-%H:%M:%S", time.gmtime())))
-        cmd = "python {run_dir}/loganalyzer.py --action init --run_id {start_marker}"\
-            .format(run_dir=self.dut_run_dir, start_marker=start_marker)
+        cmd = "python {run_dir}/loganalyzer.py --action init --run_id {start_marker} --state_file {state_file}"\
+            .format(run_dir=self.dut_run_dir, start_marker=start_marker, state_file=self.marker_state_file)
         if log_files:
             cmd += " --logs {}".format(','.join(log_files))
 
@@ -319,7 +330,7 @@ class LogAnalyzer:
 
             # On DUT extract syslog files from /var/log/ and create one file by location - /tmp/syslog
             self.ansible_host.extract_log(directory='/var/log', file_prefix='syslog', start_string=start_string,
-                                          target_filename=self.extracted_syslog)
+                                          target_filename=self.extracted_syslog, state_file=self.marker_state_file)
             for idx, path in enumerate(self.additional_files):
                 file_dir, file_name = split(path)
                 extracted_file_name = os.path.join(self.dut_run_dir, file_name)
@@ -328,35 +339,21 @@ class LogAnalyzer:
                 else:
                     start_str = start_string
                 self.ansible_host.extract_log(directory=file_dir, file_prefix=file_name, start_string=start_str,
-                                              target_filename=extracted_file_name)
-
-        # Download extracted logs from the DUT to the temporal folder defined in SYSLOG_TMP_FOLDER
-        self.save_extracted_log(dest=tmp_folder)
-        file_list = [tmp_folder]
+                                              target_filename=extracted_file_name,
+                                              state_file=self.marker_state_file)
 
+        # Extracted files on the DUT and the local paths they are downloaded to
+        extracted_files = [(self.extracted_syslog, tmp_folder)]
         for path in self.additional_files:
             file_dir, file_name = split(path)
             extracted_file_name = os.path.join(self.dut_run_dir, file_name)
-            tmp_folder = ".".join((extracted_file_name, timestamp))
-            self.save_extracted_file(dest=tmp_folder, src=extracted_file_name)
-            file_list.append(tmp_folder)
+            extracted_files.append((extracted_file_name, ".".join((extracted_file_name, timestamp))))
 
-        match_messages_regex = re.compile('|'.join(self.match_regex)) if len(self.match_regex) else None
-        ignore_messages_regex = re.compile('|'.join(self.ignore_regex)) if len(self.ignore_regex) else None
-        expect_messages_regex = re.compile('|'.join(self.expect_regex)) if len(self.expect_regex) else None
-
-        logging.debug("Analyze files {}".format(file_list))
-        logging.debug('    match_regex="{}"'.format(match_messages_regex.pattern if match_messages_regex else ''))
-        logging.debug('    ignore_regex="{}"'.format(ignore_messages_regex.pattern if ignore_messages_regex else ''))
-        logging.debug('    expect_regex="{}"'.format(expect_messages_regex.pattern if expect_messages_regex else ''))
-        analyzer_parse_result = self.ansible_loganalyzer.analyze_file_list(
-            file_list, match_messages_regex, ignore_messages_regex, expect_messages_regex,
-            maximum_log_length=maximum_log_length)
-        # Print file content and remove the file
-        for folder in file_list:
-            with open(folder) as fo:
-                logging.debug("{} file content:\n\n{}".format(folder, fo.read()))
-            os.remove(folder)
+        if self.on_dut:
+            analyzer_parse_result = self._analyze_on_dut([src for src, _ in extracted_files], marker,
+                                                         maximum_log_length=maximum_log_length)
+        else:
+            analyzer_parse_result = self._analyze_locally(extracted_files, maximum_log_length=maximum_log_length)
 
         expected_lines_total = []
         unused_regex_messages = []
@@ -382,11 +379,106 @@ class LogAnalyzer:
         analyzer_summary["unused_expected_regexp"] = unused_regex_messages
         logging.debug("Analyzer summary: {}".format(pprint.pformat(analyzer_summary)))
 
+        if self.on_dut and self.fetch_logs_on_failure and \
+                (analyzer_summary["total"]["match"] or analyzer_summary["total"]["expected_missing_match"]):
+            self._fetch_extracted_files(extracted_files)
+
         if fail:
             self._verify_log(analyzer_summary)
         else:
             return analyzer_summary
 
+    def _fetch_extracted_files(self, extracted_files):
+        """
+        @summary: Download extracted files from the DUT, log their content and remove the local copies.
+
+        @param extracted_files: List of (DUT path, local path) tuples.
+        """
+        for src, dest in extracted_files:
+            self.save_extracted_file(dest=dest, src=src)
+        self._log_and_remove_files([dest for _, dest in extracted_files])
+
+    def _log_and_remove_files(self, file_list):
+        """
+        @summary: Print content of the downloaded files and remove them.
+        """
+        for folder in file_list:
+            with open(folder) as fo:
+                logging.debug("{} file content:\n\n{}".format(folder, fo.read()))
+            os.remove(folder)
+
+    def _analyze_locally(self, extracted_files, maximum_log_length=None):
+        """
+        @summary: Download extracted files from the DUT and analyze them on the ansible host.
+
+        @param extracted_files: List of (DUT path, local path) tuples.
+        @param maximum_log_length: The long message (length > maximum_log_length) will be skipped.
+        @return: Map <local file path, [matching lines, expected lines]>
+        """
+        for src, dest in extracted_files:
+            self.save_extracted_file(dest=dest, src=src)
+        file_list = [dest for _, dest in extracted_files]
+
+        match_messages_regex = re.compile('|'.join(self.match_regex)) if len(self.match_regex) else None
+        ignore_messages_regex = re.compile('|'.join(self.ignore_regex)) if len(self.ignore_regex) else None
+        expect_messages_regex = re.compile('|'.join(self.expect_regex)) if len(self.expect_regex) else None
+
+        logging.debug("Analyze files {}".format(file_list))
+        logging.debug('    match_regex="{}"'.format(match_messages_regex.pattern if match_messages_regex else ''))
+        logging.debug('    ignore_regex="{}"'.format(ignore_messages_regex.pattern if ignore_messages_regex else ''))
+        logging.debug('    expect_regex="{}"'.format(expect_messages_regex.pattern if expect_messages_regex else ''))
+        analyzer_parse_result = self.ansible_loganalyzer.analyze_file_list(
+            file_list, match_messages_regex, ignore_messages_regex, expect_messages_regex,
+            maximum_log_length=maximum_log_length, streaming=self.streaming)
+        if self.streaming:
+            logging.info("Loganalyzer streaming stats: {}".format(self.ansible_loganalyzer.stream_stats))
+        self._log_and_remove_files(file_list)
+
+        return analyzer_parse_result
+
+    def ship_rules(self, marker):
+        """
+        @summary: Copy the current match/ignore/expect rule set to the DUT.
+
+        Like loganalyzer.py, the rule set is copied for every analysis. The file is named after the marker of the
+        analysis and is removed by the analysis, so rule set files don't pile up on the DUT.
+
+        @param marker: Marker obtained from "init" method.
+        @return: Path of the rule set file on the DUT.
+        """
+        rules = json.dumps({"match": self.match_regex, "ignore": self.ignore_regex, "expect": self.expect_regex},
+                           sort_keys=True)
+        rules_file = os.path.join(self.dut_run_dir, "loganalyzer_rules.{}.json".format(marker))
+        logging.debug("Copy loganalyzer rule set {} to {}".format(rules_file, self.ansible_host.hostname))
+        self.ansible_host.copy(content=rules, dest=rules_file)
+        return rules_file
+
+    def _analyze_on_dut(self, file_list, marker, maximum_log_length=None):
+        """
+        @summary: Analyze extracted files on the DUT, only the verdict is returned to the ansible host.
+
+        @param file_list: Paths of the extracted files on the DUT.
+        @param marker: Marker obtained from "init" method.
+        @param maximum_log_length: The long message (length > maximum_log_length) will be skipped.
+        @return: Map <DUT file path, [matching lines, expected lines]>
+        """
+        rules_file = self.ship_rules(marker)
+        cmd = "python {run_dir}/loganalyzer.py --action analyze_json --run_id {marker} --logs {logs} " \
+              "--rules_file {rules_file} --streaming"\
+            .format(run_dir=self.dut_run_dir, marker=shlex.quote(marker), logs=",".join(file_list),
+                    rules_file=shlex.quote(rules_file))
+        if self.start_marker:
+            cmd += " --start_marker {}".format(shlex.quote(self.start_marker))
+        if maximum_log_length is not None:
+            cmd += " --max_log_length {}".format(maximum_log_length)
+        # Remove the rule set file in the same run, keep the exit code of the analysis
+        cmd += "; rc=$?; rm -f {}; exit $rc".format(shlex.quote(rules_file))
+
+        logging.debug("Analyze files {} on DUT with rule set {}".format(file_list, rules_file))
+        output = json.loads(self.ansible_host.shell(cmd)["stdout_lines"][-1])
+        logging.info("Loganalyzer streaming stats: {}".format(output["stats"]))
+        return output["result"]
+
     def save_extracted_log(self, dest):
         """
         @summary: Download extracted syslog log file to the ansible host.
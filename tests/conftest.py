@@ -25,7 +25,7 @@ from tests.common.devices.duthosts import DutHosts
 from tests.common.devices.vmhost import VMHost
 from tests.common.devices.base import NeighborDevice
 from tests.common.devices.cisco import CiscoHost
-from tests.common.helpers.parallel import parallel_run
+from tests.common.helpers.parallel import parallel_run, configure_fan_out
 from tests.common.fixtures.duthost_utils import backup_and_restore_config_db_session    # noqa F401
 from tests.common.fixtures.ptfhost_utils import ptf_portmap_file                        # noqa F401
 from tests.common.fixtures.ptfhost_utils import ptf_test_port_map_active_active         # noqa F401
@@ -45,7 +45,7 @@ from tests.common.utilities import get_test_server_host
 from tests.common.utilities import str2bool
 from tests.common.utilities import safe_filename
 from tests.common.helpers.dut_utils import is_supervisor_node, is_frontend_node
-from tests.common.cache import FactsCache
+from tests.common.cache import FactsCache, DUT_FINGERPRINT_CMD
 from tests.common.config_reload import config_reload
 from tests.common.connections.console_host import ConsoleHost
 
@@ -185,10 +185,39 @@ def pytest_addoption(parser):
     parser.addoption("--public_docker_registry", action="store_true", default=False,
                      help="To use public docker registry for syncd swap, by default is disabled (False)")
 
+    ############################
+    #   facts cache options    #
+    ############################
+    parser.addoption("--facts_cache_fingerprint", action="store_true", default=False,
+                     help="Invalidate cached DUT facts when DUT image version or config_db changed")
+
+    ############################
+    #   DUT connection options #
+    ############################
+    parser.addoption("--ssh_fast_path", action="store_true", default=False,
+                     help="Run shell/command on DUTs over a persistent SSH connection instead of Ansible")
+    parser.addoption("--fanout_max_workers", action="store", type=int, default=16,
+                     help="Max number of concurrent calls when a call is run on all DUTs or all ASICs, "
+                          "1 to run the calls sequentially. Calls in a 'with sequential_fan_out()' block of "
+                          "tests.common.helpers.parallel are always run sequentially")
+    parser.addoption("--fanout_timeout", action="store", type=int, default=0,
+                     help="Timeout in seconds of a call run on all DUTs or all ASICs, 0 for no timeout")
+
+
+def pytest_terminal_summary(terminalreporter):
+    stats = cache.stats
+    terminalreporter.write_sep("-", "facts cache")
+    terminalreporter.write_line(
+        "hits: {}, misses: {}, evictions: {}, disk reads: {}, writes: {}, in memory: {} entries / {} bytes".format(
+            stats.get("hits", 0), stats.get("misses", 0), stats.get("evictions", 0), stats.get("disk_reads", 0),
+            stats.get("writes", 0), stats["memory_entries"], stats["memory_usage"]))
+
 
 def pytest_configure(config):
     if config.getoption("enable_macsec"):
         config.pluginmanager.register(MacsecPlugin())
+    configure_fan_out(max_workers=config.getoption("fanout_max_workers"),
+                      timeout=config.getoption("fanout_timeout"))
 
 
 @pytest.fixture(scope="session", autouse=True)
@@ -315,7 +344,24 @@ def fixture_duthosts(enhance_inventory, ansible_adhoc, tbinfo, request):
         mandatory argument for the class constructors.
     @param tbinfo: fixture provides information about testbed.
     """
-    return DutHosts(ansible_adhoc, tbinfo, get_specified_duts(request))
+    duts = get_specified_duts(request)
+    if request.config.getoption("--facts_cache_fingerprint"):
+        check_facts_cache_fingerprint(ansible_adhoc, duts)
+    SonicHost.ssh_fast_path = request.config.getoption("--ssh_fast_path")
+    return DutHosts(ansible_adhoc, tbinfo, duts)
+
+
+def check_facts_cache_fingerprint(ansible_adhoc, duts):
+    """
+    Invalidate cached facts of the DUTs whose image version or config_db changed since the facts were cached.
+    Must run before the DUT host objects are created, because they read cached facts in constructor.
+    """
+    for dut in duts:
+        res = ansible_adhoc(become=True)[dut].shell(DUT_FINGERPRINT_CMD)[dut]
+        if res.get("failed", False) or res.get("rc", 0) != 0:
+            logger.warning("Failed to get facts cache fingerprint of {}: {}".format(dut, res.get("stderr")))
+            continue
+        cache.check_fingerprint(dut, res["stdout"].split()[0])
 
 
 @pytest.fixture(scope="session")
@@ -120,6 +120,8 @@ def test_basic_fib(duthosts, ptfhost, ipv4, ipv6, mtu,
             "ipv6": ipv6,
             "testbed_mtu": mtu,
             "test_balancing": test_balancing,
+            # balancing is not tested on vs, so are the paced bursts of batch balancing
+            "batch_balancing": test_balancing,
             "ignore_ttl": ignore_ttl,
             "single_fib_for_duts": single_fib_for_duts,
             "switch_type": switch_type,
@@ -0,0 +1,238 @@
+import glob
+import importlib.util
+import logging
+import math
+import os
+import time
+
+import pytest
+
+from tests.common.helpers.assertions import pytest_assert
+
+pytestmark = [
+    pytest.mark.disable_loganalyzer,
+    pytest.mark.topology("any"),
+    pytest.mark.device_type("vs"),
+]
+
+logger = logging.getLogger(__name__)
+
+ANSIBLE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../../ansible")
+TOPO_NAMES = sorted(os.path.basename(path)[len("topo_"):-len(".yml")]
+                    for path in glob.glob(os.path.join(ANSIBLE_DIR, "vars/topo_*.yml")))
+
+ITERATIONS = 5
+
+BENCHMARK_CASES = {
+    "t1 spine 200x16x2 both": dict(family="both", podset_number=200, tor_number=16, tor_subnet_number=2,
+                                   spine_asn=None, max_tor_subnet_number=16, topo="t1", router_type="spine"),
+    "t2 core 400x16x8 both": dict(family="both", podset_number=400, tor_number=16, tor_subnet_number=8,
+                                  spine_asn=65100, max_tor_subnet_number=32, topo="t2", router_type="core"),
+    "t0 leaf 200x16x2 v4": dict(family="v4", podset_number=200, tor_number=16, tor_subnet_number=2,
+                                spine_asn=65534, max_tor_subnet_number=16, topo="t0", router_type="leaf"),
+}
+
+
+@pytest.fixture(scope="module")
+def announce_routes():
+    spec = importlib.util.spec_from_file_location("announce_routes",
+                                                  os.path.join(ANSIBLE_DIR, "library/announce_routes.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def _legacy_generate_prefix(announce_routes, subnet_size, ip_base, offset):
+    """The prefix generator used before the prefix length was calculated by bit_length, kept as reference."""
+    ip = announce_routes.get_new_ip(ip_base, offset)
+    prefixlen = (ip_base.max_prefixlen - int(math.log(subnet_size, 2)))
+    return "{}/{}".format(ip, prefixlen)
+
+
+def _legacy_generate_routes(announce_routes, family, podset_number, tor_number, tor_subnet_number,
+                            spine_asn, leaf_asn_start, tor_asn_start, nexthop,
+                            nexthop_v6, tor_subnet_size, max_tor_subnet_number, topo,
+                            router_type="leaf", tor_index=None, set_num=None,
+                            no_default_route=False, core_ra_asn=None):
+    """The route generator used before routes were generated lazily per podset and tor, kept as reference."""
+    if core_ra_asn is None:
+        core_ra_asn = announce_routes.CORE_RA_ASN
+    routes = []
+    if not no_default_route and router_type != "tor":
+        default_route_as_path = announce_routes.get_uplink_router_as_path(
+            router_type, spine_asn)
+
+        if topo != "t2" or (topo == "t2" and router_type == "core"):
+            if family in ["v4", "both"]:
+                routes.append(("0.0.0.0/0", nexthop, default_route_as_path))
+            if family in ["v6", "both"]:
+                routes.append(("::/0", nexthop_v6, default_route_as_path))
+
+    for podset in range(0, podset_number):
+        for tor in range(0, tor_number):
+            for subnet in range(0, tor_subnet_number):
+                if router_type == "core":
+                    if podset < 3:
+                        continue
+
+                    first_third_podset_number = int(
+                        math.ceil((podset_number - 3) / 3.0))
+                    second_third_podset_number = int(
+                        math.ceil(((podset_number - 3) * 2) / 3.0))
+
+                    if set_num is not None:
+                        if podset <= first_third_podset_number and set_num != 0:
+                            continue
+                        elif podset > first_third_podset_number and \
+                                podset < second_third_podset_number and set_num != 1:
+                            continue
+                if router_type == "spine" or router_type == "mgmtleaf":
+                    if podset == 0:
+                        continue
+                elif router_type == "leaf":
+                    if topo == 't2':
+                        if podset > 2:
+                            continue
+
+                        if set_num is not None:
+                            if podset == 0 and set_num != 0:
+                                continue
+                            elif podset == 1 and set_num != 1:
+                                continue
+                    elif topo == 't0-mclag':
+                        if podset > 1:
+                            continue
+                        if set_num is not None:
+                            if podset == 0 and set_num != 0:
+                                continue
+                            elif podset == 1 and set_num != 1:
+                                continue
+                    else:
+                        if podset == 0 and tor == 0:
+                            continue
+                elif router_type == "tor":
+                    if podset != 0:
+                        continue
+                    elif topo == "m0" and subnet == 0:
+                        continue
+                    elif tor != tor_index:
+                        continue
+
+                suffix = ((podset * tor_number * max_tor_subnet_number * tor_subnet_size) +
+                          (tor * max_tor_subnet_number * tor_subnet_size) +
+                          (subnet * tor_subnet_size))
+                octet2 = (168 + int(suffix / (256 ** 2)))
+                octet1 = (192 + int(octet2 / 256))
+                octet2 = (octet2 % 256)
+                octet3 = (int(suffix / 256) % 256)
+                octet4 = (suffix % 256)
+                prefixlen_v4 = (32 - int(math.log(tor_subnet_size, 2)))
+
+                prefix = "{}.{}.{}.{}/{}".format(octet1,
+                                                 octet2, octet3, octet4, prefixlen_v4)
+                prefix_v6 = "20%02X:%02X%02X:0:%02X::/64" % (
+                    octet1, octet2, octet3, octet4)
+
+                leaf_asn = leaf_asn_start + podset
+                tor_asn = tor_asn_start + tor
+
+                aspath = None
+                if router_type == "core":
+                    aspath = "{} {}".format(leaf_asn, core_ra_asn)
+                elif router_type == "spine" or router_type == "mgmtleaf":
+                    aspath = "{} {}".format(leaf_asn, tor_asn)
+                elif router_type == "leaf":
+                    if topo == "t2":
+                        aspath = "{}".format(tor_asn)
+                    elif topo == "t0-mclag":
+                        aspath = "{}".format(tor_asn)
+                    else:
+                        if podset == 0:
+                            aspath = "{}".format(tor_asn)
+                        else:
+                            aspath = "{} {} {}".format(
+                                spine_asn, leaf_asn, tor_asn)
+
+                if family in ["v4", "both"]:
+                    routes.append((prefix, nexthop, aspath))
+                if family in ["v6", "both"]:
+                    routes.append((prefix_v6, nexthop_v6, aspath))
+
+    return routes
+
+
+def _announced_routes(announce_routes, topo_name):
+    """Return the (port, routes) announced for topo_name, in the order of the route jobs."""
+    topo = announce_routes.read_topo(topo_name, ANSIBLE_DIR)
+    if not topo:
+        return None
+    is_storage_backend = "backend" in topo_name
+    topo_type = announce_routes.get_topo_type(topo_name)
+    if topo_type == "t0":
+        jobs = announce_routes.fib_t0(topo, no_default_route=is_storage_backend)
+    elif topo_type == "t1":
+        jobs = announce_routes.fib_t1_lag(topo, no_default_route=is_storage_backend)
+    elif topo_type == "t2":
+        jobs = announce_routes.fib_t2_lag(topo)
+    elif topo_type == "t0-mclag":
+        jobs = announce_routes.fib_t0_mclag(topo)
+    elif topo_type == "m0":
+        jobs = announce_routes.fib_m0(topo)
+    elif topo_type == "mx":
+        jobs = announce_routes.fib_mx(topo)
+    elif topo_type == "appliance":
+        jobs = announce_routes.fib_appliance(topo)
+    else:
+        return None
+    return [(job.port, list(job.routes() if callable(job.routes) else job.routes)) for job in jobs]
+
+
+def _patch_legacy_generators(monkeypatch, announce_routes):
+    def legacy_generate_routes(*args, **kwargs):
+        return _legacy_generate_routes(announce_routes, *args, **kwargs)
+
+    def legacy_generate_prefix(*args):
+        return _legacy_generate_prefix(announce_routes, *args)
+
+    monkeypatch.setattr(announce_routes, "iter_routes", legacy_generate_routes)
+    monkeypatch.setattr(announce_routes, "generate_routes", legacy_generate_routes)
+    monkeypatch.setattr(announce_routes, "generate_prefix", legacy_generate_prefix)
+
+
+@pytest.mark.parametrize("topo_name", TOPO_NAMES)
+def test_announce_routes_generation_result(announce_routes, monkeypatch, topo_name):
+    """The routes announced for every topology should be the same as the ones of the legacy generators."""
+    routes = _announced_routes(announce_routes, topo_name)
+    if routes is None:
+        pytest.skip("Routes are not announced for topology {}".format(topo_name))
+
+    with monkeypatch.context() as m:
+        _patch_legacy_generators(m, announce_routes)
+        expected = _announced_routes(announce_routes, topo_name)
+
+    pytest_assert(len(routes) == len(expected), "Route jobs of topology {} mismatch".format(topo_name))
+    for (port, job_routes), (expected_port, expected_routes) in zip(routes, expected):
+        pytest_assert(port == expected_port and job_routes == expected_routes,
+                      "Routes announced through port {} for topology {} mismatch".format(port, topo_name))
+
+
+def test_announce_routes_generation_benchmark(announce_routes):
+    """Compare the time of generating large route sets by the legacy generator and by the lazy generator."""
+    for case, params in BENCHMARK_CASES.items():
+        params = dict(params, leaf_asn_start=64600, tor_asn_start=65500, nexthop="10.0.0.1",
+                      nexthop_v6="fc00::1", tor_subnet_size=128)
+        timings = []
+        for generate in (lambda: _legacy_generate_routes(announce_routes, **params),
+                         lambda: announce_routes.generate_routes(**params)):
+            best = None
+            for _ in range(ITERATIONS):
+                start = time.time()
+                routes = generate()
+                elapsed = time.time() - start
+                best = elapsed if best is None else min(best, elapsed)
+            timings.append((len(routes), best))
+
+        pytest_assert(timings[0][0] == timings[1][0], "Number of routes of '{}' mismatch".format(case))
+        logger.info("'{}' ({} routes): legacy {:.1f}ms ({:.0f} routes/s), new {:.1f}ms ({:.0f} routes/s)".format(
+            case, timings[1][0], timings[0][1] * 1000, timings[0][0] / timings[0][1],
+            timings[1][1] * 1000, timings[1][0] / timings[1][1]))
@@ -20,6 +20,7 @@ Thrift SAI interface basic tests
 import time
 import sys
 import os
+import weakref
 
 from sai_base_test import interface_to_front_mapping
 from ptf.thriftutils import *       # noqa F403
@@ -86,6 +87,30 @@ is_bmv2 = ('BMV2_TEST' in os.environ) and (int(os.environ['BMV2_TEST']) == 1)
 # constants
 STOP_PORT_MAX_RATE = 1
 RELEASE_PORT_MAX_RATE = 0
+# Only the first 8 queues (unicast) of a port are read, multicast queues are not used
+UNICAST_QUEUE_NUM = 8
+
+# Port counters returned by sai_thrift_read_port_counters, the order is the counter index used by the tests
+PORT_COUNTER_IDS = [
+    SAI_PORT_STAT_IF_OUT_DISCARDS,
+    SAI_PORT_STAT_IF_IN_DISCARDS,
+    SAI_PORT_STAT_PFC_0_TX_PKTS,
+    SAI_PORT_STAT_PFC_1_TX_PKTS,
+    SAI_PORT_STAT_PFC_2_TX_PKTS,
+    SAI_PORT_STAT_PFC_3_TX_PKTS,
+    SAI_PORT_STAT_PFC_4_TX_PKTS,
+    SAI_PORT_STAT_PFC_5_TX_PKTS,
+    SAI_PORT_STAT_PFC_6_TX_PKTS,
+    SAI_PORT_STAT_PFC_7_TX_PKTS,
+    SAI_PORT_STAT_IF_OUT_OCTETS,
+    SAI_PORT_STAT_IF_OUT_UCAST_PKTS,
+    SAI_PORT_STAT_IN_DROPPED_PKTS,
+    SAI_PORT_STAT_OUT_DROPPED_PKTS,
+    SAI_PORT_STAT_IF_IN_UCAST_PKTS,
+    SAI_PORT_STAT_IF_IN_NON_UCAST_PKTS,
+    SAI_PORT_STAT_IF_OUT_NON_UCAST_PKTS,
+    SAI_PORT_STAT_IF_OUT_QLEN,
+]
 
 
 def switch_init(clients):
@@ -719,20 +744,80 @@ def sai_thrift_create_pool_profile(client, pool_type, size, threshold_mode):
     return pool_id
 
 
+class SaiCounterReader(object):
+    """
+    Counter reader of a thrift client.
+
+    The queue and PG OID lists of a port are got by one port attribute call on the first read of the port, and cached
+    for the lifetime of the client, which is a test. Each read then costs one stats call per object, all the counter ids
+    of interest of the object are read by that call.
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self._port_qos_oids = {}
+
+    def _get_port_qos_oids(self, port):
+        if port not in self._port_qos_oids:
+            queue_list = []
+            pg_list = []
+            port_attr_list = self.client.sai_thrift_get_port_attribute(port)
+            for attribute in port_attr_list.attr_list:
+                if attribute.id == SAI_PORT_ATTR_QOS_QUEUE_LIST:
+                    queue_list.extend(attribute.value.objlist.object_id_list)
+                elif attribute.id == SAI_PORT_ATTR_INGRESS_PRIORITY_GROUP_LIST:
+                    pg_list.extend(attribute.value.objlist.object_id_list)
+            self._port_qos_oids[port] = (queue_list, pg_list)
+        return self._port_qos_oids[port]
+
+    def get_queue_oids(self, port):
+        return self._get_port_qos_oids(port)[0]
+
+    def get_pg_oids(self, port):
+        return self._get_port_qos_oids(port)[1]
+
+    def read_port_counters(self, asic_type, port):
+        """Read PORT_COUNTER_IDS of the port and SAI_QUEUE_STAT_PACKETS of its unicast queues."""
+        if asic_type == 'mellanox':
+            # SAI_PORT_STAT_IF_OUT_QLEN is not supported, 0 is returned instead
+            counters_results = self.client.sai_thrift_get_port_stats(
+                port, PORT_COUNTER_IDS[:-1], len(PORT_COUNTER_IDS) - 1)
+            counters_results.append(0)
+        else:
+            counters_results = self.client.sai_thrift_get_port_stats(
+                port, PORT_COUNTER_IDS, len(PORT_COUNTER_IDS))
+        queue_counters_results = [results[0] for results in self.read_queue_stats(port, [SAI_QUEUE_STAT_PACKETS])]
+        return (counters_results, queue_counters_results)
+
+    def read_queue_stats(self, port, cnt_ids, queue_num=UNICAST_QUEUE_NUM):
+        """Read the counters of the first queue_num queues of the port, return a list of results per queue."""
+        return [self.client.sai_thrift_get_queue_stats(queue, cnt_ids, len(cnt_ids))
+                for queue in self.get_queue_oids(port)[:queue_num]]
+
+    def read_pg_stats(self, port, cnt_ids):
+        """Read the counters of all the PGs of the port, return a list of results per PG."""
+        return [self.client.sai_thrift_get_pg_stats(pg, cnt_ids, len(cnt_ids))
+                for pg in self.get_pg_oids(port)]
+
+
+_counter_readers = weakref.WeakKeyDictionary()
+
+
+def get_counter_reader(client):
+    """Get the SaiCounterReader of the client, which is created on first use."""
+    reader = _counter_readers.get(client)
+    if reader is None:
+        # The cached reader must not keep the client alive
+        reader = _counter_readers[client] = SaiCounterReader(weakref.proxy(client))
+    return reader
+
+
 def sai_thrift_clear_all_counters(client, target):
+    reader = get_counter_reader(client)
+    cnt_ids = [SAI_QUEUE_STAT_PACKETS]
     for port in sai_port_list[target]:
-        queue_list = []
         client.sai_thrift_clear_port_all_stats(port)
-        port_attr_list = client.sai_thrift_get_port_attribute(port)
-        attr_list = port_attr_list.attr_list
-        for attribute in attr_list:
-            if attribute.id == SAI_PORT_ATTR_QOS_QUEUE_LIST:
-                for queue_id in attribute.value.objlist.object_id_list:
-                    queue_list.append(queue_id)
-
-        cnt_ids = []
-        cnt_ids.append(SAI_QUEUE_STAT_PACKETS)
-        for queue in queue_list:
+        for queue in reader.get_queue_oids(port):
             client.sai_thrift_clear_queue_stats(queue, cnt_ids, len(cnt_ids))
 
 
@@ -773,52 +858,7 @@ def sai_thrift_port_tx_enable(client, asic_type, port_ids, target='dst'):
 
 
 def sai_thrift_read_port_counters(client, asic_type, port):
-    port_cnt_ids = []
-    port_cnt_ids.append(SAI_PORT_STAT_IF_OUT_DISCARDS)
-    port_cnt_ids.append(SAI_PORT_STAT_IF_IN_DISCARDS)
-    port_cnt_ids.append(SAI_PORT_STAT_PFC_0_TX_PKTS)
-    port_cnt_ids.append(SAI_PORT_STAT_PFC_1_TX_PKTS)
-    port_cnt_ids.append(SAI_PORT_STAT_PFC_2_TX_PKTS)
-    port_cnt_ids.append(SAI_PORT_STAT_PFC_3_TX_PKTS)
-    port_cnt_ids.append(SAI_PORT_STAT_PFC_4_TX_PKTS)
-    port_cnt_ids.append(SAI_PORT_STAT_PFC_5_TX_PKTS)
-    port_cnt_ids.append(SAI_PORT_STAT_PFC_6_TX_PKTS)
-    port_cnt_ids.append(SAI_PORT_STAT_PFC_7_TX_PKTS)
-    port_cnt_ids.append(SAI_PORT_STAT_IF_OUT_OCTETS)
-    port_cnt_ids.append(SAI_PORT_STAT_IF_OUT_UCAST_PKTS)
-    port_cnt_ids.append(SAI_PORT_STAT_IN_DROPPED_PKTS)
-    port_cnt_ids.append(SAI_PORT_STAT_OUT_DROPPED_PKTS)
-    port_cnt_ids.append(SAI_PORT_STAT_IF_IN_UCAST_PKTS)
-    port_cnt_ids.append(SAI_PORT_STAT_IF_IN_NON_UCAST_PKTS)
-    port_cnt_ids.append(SAI_PORT_STAT_IF_OUT_NON_UCAST_PKTS)
-    if asic_type != 'mellanox':
-        port_cnt_ids.append(SAI_PORT_STAT_IF_OUT_QLEN)
-
-    counters_results = []
-    counters_results = client.sai_thrift_get_port_stats(
-        port, port_cnt_ids, len(port_cnt_ids))
-    if asic_type == 'mellanox':
-        counters_results.append(0)
-
-    queue_list = []
-    port_attr_list = client.sai_thrift_get_port_attribute(port)
-    attr_list = port_attr_list.attr_list
-    for attribute in attr_list:
-        if attribute.id == SAI_PORT_ATTR_QOS_QUEUE_LIST:
-            for queue_id in attribute.value.objlist.object_id_list:
-                queue_list.append(queue_id)
-    cnt_ids = []
-    thrift_results = []
-    queue_counters_results = []
-    cnt_ids.append(SAI_QUEUE_STAT_PACKETS)
-    queue1 = 0
-    for queue in queue_list:
-        if queue1 <= 7:
-            thrift_results = client.sai_thrift_get_queue_stats(
-                queue, cnt_ids, len(cnt_ids))
-            queue_counters_results.append(thrift_results[0])
-            queue1 += 1
-    return (counters_results, queue_counters_results)
+    return get_counter_reader(client).read_port_counters(asic_type, port)
 
 
 def sai_thrift_read_port_watermarks(client, port):
@@ -829,34 +869,11 @@ def sai_thrift_read_port_watermarks(client, port):
     pg_wm_ids.append(SAI_INGRESS_PRIORITY_GROUP_STAT_XOFF_ROOM_WATERMARK_BYTES)
     pg_wm_ids.append(SAI_INGRESS_PRIORITY_GROUP_STAT_SHARED_WATERMARK_BYTES)
 
-    queue_list = []
-    pg_list = []
-    port_attr_list = client.sai_thrift_get_port_attribute(port)
-    attr_list = port_attr_list.attr_list
-    for attribute in attr_list:
-        if attribute.id == SAI_PORT_ATTR_QOS_QUEUE_LIST:
-            for queue_id in attribute.value.objlist.object_id_list:
-                queue_list.append(queue_id)
-        elif attribute.id == SAI_PORT_ATTR_INGRESS_PRIORITY_GROUP_LIST:
-            for pg_id in attribute.value.objlist.object_id_list:
-                pg_list.append(pg_id)
-
-    thrift_results = []
-    queue_res = []
-    pg_shared_res = []
-    pg_headroom_res = []
-
-    # Only use the first 8 queues (unicast) - multicast queues are not used
-    for queue in queue_list[:8]:
-        thrift_results = client.sai_thrift_get_queue_stats(
-            queue, q_wm_ids, len(q_wm_ids))
-        queue_res.append(thrift_results[0])
-
-    for pg in pg_list:
-        thrift_results = client.sai_thrift_get_pg_stats(
-            pg, pg_wm_ids, len(pg_wm_ids))
-        pg_headroom_res.append(thrift_results[0])
-        pg_shared_res.append(thrift_results[1])
+    reader = get_counter_reader(client)
+    queue_res = [thrift_results[0] for thrift_results in reader.read_queue_stats(port, q_wm_ids)]
+    pg_results = reader.read_pg_stats(port, pg_wm_ids)
+    pg_headroom_res = [thrift_results[0] for thrift_results in pg_results]
+    pg_shared_res = [thrift_results[1] for thrift_results in pg_results]
 
     return (queue_res, pg_shared_res, pg_headroom_res)
 
@@ -866,23 +883,8 @@ def sai_thrift_read_pg_counters(client, port_id):
         SAI_INGRESS_PRIORITY_GROUP_STAT_PACKETS
     ]
 
-    # fetch pg ids under port id
-    pg_ids = []
-    port_attrs = client.sai_thrift_get_port_attribute(port_id)
-    attrs = port_attrs.attr_list
-    for attr in attrs:
-        if attr.id == SAI_PORT_ATTR_INGRESS_PRIORITY_GROUP_LIST:
-            for pg_id in attr.value.objlist.object_id_list:
-                pg_ids.append(pg_id)
-
     # get counter values of counter ids of interest under each pg
-    pg_cntrs = []
-    for pg_id in pg_ids:
-        cntr_vals = client.sai_thrift_get_pg_stats(
-            pg_id, pg_cntr_ids, len(pg_cntr_ids))
-        pg_cntrs.append(cntr_vals[0])
-
-    return pg_cntrs
+    return [cntr_vals[0] for cntr_vals in get_counter_reader(client).read_pg_stats(port_id, pg_cntr_ids)]
 
 
 def sai_thrift_read_pg_drop_counters(client, port_id):
@@ -890,45 +892,15 @@ def sai_thrift_read_pg_drop_counters(client, port_id):
         SAI_INGRESS_PRIORITY_GROUP_STAT_DROPPED_PACKETS
     ]
 
-    # fetch pg ids under port id
-    pg_ids = []
-    port_attrs = client.sai_thrift_get_port_attribute(port_id)
-    attrs = port_attrs.attr_list
-    for attr in attrs:
-        if attr.id == SAI_PORT_ATTR_INGRESS_PRIORITY_GROUP_LIST:
-            for pg_id in attr.value.objlist.object_id_list:
-                pg_ids.append(pg_id)
-
     # get counter values of counter ids of interest under each pg
-    pg_cntrs = []
-    for pg_id in pg_ids:
-        cntr_vals = client.sai_thrift_get_pg_stats(
-            pg_id, pg_cntr_ids, len(pg_cntr_ids))
-        pg_cntrs.append(cntr_vals[0])
-
-    return pg_cntrs
+    return [cntr_vals[0] for cntr_vals in get_counter_reader(client).read_pg_stats(port_id, pg_cntr_ids)]
 
 
 def sai_thrift_read_pg_shared_watermark(client, asic_type, port_id):
     pg_cntr_ids = [SAI_INGRESS_PRIORITY_GROUP_STAT_SHARED_WATERMARK_BYTES]
 
-    # fetch pg ids under port id
-    pg_ids = []
-    port_attrs = client.sai_thrift_get_port_attribute(port_id)
-    attrs = port_attrs.attr_list
-    for attr in attrs:
-        if attr.id == SAI_PORT_ATTR_INGRESS_PRIORITY_GROUP_LIST:
-            for pg_id in attr.value.objlist.object_id_list:
-                pg_ids.append(pg_id)
-
     # get counter values of counter ids of interest under each pg
-    pg_cntrs = []
-    for pg_id in pg_ids:
-        cntr_vals = client.sai_thrift_get_pg_stats(
-            pg_id, pg_cntr_ids, len(pg_cntr_ids))
-        pg_cntrs.append(cntr_vals[0])
-
-    return pg_cntrs
+    return [cntr_vals[0] for cntr_vals in get_counter_reader(client).read_pg_stats(port_id, pg_cntr_ids)]
 
 
 def sai_thrift_read_buffer_pool_watermark(client, buffer_pool_id):
@@ -960,23 +932,9 @@ def sai_thrift_read_headroom_pool_watermark(client, buffer_pool_id):
 
 
 def sai_thrift_read_queue_occupancy(client, target, port_id):
-    queue_list = []
-    port_attr_list = client.sai_thrift_get_port_attribute(port_list[target][port_id])
-    attr_list = port_attr_list.attr_list
-    for attribute in attr_list:
-        if attribute.id == SAI_PORT_ATTR_QOS_QUEUE_LIST:
-            for queue_id in attribute.value.objlist.object_id_list:
-                queue_list.append(queue_id)
     cnt_ids = [SAI_QUEUE_STAT_CURR_OCCUPANCY_BYTES]
-    queue_counters_results = []
-    queue1 = 0
-    for queue in queue_list:
-        if queue1 <= 7:
-            thrift_results = client.sai_thrift_get_queue_stats(
-                queue, cnt_ids, len(cnt_ids))
-            queue_counters_results.append(thrift_results[0])
-            queue1 += 1
-    return queue_counters_results
+    return [thrift_results[0] for thrift_results in
+            get_counter_reader(client).read_queue_stats(port_list[target][port_id], cnt_ids)]
 
 
 def sai_thrift_create_vlan_member(client, vlan_id, port_id, tagging_mode):
@@ -0,0 +1,151 @@
+import glob
+import json
+import logging
+import os
+import re
+import time
+
+import pytest
+
+from tests.common.helpers.assertions import pytest_assert
+from tests.common.helpers.show_table import iter_show_table, parse_column_positions, parse_show_table
+
+pytestmark = [
+    pytest.mark.disable_loganalyzer,
+    pytest.mark.topology("any"),
+    pytest.mark.device_type("vs"),
+]
+
+logger = logging.getLogger(__name__)
+
+ITERATIONS = 100
+
+FILES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "files")
+# Recorded show command outputs, each with the expected parse result in the json file of the same name
+RECORDED_OUTPUT_FILES = sorted(glob.glob(os.path.join(FILES_DIR, "*.txt")))
+
+BENCHMARK_COMMANDS = [
+    "show interface status",
+    "show interfaces counters",
+    "show ip interfaces",
+    "show queue counters",
+]
+
+
+def _legacy_parse_show(output_lines, header_len=1):
+    """The parser used by show_and_parse before the column layout was cached, kept as reference."""
+    result = []
+    sep_line_pattern = re.compile(r"^( *-+ *)+$")
+    for idx, line in enumerate(output_lines):
+        if sep_line_pattern.match(line):
+            header_lines = output_lines[idx - header_len:idx]
+            content_lines = output_lines[idx + 1:]
+            break
+    else:
+        return result
+
+    positions = parse_column_positions(line)
+    headers = [" ".join([header_line[left:right].strip().lower() for header_line in header_lines]).strip()
+               for left, right in positions]
+    for content_line in content_lines:
+        if len(content_line) == 0:
+            break
+        result.append({headers[idx]: content_line[left:right].strip() for idx, (left, right) in enumerate(positions)})
+    return result
+
+
+@pytest.fixture(params=RECORDED_OUTPUT_FILES, ids=lambda path: os.path.basename(path)[:-len(".txt")])
+def recorded_output_file(request):
+    """Path of a recorded show command output and the expected parse result of it."""
+    with open(request.param[:-len(".txt")] + ".json") as f:
+        return request.param, json.load(f)
+
+
+def test_show_table_parser_recorded_output(recorded_output_file):
+    """The parser should return the expected result of a recorded output, as list, columns and stream."""
+    path, expected = recorded_output_file
+    with open(path) as f:
+        lines = f.read().splitlines()
+
+    pytest_assert(_legacy_parse_show(lines) == expected, "Legacy parser result of {} mismatch".format(path))
+    pytest_assert(parse_show_table(lines) == expected, "Parsed output of {} mismatch".format(path))
+    columns = parse_show_table(lines, as_columns=True)
+    pytest_assert(list(columns.keys()) == list(expected[0].keys()), "Columns of {} mismatch".format(path))
+    for header, values in columns.items():
+        pytest_assert(values == [row[header] for row in expected], "Column '{}' of {} mismatch".format(header, path))
+    with open(path) as f:
+        pytest_assert(list(iter_show_table(f)) == expected, "Streamed output of {} mismatch".format(path))
+
+
+def test_show_table_parser_fixed_output():
+    """Multi-line headers, empty cells, end of table and output without table."""
+    lines = [
+        "             Rx     Tx",
+        "Port      Drops  Drops",
+        "------  -------  -----",
+        "Eth0          0",
+        "Eth4      1,024      7",
+        "",
+        "Eth8          9      9",
+    ]
+    expected = [
+        {"port": "Eth0", "rx drops": "0", "tx drops": ""},
+        {"port": "Eth4", "rx drops": "1,024", "tx drops": "7"},
+    ]
+    pytest_assert(parse_show_table(lines, header_len=2) == expected, "Parsed multi-line header output mismatch")
+    pytest_assert(list(iter_show_table(lines, header_len=2)) == expected,
+                  "Streamed multi-line header output mismatch")
+    pytest_assert(parse_show_table(lines, header_len=2, as_columns=True) ==
+                  {"port": ["Eth0", "Eth4"], "rx drops": ["0", "1,024"], "tx drops": ["", "7"]},
+                  "Columns of multi-line header output mismatch")
+    pytest_assert(parse_show_table(["Port  Drops", "Eth0  0"]) == [], "Output without separation line parsed")
+    pytest_assert(parse_show_table(["Port  Drops"], as_columns=True) == {}, "Output without separation line parsed")
+    pytest_assert(parse_show_table(["Port", "----"], as_columns=True) == {"port": []}, "Empty table mismatch")
+
+
+@pytest.fixture(scope="module")
+def dut_show_outputs(duthosts, rand_one_dut_hostname):
+    duthost = duthosts[rand_one_dut_hostname]
+    outputs = {}
+    for cmd in BENCHMARK_COMMANDS:
+        res = duthost.shell(cmd, module_ignore_errors=True)
+        if res["rc"] == 0 and res["stdout_lines"]:
+            outputs[cmd] = res["stdout_lines"]
+    if not outputs:
+        pytest.skip("No show command output recorded")
+    return outputs
+
+
+def test_show_table_parser_result(dut_show_outputs):
+    """The parser should return the same result as the legacy parser, in all output shapes."""
+    for cmd, lines in dut_show_outputs.items():
+        expected = _legacy_parse_show(lines)
+        pytest_assert(parse_show_table(lines) == expected, "Parsed output of '{}' mismatch".format(cmd))
+        pytest_assert(list(iter_show_table(line + "\n" for line in lines)) == expected,
+                      "Streamed output of '{}' mismatch".format(cmd))
+        columns = parse_show_table(lines, as_columns=True)
+        for header, values in columns.items():
+            pytest_assert(values == [row[header] for row in expected],
+                          "Column '{}' of '{}' mismatch".format(header, cmd))
+
+
+def test_show_table_parser_benchmark(dut_show_outputs):
+    """Compare the time of parsing the recorded outputs by the legacy parser and by the cached layout parser."""
+    for cmd, lines in dut_show_outputs.items():
+        timings = []
+        for parse in (_legacy_parse_show, parse_show_table, lambda lines: parse_show_table(lines, as_columns=True)):
+            start = time.time()
+            for _ in range(ITERATIONS):
+                parse(lines)
+            timings.append((time.time() - start) / ITERATIONS * 1000)
+
+        logger.info("'{}' ({} lines): legacy {:.3f}ms, rows {:.3f}ms, columns {:.3f}ms per parse".format(
+            cmd, len(lines), *timings))
+
+
+def test_show_table_sep_line_detection():
+    """A line of dashes which is not a separation line should be rejected in linear time."""
+    near_miss = "-- " * 24 + "x"
+    start = time.time()
+    pytest_assert(parse_show_table(["header", near_miss, "content"]) == [], "Near miss line taken as separation line")
+    pytest_assert(time.time() - start < 1, "Separation line detection took {:.3f}s".format(time.time() - start))
@@ -0,0 +1,66 @@
+import logging
+import time
+
+import pytest
+
+from tests.common.devices.ssh_transport import SshTransport
+from tests.common.helpers.assertions import pytest_assert
+
+pytestmark = [
+    pytest.mark.disable_loganalyzer,
+    pytest.mark.topology("any"),
+    pytest.mark.device_type("vs"),
+]
+
+logger = logging.getLogger(__name__)
+
+ITERATIONS = 20
+
+BENCHMARK_COMMANDS = [
+    ("shell", "show version"),
+    ("shell", "docker ps --format '{{.Names}}' | sort"),
+    ("command", "cat /etc/sonic/sonic_version.yml"),
+    ("shell", "ls /nonexistent"),
+]
+
+
+@pytest.fixture
+def ssh_transport(duthosts, rand_one_dut_hostname):
+    transport = SshTransport.from_ansible_host(duthosts[rand_one_dut_hostname].sonichost)
+    yield transport
+    transport.close()
+
+
+def _run_ansible(duthost, module_name, cmd):
+    return getattr(duthost.sonichost.host, module_name)(cmd)[duthost.hostname]
+
+
+def test_ssh_fast_path_result(duthosts, rand_one_dut_hostname, ssh_transport):
+    """Results of the SSH fast path should be the same as the results of Ansible."""
+    duthost = duthosts[rand_one_dut_hostname]
+    for module_name, cmd in BENCHMARK_COMMANDS:
+        expected = _run_ansible(duthost, module_name, cmd)
+        res = ssh_transport.run(module_name, (cmd, ), {})
+        for key in ["rc", "stdout", "stdout_lines", "failed"]:
+            pytest_assert(res.get(key) == expected.get(key), "'{}' of '{}' mismatch, ssh: {}, ansible: {}".format(
+                key, cmd, res.get(key), expected.get(key)))
+        pytest_assert(res.is_failed == expected.is_failed, "is_failed of '{}' mismatch".format(cmd))
+
+
+def test_ssh_fast_path_benchmark(duthosts, rand_one_dut_hostname, ssh_transport):
+    """Compare the time of running shell/command by Ansible and by the SSH fast path."""
+    duthost = duthosts[rand_one_dut_hostname]
+    for module_name, cmd in BENCHMARK_COMMANDS:
+        start = time.time()
+        for _ in range(ITERATIONS):
+            _run_ansible(duthost, module_name, cmd)
+        ansible_time = (time.time() - start) / ITERATIONS
+
+        start = time.time()
+        for _ in range(ITERATIONS):
+            ssh_transport.run(module_name, (cmd, ), {})
+        ssh_time = (time.time() - start) / ITERATIONS
+
+        logger.info("{} '{}': ansible {:.3f}s, ssh fast path {:.3f}s per call, speedup {:.1f}x".format(
+            module_name, cmd, ansible_time, ssh_time, ansible_time / ssh_time if ssh_time else 0))
+        pytest_assert(ssh_time < ansible_time, "SSH fast path is slower than Ansible for '{}'".format(cmd))